@@ -0,0 +1,370 @@
+"""
+Zip archives for the archive and extract commands. zipfile needs a
+seekable file to write an archive, so archives are written here as a
+stream: every entry is followed by a data descriptor with its crc and
+sizes, and contents are read and compressed one chunk at a time.
+"""
+import datetime
+import errno
+import mimetypes
+import operator
+import os
+import struct
+import sys
+import tempfile
+import zipfile
+import zlib
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+from elfinder import bulk, metrics, pools, uploads
+from elfinder.models import Blob, FileNode, FolderNode, ImageJob, ImageNode, \
+    INode, atomic, listing_ids, parse_tree_path
+
+# limits of the archives created or extracted
+MAX_SIZE = getattr(settings, 'ELFINDER_ARCHIVE_MAX_SIZE', 1024 * 1024 * 1024)
+MAX_ENTRIES = getattr(settings, 'ELFINDER_ARCHIVE_MAX_ENTRIES', 10000)
+
+CHUNK_SIZE = 64 * 1024
+# without the zip64 extensions sizes and offsets have 32 bits
+ZIP_LIMIT = 0xffffffff
+
+FLAG_DATA_DESCRIPTOR = 0x08
+FLAG_UTF8 = 0x800
+# made by unix (3) with version 2.0, so that clients apply the permissions
+VERSION_MADE_BY = 0x0314
+
+
+def check_limits(entries, size, max_entries=None, max_size=None):
+    """
+    Raises an exception if an archive has too many entries or if its
+    contents are too big
+    """
+    max_entries = max_entries or MAX_ENTRIES
+    max_size = max_size or MAX_SIZE
+    if entries > max_entries:
+        raise Exception('The archive has more than %d entries' % max_entries)
+    if size > max_size:
+        raise Exception('The archive contents exceed %d bytes' % max_size)
+
+
+def _dos_datetime(mtime):
+    year = max(mtime.year, 1980)
+    return ((mtime.hour << 11) | (mtime.minute << 5) | (mtime.second // 2),
+            ((year - 1980) << 9) | (mtime.month << 5) | mtime.day)
+
+
+def iter_zip(entries, compress=True):
+    """
+    Yields the bytes of a zip archive of entries, an iterable of
+    (name, mtime, open) where name ends with '/' for folders and open is a
+    function returning the file object of the content, None for folders.
+    """
+    central, offset = [], 0
+    for name, mtime, opener in entries:
+        name = name.encode('utf-8')
+        method = 8 if compress and opener else 0
+        flags = FLAG_DATA_DESCRIPTOR | FLAG_UTF8
+        dos_time, dos_date = _dos_datetime(mtime)
+        header = struct.pack('<4s5H3L2H', 'PK\x03\x04', 20, flags, method,
+                             dos_time, dos_date, 0, 0, 0, len(name), 0)
+        yield header + name
+        crc, size, compressed_size = 0, 0, 0
+        if opener:
+            compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+            content = opener()
+            try:
+                while True:
+                    data = content.read(CHUNK_SIZE)
+                    if not data:
+                        break
+                    crc = zlib.crc32(data, crc)
+                    size += len(data)
+                    if method:
+                        data = compressor.compress(data)
+                    compressed_size += len(data)
+                    if data:
+                        yield data
+            finally:
+                content.close()
+            if method:
+                data = compressor.flush()
+                compressed_size += len(data)
+                yield data
+        crc &= 0xffffffff
+        yield struct.pack('<4s3L', 'PK\x07\x08', crc, compressed_size, size)
+        if size > ZIP_LIMIT or offset > ZIP_LIMIT:
+            raise Exception('The archive is bigger than 4GB')
+        # permissions for unix clients, the dos flag marks folders
+        attributes = (040755 << 16) | 0x10 if not opener else 0100644 << 16
+        central.append(struct.pack(
+            '<4s6H3L5H2L', 'PK\x01\x02', VERSION_MADE_BY, 20, flags, method,
+            dos_time, dos_date, crc, compressed_size, size, len(name), 0, 0,
+            0, 0, attributes, offset) + name)
+        offset += len(header) + len(name) + compressed_size + 16
+    directory = ''.join(central)
+    if len(central) > 0xffff:
+        raise Exception('The archive has more than 65535 entries')
+    yield directory + struct.pack('<4s4H2LH', 'PK\x05\x06', 0, 0,
+                                  len(central), len(central), len(directory),
+                                  offset, 0)
+
+
+def zip_entries(nodes, itypes):
+    """
+    Returns the entries of iter_zip for nodes and their subtrees, with one
+    query, and the size of their contents. Only the inodes whose type is in
+    itypes are included.
+    """
+    storage = FileNode._meta.get_field('data').storage
+    tops = set(node.pk for node in nodes)
+    rows = INode.objects.filter(reduce(operator.or_, [
+        Q(tree_path__startswith=node.tree_path) for node in nodes])).values(
+        'id', 'name', 'itype', 'tree_path', 'data_size', 'modified',
+        'filenode__data', 'filenode__data_mtime').order_by('tree_path')
+    names, entries, size = {}, [], 0
+    for row in rows.iterator():
+        names[row['id']] = row['name']
+        if row['itype'] not in itypes:
+            continue
+        path = parse_tree_path(row['tree_path'])
+        path = path[[pk in tops for pk in path].index(True):]
+        name = '/'.join(names[pk] for pk in path)
+        if row['itype'] == INode.TYPES.folder:
+            entries.append((name + '/', row['modified'], None))
+        else:
+            data = row['filenode__data']
+            entries.append((name, row['filenode__data_mtime'] or
+                            row['modified'],
+                            lambda data=data: storage.open(data, 'rb')))
+            size += row['data_size']
+    check_limits(len(entries), size)
+    return entries, size
+
+
+def _stage(content, max_size=None, name=None):
+    """
+    Copies content to a file of the staging area of the uploads, on the
+    filesystem of the storage, and returns its path and the bytes written.
+    Raises an exception, leaving nothing staged, if content is bigger than
+    max_size, i.e. an entry of an archive bigger than it declares.
+    """
+    try:
+        os.makedirs(uploads.STAGING_ROOT)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+    staged = tempfile.NamedTemporaryFile(dir=uploads.STAGING_ROOT,
+                                         delete=False)
+    size = 0
+    try:
+        for data in content:
+            size += len(data)
+            if max_size is not None and size > max_size:
+                raise Exception('%s is bigger than %d bytes' % (
+                    name or 'The content', max_size))
+            staged.write(data)
+    except:
+        staged.close()
+        os.remove(staged.name)
+        raise
+    staged.close()
+    return staged.name, size
+
+
+def stage_zip(entries):
+    """
+    Writes the archive of entries to the staging area, the zip is never
+    held in memory. Returns the path of the staged file.
+    """
+    return _stage(iter_zip(entries))[0]
+
+
+def _split_name(name):
+    if not isinstance(name, unicode):
+        try:
+            name = name.decode('utf-8')
+        except UnicodeDecodeError:
+            name = name.decode('cp437')
+    parts = [part for part in name.replace('\\', '/').split('/')
+             if part not in ('', '.')]
+    if '..' in parts:
+        raise Exception('Invalid name %s in the archive' % name)
+    return tuple(parts)
+
+
+def _read_entries(archive, folder=None):
+    """
+    Returns the folders and the (path, ZipInfo) of the files of archive,
+    paths are tuples of names under folder
+    """
+    infos = archive.infolist()
+    check_limits(len(infos), sum(info.file_size for info in infos))
+    prefix = (folder,) if folder else ()
+    folders, files = set([prefix]) if folder else set(), []
+    for info in infos:
+        path = prefix + _split_name(info.filename)
+        if path == prefix:
+            continue
+        if info.filename.endswith('/'):
+            folders.add(path)
+        else:
+            files.append((path, info))
+        folders.update(path[:i] for i in range(1, len(path)))
+    # the rows are inserted in bulk, without full_clean
+    name_field = INode._meta.get_field('name')
+    for name in set(name for path in folders for name in path).union(
+            path[-1] for path, _ in files):
+        try:
+            name_field.clean(name, None)
+        except ValidationError as e:
+            raise Exception('Invalid name %s in the archive: %s' % (
+                name, ' '.join(e.messages)))
+    if len(set(path for path, _ in files)) < len(files):
+        raise Exception('The archive contains the same file twice')
+    if folders.intersection(path for path, _ in files):
+        raise Exception('The archive contains a file and a folder with the '
+                        'same name')
+    return folders, files
+
+
+def _batches(files, size):
+    """
+    Splits files in batches stored at the same time. Storages look for an
+    available name before writing, so the names in a batch are different.
+    """
+    batch, names = [], set()
+    for path, info in files:
+        if len(batch) == size or path[-1] in names:
+            yield batch
+            batch, names = [], set()
+        batch.append((path, info))
+        names.add(path[-1])
+    if batch:
+        yield batch
+
+
+def _store(item):
+    """
+    Moves a staged entry to the storage of the contents of node, with the
+    name chosen by upload_to, run in the I/O pool
+    """
+    node, name, staged = item
+    field = FileNode._meta.get_field('data')
+    content = uploads.StagedFile(open(staged, 'rb'), node.name)
+    try:
+        node.data = field.storage.save(name, content)
+    finally:
+        content.close()
+        if os.path.exists(staged):
+            os.remove(staged)
+    return node
+
+
+def _insert_extracted(nodes, folders, tops, dst, owner, names):
+    """
+    Inserts the inodes extracted by extract_zip, with the references to
+    their stored contents names, and returns the top level ones
+    """
+    for path in folders:
+        nodes[path] = FolderNode(name=path[-1], owner=owner)
+    # aggregates of the new folders from the paths below them
+    for path, node in nodes.items():
+        for i in range(1, len(path)):
+            parent = nodes[path[:i]]
+            parent.total_bytes += node.size
+            parent.total_items += 1
+    with atomic():
+        parents = {(): dst}
+        for level in range(1, max(len(path) for path in nodes) + 1):
+            batch = [path for path in nodes if len(path) == level]
+            for path in batch:
+                nodes[path].parent_id = parents[path[:-1]].pk
+            bulk.insert_nodes([nodes[path] for path in batch],
+                              dict((parent.pk, parent)
+                                   for parent in parents.values()))
+            parents = dict((path, nodes[path]) for path in batch
+                           if path in folders)
+        Blob.objects.acquire(names)
+        ImageJob.objects.bulk_create([
+            ImageJob(image_id=node.pk, action=ImageJob.ACTIONS.thumbnail)
+            for node in nodes.values() if isinstance(node, ImageNode)])
+        added = [nodes[(name,)] for name in sorted(tops)]
+        total_bytes = sum(node.aggregates[0] for node in added)
+        total_items = sum(node.aggregates[1] for node in added)
+        FolderNode.objects.update_aggregates(dst.ancestor_ids + [dst.pk],
+                                             total_bytes, total_items)
+        FolderNode.objects.touch(set(pk for node in added
+                                     for pk in listing_ids(node.tree_path)))
+    return added
+
+
+def extract_zip(content, dst, owner, folder=None):
+    """
+    Extracts the zip archive in the file object content inside the folder
+    dst, or inside a new folder of dst named folder, and returns the top
+    level inodes created. Entries are decompressed one at a time to the
+    staging area, written to storage by the I/O pool a batch at a time and
+    inserted one tree level at a time.
+
+    The limits are checked on the sizes declared by the archive and again
+    on the bytes actually decompressed: an entry bigger than it declares
+    aborts the extraction. When the extraction fails the contents written
+    to storage are deleted, but not the ones already stored for other
+    files (see BlobManager.discard).
+    """
+    archive = zipfile.ZipFile(content)
+    field = FileNode._meta.get_field('data')
+    nodes, names, staged = {}, [], []
+    try:
+        try:
+            folders, files = _read_entries(archive, folder)
+            if not (folders or files):
+                raise Exception('The archive is empty')
+            tops = set(path[0] for path in folders).union(
+                path[0] for path, _ in files)
+            present = dst.children.filter(name__in=tops).values_list(
+                'name', flat=True)
+            if present:
+                raise Exception('%s is already present in %s' % (
+                    ', '.join(present), dst.name))
+            total_size = 0
+            for batch in _batches(files, max(pools.IO_THREADS, 1) * 2):
+                staged = []
+                for path, info in batch:
+                    entry = archive.open(info)
+                    try:
+                        path_staged, size = _stage(
+                            iter(lambda: entry.read(CHUNK_SIZE), ''),
+                            max_size=info.file_size, name='/'.join(path))
+                    finally:
+                        entry.close()
+                    total_size += size
+                    check_limits(len(nodes) + 1, total_size)
+                    mime = mimetypes.guess_type(path[-1])[0]
+                    node = INode.MIMETYPES.get(mime, FileNode)(
+                        name=path[-1], owner=owner, mime=mime,
+                        data_size=size,
+                        data_mtime=datetime.datetime(*info.date_time))
+                    staged.append((node, path_staged))
+                    nodes[path] = node
+                # upload_to creates the folders of the names, it runs here
+                # so that the threads never create the same folder
+                items = [(node, field.generate_filename(node, node.name),
+                          path_staged) for node, path_staged in staged]
+                for node in pools.io_map(_store, items):
+                    metrics.add_bytes(written=node.data_size)
+                    names.append(node.data.name)
+                staged = []
+        finally:
+            archive.close()
+        return _insert_extracted(nodes, folders, tops, dst, owner, names)
+    except:
+        exc_info = sys.exc_info()
+        for _, path_staged in staged:
+            if os.path.exists(path_staged):
+                os.remove(path_staged)
+        Blob.objects.discard(names, field.storage)
+        raise exc_info[0], exc_info[1], exc_info[2]
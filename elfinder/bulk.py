@@ -0,0 +1,303 @@
+"""
+Set based operations on inode subtrees. Inodes are inserted one tree level
+at a time with a fixed number of queries for each batch of nodes, whatever
+the number of nodes.
+"""
+import operator
+
+from django.db import models, transaction
+from django.db.models import Q
+
+from elfinder import utils as elutils
+from elfinder.models import Blob, FileNode, FolderNode, ImageJob, \
+    ImageNode, INode, NameTrigram, atomic, commit_on_success, db_alias, \
+    get_connection, listing_ids, parse_tree_path
+
+# number of nodes inserted or read with each query
+BATCH_SIZE = 500
+
+
+def _concrete_chain(cls):
+    """
+    Returns the INode subclasses from the child of INode down to cls
+    """
+    chain = []
+    while cls is not INode:
+        chain.insert(0, cls)
+        cls = cls._meta.parents.keys()[0]
+    return chain
+
+
+def _insert_local_fields(model, nodes):
+    """
+    Inserts the rows of model, a subclass of INode, for nodes. Django can't
+    bulk create models with multi-table inheritance, so this is done here.
+    """
+    connection = get_connection()
+    qn = connection.ops.quote_name
+    fields = model._meta.local_fields
+    connection.cursor().executemany(
+        'INSERT INTO %s (%s) VALUES (%s)' % (
+            qn(model._meta.db_table),
+            ', '.join(qn(f.column) for f in fields),
+            ', '.join(['%s'] * len(fields))),
+        [[f.get_db_prep_save(f.pre_save(node, True), connection=connection)
+          for f in fields] for node in nodes])
+
+
+def insert_nodes(nodes, parents):
+    """
+    Inserts nodes, unsaved instances of INode subclasses in the same tree
+    level whose parent_id is set. parents maps the pk of every parent to the
+    parent itself. Primary key, tree_path and level of nodes are updated.
+    """
+    for batch in elutils.chunked(nodes, BATCH_SIZE):
+        base_fields = [f for f in INode._meta.local_fields if f.name != 'id']
+        bases = []
+        for node in batch:
+            base = INode()
+            for f in base_fields:
+                setattr(base, f.attname, getattr(node, f.attname))
+            # rows without path are the ones inserted here
+            base.tree_path = ''
+            bases.append(base)
+        INode.objects.bulk_create(bases)
+        parent_pks = set(node.parent_id for node in batch)
+        pks = dict(((parent_id, name), pk) for pk, parent_id, name in
+                   INode.objects.filter(parent__in=parent_pks, tree_path='')
+                   .values_list('pk', 'parent', 'name'))
+        paths = []
+        for node in batch:
+            node.id = pks[(node.parent_id, node.name)]
+            parent = parents[node.parent_id]
+            node.tree_path = '%s%s/' % (parent.tree_path, node.id)
+            node.level = parent.level + 1
+            node._tree_parent_id = node.parent_id
+            node._indexed_name = node.name
+            paths.append((node.tree_path, node.level, node.id))
+        connection = get_connection()
+        qn = connection.ops.quote_name
+        connection.cursor().executemany(
+            'UPDATE %s SET %s = %%s, %s = %%s WHERE %s = %%s' % (
+                qn(INode._meta.db_table), qn('tree_path'), qn('level'),
+                qn('id')), paths)
+        by_model = {}
+        for node in batch:
+            for model in _concrete_chain(node.__class__):
+                setattr(node, model._meta.pk.attname, node.id)
+                by_model.setdefault(model, []).append(node)
+        # parent tables first, the order of _concrete_chain
+        for model in sorted(by_model, key=lambda m: len(_concrete_chain(m))):
+            _insert_local_fields(model, by_model[model])
+        NameTrigram.objects.bulk_create([
+            NameTrigram(inode_id=node.id, trigram=trigram)
+            for node in batch for trigram in elutils.get_trigrams(node.name)
+        ])
+    transaction.commit_unless_managed(using=db_alias())
+    return nodes
+
+
+def _leaf_nodes(nodes):
+    """
+    Returns nodes with the files that are images cast to ImageNode, with a
+    query for every BATCH_SIZE files. select_subclasses resolves only one
+    level of subclasses, images come as FileNode.
+    """
+    files = [node.pk for node in nodes if type(node) is FileNode]
+    images = {}
+    for batch in elutils.chunked(files, BATCH_SIZE):
+        images.update((image.pk, image) for image in
+                      ImageNode.objects.filter(pk__in=batch))
+    return [images.get(node.pk, node) for node in nodes]
+
+
+def _copy_node(node, parent_id):
+    """
+    Returns an unsaved copy of node with parent_id as parent
+    """
+    copy = node.__class__()
+    for f in node._meta.fields:
+        if f.primary_key or f.name in ('tree_path', 'level'):
+            continue
+        setattr(copy, f.attname, getattr(node, f.attname))
+    copy.parent_id = parent_id
+    return copy
+
+
+def _tops(nodes):
+    """
+    Returns nodes without the ones inside another of them (and without
+    repetitions), as they are already covered by its subtree
+    """
+    tops = []
+    for node in sorted(nodes, key=lambda node: node.tree_path):
+        if not tops or not node.tree_path.startswith(tops[-1].tree_path):
+            tops.append(node)
+    return tops
+
+
+@commit_on_success
+def copy_nodes(nodes, dst):
+    """
+    Copies nodes with all their subtrees inside the folder dst and returns
+    the copies of the top nodes (see _tops). Copied files share the content
+    of the originals.
+    """
+    nodes = _leaf_nodes(_tops(nodes))
+    copies = insert_nodes([_copy_node(node, dst.pk) for node in nodes],
+                          {dst.pk: dst})
+    # maps the folders copied at the last level to their copies
+    folders = dict((node.pk, copy) for node, copy in zip(nodes, copies)
+                   if node.itype == INode.TYPES.folder)
+    data_names = [node.data.name for node in nodes
+                  if isinstance(node, FileNode)]
+    while folders:
+        next_folders = {}
+        for batch in elutils.chunked(folders.keys(), BATCH_SIZE):
+            children = _leaf_nodes(INode.objects.filter(
+                parent__in=batch).select_subclasses())
+            children_copies = insert_nodes(
+                [_copy_node(child, folders[child.parent_id].pk)
+                 for child in children],
+                dict((folders[pk].pk, folders[pk]) for pk in batch))
+            for child, copy in zip(children, children_copies):
+                if child.itype == INode.TYPES.folder:
+                    next_folders[child.pk] = copy
+                elif isinstance(child, FileNode):
+                    data_names.append(child.data.name)
+        folders = next_folders
+    Blob.objects.acquire(data_names, untracked_refs=1)
+    total_bytes = sum(copy.aggregates[0] for copy in copies)
+    total_items = sum(copy.aggregates[1] for copy in copies)
+    FolderNode.objects.update_aggregates(dst.ancestor_ids + [dst.pk],
+                                         total_bytes, total_items)
+    FolderNode.objects.touch(set(pk for copy in copies
+                                 for pk in listing_ids(copy.tree_path)))
+    return copies
+
+
+def _by_parent(nodes):
+    """
+    Groups nodes by the materialized path of their parent
+    """
+    groups = {}
+    for node in nodes:
+        parent_path = node.tree_path[:node.tree_path.rstrip('/').rfind('/')
+                                     + 1]
+        groups.setdefault(parent_path, []).append(node)
+    return groups
+
+
+def _sum_aggregates(nodes):
+    aggregates = [node.aggregates for node in nodes]
+    return (sum(total_bytes for total_bytes, _ in aggregates),
+            sum(total_items for _, total_items in aggregates))
+
+
+@commit_on_success
+def move_nodes(nodes, dst):
+    """
+    Moves nodes inside the folder dst, re-parenting them with one UPDATE,
+    and returns the top nodes moved (see _tops). Paths and aggregates are
+    updated with a few queries for every group of nodes with the same
+    parent.
+    """
+    # nodes inside another moved node move with it
+    nodes = _tops(nodes)
+    for batch in elutils.chunked([node.pk for node in nodes], BATCH_SIZE):
+        INode.objects.filter(pk__in=batch).update(parent=dst.pk)
+    new_ancestors = set(dst.ancestor_ids + [dst.pk])
+    touched = set()
+    for parent_path, group in _by_parent(nodes).items():
+        old_ancestors = set(parse_tree_path(parent_path))
+        level_delta = dst.level + 1 - group[0].level
+        for batch in elutils.chunked(group, 100):
+            INode.objects.move_subtrees([node.tree_path for node in batch],
+                                        parent_path, dst.tree_path,
+                                        level_delta)
+        total_bytes, total_items = _sum_aggregates(group)
+        FolderNode.objects.update_aggregates(
+            old_ancestors - new_ancestors, -total_bytes, -total_items)
+        FolderNode.objects.update_aggregates(
+            new_ancestors - old_ancestors, total_bytes, total_items)
+        for node in group:
+            touched.update(listing_ids(node.tree_path))
+            node.parent = dst
+            node.tree_path = '%s%s/' % (dst.tree_path, node.pk)
+            node.level = dst.level + 1
+            node._tree_parent_id = dst.pk
+            touched.update(listing_ids(node.tree_path))
+    FolderNode.objects.touch(touched)
+    return nodes
+
+
+@commit_on_success
+def delete_nodes(nodes):
+    """
+    Marks nodes and their subtrees as deleted, without loading the
+    descendants. The removed nodes are detached from their parents, so
+    that their names can be used again, and their aggregates are
+    subtracted from the ancestors right away.
+    """
+    # nodes inside another removed node are already covered by it
+    tops = _tops(nodes)
+    for batch in elutils.chunked(tops, 100):
+        INode.objects.filter(reduce(operator.or_, [
+            Q(tree_path__startswith=node.tree_path) for node in batch
+        ])).update(deleted=True)
+        INode.all_objects.filter(pk__in=[node.pk for node in batch]).update(
+            parent=None)
+    touched = set()
+    for parent_path, group in _by_parent(tops).items():
+        ancestors = parse_tree_path(parent_path)
+        total_bytes, total_items = _sum_aggregates(group)
+        FolderNode.objects.update_aggregates(ancestors, -total_bytes,
+                                             -total_items)
+        touched.update(pk for node in group
+                       for pk in listing_ids(node.tree_path))
+    FolderNode.objects.touch(touched)
+    return tops
+
+
+def _delete_rows(model, column, pks):
+    connection = get_connection()
+    qn = connection.ops.quote_name
+    connection.cursor().execute('DELETE FROM %s WHERE %s IN (%s)' % (
+        qn(model._meta.db_table), qn(column), ', '.join(['%s'] * len(pks))),
+        pks)
+
+
+def purge_deleted(batch_size=BATCH_SIZE):
+    """
+    Removes the rows of the deleted inodes, deepest first and batch_size at
+    a time, each batch in its own transaction. The contents not referenced
+    anymore are deleted from storage. Returns the number of purged inodes.
+    """
+    storage = FileNode._meta.get_field('data').storage
+    # subclass tables first, the deepest subclasses before their parents
+    subclasses = sorted([model for model in models.get_models()
+                         if issubclass(model, INode) and model is not INode],
+                        key=lambda model: -len(_concrete_chain(model)))
+    count = 0
+    while True:
+        with atomic():
+            pks = list(INode.all_objects.filter(deleted=True).order_by(
+                '-level').values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                break
+            data_names = [name for name in FileNode.objects.filter(
+                pk__in=pks).values_list('data', flat=True) if name]
+            # the folders still in the tree that listed the purged inodes
+            parents = set(INode.all_objects.filter(pk__in=pks).values_list(
+                'parent', flat=True))
+            _delete_rows(ImageJob, ImageJob._meta.get_field('image').column,
+                         pks)
+            _delete_rows(NameTrigram,
+                         NameTrigram._meta.get_field('inode').column, pks)
+            for model in subclasses:
+                _delete_rows(model, model._meta.pk.column, pks)
+            _delete_rows(INode, INode._meta.pk.column, pks)
+            Blob.objects.release(data_names, storage)
+            FolderNode.objects.touch(parents - set(pks + [None]))
+        count += len(pks)
+    return count
@@ -0,0 +1,144 @@
+"""
+Delivery of file contents for the 'file' command, with conditional GET,
+byte ranges and the optional hand off to the web server.
+"""
+import os
+import re
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import http_date, parse_http_date_safe
+
+from elfinder import metrics
+
+try:
+    from django.http import StreamingHttpResponse
+except ImportError:
+    # before Django 1.5 HttpResponse streams iterators itself
+    StreamingHttpResponse = HttpResponse
+
+CHUNK_SIZE = 64 * 1024
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+MODES = ('stream', 'x-sendfile', 'x-accel-redirect')
+
+
+def check_mode(mode, sendfile_root=None, modes=MODES):
+    """
+    Raises ImproperlyConfigured if mode is not one of modes or if
+    'x-accel-redirect' has no sendfile_root, called by the drivers when
+    they are created
+    """
+    if mode not in modes:
+        raise ImproperlyConfigured('Invalid file delivery %r, use one of %s'
+                                   % (mode, ', '.join(modes)))
+    if mode == 'x-accel-redirect' and not sendfile_root:
+        raise ImproperlyConfigured('The x-accel-redirect file delivery '
+                                   'needs a sendfile_root')
+
+
+def parse_range(header, size):
+    """
+    Returns the (first, last) bytes of a single 'bytes=' range, or None
+    when the header must be ignored. Raises ValueError when the range
+    cannot be satisfied.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        # suffix range, the last bytes of the file
+        first, last = max(size - int(last), 0), size - 1
+        if size == 0 or first > last:
+            raise ValueError('unsatisfiable range %s' % header)
+        return first, last
+    first = int(first)
+    last = min(int(last), size - 1) if last else size - 1
+    if first > last:
+        raise ValueError('unsatisfiable range %s' % header)
+    return first, last
+
+
+def read_chunks(fileobj, first, length, chunk_size=CHUNK_SIZE):
+    """
+    Yields length bytes of fileobj starting from first, chunk by chunk
+    """
+    try:
+        fileobj.seek(first)
+        while length > 0:
+            chunk = fileobj.read(min(chunk_size, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        fileobj.close()
+
+
+def not_modified(request, etag, mtime):
+    """
+    True if the copy of the client, described by the conditional headers
+    of the request, is still valid
+    """
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        etags = [tag.strip() for tag in if_none_match.split(',')]
+        return etag in etags or '*' in etags
+    if_modified_since = parse_http_date_safe(
+        request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    return bool(if_modified_since and int(mtime) <= if_modified_since)
+
+
+def serve_file(request, data, name, mime, size, mtime, mode='stream',
+               sendfile_root=None, attachment=False, media_root=None):
+    """
+    Returns the response delivering the content of data, a FieldFile.
+    mode is 'stream' to send it from this process or 'x-sendfile' and
+    'x-accel-redirect' to leave it to the web server: in the last case
+    sendfile_root is the internal location mapped on media_root (by
+    default MEDIA_ROOT).
+    """
+    check_mode(mode, sendfile_root)
+    mtime = time.mktime(mtime.timetuple())
+    etag = '"%x-%x"' % (int(mtime), size)
+    if not_modified(request, etag, mtime):
+        response = HttpResponseNotModified()
+    elif mode == 'x-sendfile':
+        response = HttpResponse(content_type=mime)
+        response['X-Sendfile'] = data.path
+    elif mode == 'x-accel-redirect':
+        response = HttpResponse(content_type=mime)
+        response['X-Accel-Redirect'] = '%s/%s' % (
+            sendfile_root.rstrip('/'),
+            os.path.relpath(data.path, media_root or settings.MEDIA_ROOT))
+    else:
+        byte_range = None
+        if_range = request.META.get('HTTP_IF_RANGE')
+        if 'HTTP_RANGE' in request.META and if_range in (None, etag):
+            try:
+                byte_range = parse_range(request.META['HTTP_RANGE'], size)
+            except ValueError:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = 'bytes */%d' % size
+                return response
+        first, last = byte_range or (0, size - 1)
+        response = StreamingHttpResponse(
+            read_chunks(data.storage.open(data.name, 'rb'), first,
+                        last - first + 1), content_type=mime)
+        if byte_range:
+            response.status_code = 206
+            response['Content-Range'] = 'bytes %d-%d/%d' % (first, last,
+                                                             size)
+        response['Content-Length'] = str(last - first + 1)
+        metrics.add_bytes(read=last - first + 1)
+        response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(mtime)
+    # the content depends on the permissions of the user
+    response['Cache-Control'] = 'private'
+    if attachment and response.status_code != 304:
+        response['Content-Disposition'] = 'attachment; filename="%s"' % (
+            name.replace('"', '').encode('utf-8'))
+    return response
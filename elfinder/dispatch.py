@@ -0,0 +1,64 @@
+"""
+Binding of the connector parameters to the driver methods. The signature of
+every command is inspected once, when the site is created, and the values
+of the request are validated and converted with the driver param_types.
+"""
+import inspect
+
+
+def to_bool(value):
+    if isinstance(value, bool):
+        return value
+    return unicode(value).lower() in ('1', 'true', 'yes', 'on')
+
+
+def to_list(value):
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return [value]
+
+
+def to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError('%r is not an integer' % (value,))
+
+
+class CommandBinder(object):
+    """
+    Calls the driver method of cmd with the parameters it accepts, taken
+    from the request data and converted with param_types
+    """
+
+    def __init__(self, driver, cmd, param_types=None):
+        self.cmd = cmd
+        self.func = getattr(driver, driver.commands[cmd])
+        args, _, _, defaults = inspect.getargspec(self.func)
+        if args and args[0] == 'self':
+            args = args[1:]
+        # arguments without default value
+        mandatory = len(args) - len(defaults or [])
+        self.params = [(arg, i < mandatory, (param_types or {}).get(arg))
+                       for i, arg in enumerate(args)]
+
+    def bind(self, data):
+        params = {}
+        for arg, mandatory, coerce in self.params:
+            value = data.get(arg)
+            # empty values are like missing ones, the default is used
+            if value:
+                if coerce is not None:
+                    try:
+                        value = coerce(value)
+                    except ValueError, e:
+                        raise Exception('invalid argument %s in command %s: '
+                                        '%s' % (arg, self.cmd, e))
+                params[arg] = value
+            elif mandatory:
+                raise Exception('mandatory argument %s missing in command %s'
+                                % (arg, self.cmd))
+        return params
+
+    def __call__(self, data):
+        return self.func(**self.bind(data))
@@ -1,9 +1,12 @@
+import itertools
 import mimetypes
+import os
+import simplejson as json
 from django.core.exceptions import PermissionDenied
 from django.http import HttpResponseRedirect
-from elfinder import models, utils as elutils
-
-import logging
+from elfinder import archives, bulk, delivery, imaging, metrics, models, \
+    pagination, serializers, uploads, utils as elutils
+from elfinder.dispatch import to_bool, to_int, to_list
 
 class BaseDriver(object):
     commands = []  # list containing all available commands
@@ -120,8 +123,8 @@ class BaseDriver(object):
 
 
 class FinderDriver(BaseDriver):
-    # this dict contain the relation between the command requested from elfinder
-    # and the function of the driver that perform the command
+    # this dict contain the relation between the command requested from
+    # elfinder and the function of the driver that perform the command
     commands = {
         'open'   : 'open',
         'tree'   : 'tree',
@@ -135,13 +138,65 @@ class FinderDriver(BaseDriver):
         'size'   : 'size',
         'file'   : 'file',
         'search' : 'search',
+        'archive': 'archive',
+        'extract': 'extract',
+        'resize' : 'resize',
+    }
+    # mimetypes of the archives advertised to the client
+    archivers = {
+        'create' : ['application/zip'],
+        'extract': ['application/zip'],
+    }
+    # conversion of the request parameters passed to the commands
+    param_types = {
+        'targets' : to_list,
+        'cut'     : to_bool,
+        'tree'    : to_bool,
+        'download': to_bool,
+        'makedir' : to_bool,
+        'limit'   : to_int,
+        'offset'  : to_int,
+        'width'   : to_int,
+        'height'  : to_int,
+        'x'       : to_int,
+        'y'       : to_int,
+        'degree'  : to_int,
+        'quality' : to_int,
     }
 
     def __init__(self, inode_model = models.INode,
-                 folder_model=models.FolderNode, file_model=models.FileNode):
+                 folder_model=models.FolderNode, file_model=models.FileNode,
+                 lazy=True, tree_depth=1, search_limit=100,
+                 file_delivery='redirect', sendfile_root=None,
+                 streaming=False, page_size=None):
         self.inode_model = inode_model
         self.folder_model = folder_model
         self.file_model = file_model
+        # lazy drivers return only the first levels under the target, as
+        # the elFinder 2 protocol expects, instead of the whole subtree
+        self.lazy = lazy
+        self.tree_depth = tree_depth
+        self.search_limit = search_limit
+        # 'redirect' to MEDIA_URL, or one of delivery.MODES to send files
+        # through the connector
+        delivery.check_mode(file_delivery, sendfile_root,
+                            ('redirect',) + delivery.MODES)
+        self.file_delivery = file_delivery
+        self.sendfile_root = sendfile_root
+        # open and list return the files as iterators, that the connector
+        # encodes while they are read from the database
+        self.streaming = streaming
+        # open and list of lazy drivers return at most page_size inodes of
+        # the folder and a cursor to read the next page, see
+        # elfinder.pagination. Without page_size only the requests with a
+        # limit are paginated.
+        self.page_size = page_size
+
+    def _depth(self, depth=1):
+        """
+        Depth of the trees returned to the client, None means all the subtree
+        """
+        return depth if self.lazy else None
 
     def _get_inode(self, target_hash):
         """
@@ -149,116 +204,229 @@ class FinderDriver(BaseDriver):
         """
         return self.inode_model.objects.get_hash(target_hash)
 
-    def _append_info_if(self, vector, item, root, user, perm='read'):
-        """
-        Append inode informations if perm is available for the user
-        """            
-        if item.has_perm(perm, user):
-            info = item.info(user)
-            if item == root:
-                info['phash'] = ''
-            vector.append(info)
-            return True
-        return False
-
-    def _extend_info_if(self, vector, items, root, user, perm='read'):
-        for item in items:
-            self._append_info_if(vector, item, user, perm)
-        return vector
-
-    def _children_tree(self, root, node, user=None):
-        """
-        Returns the tree starting from root INode object according to
-        user permission
-        """
-        # create the vector of first-level children
-        curr_node = node
-        children, data = [], []
-        i = 0
-        while True:
-            for item in curr_node.children.select_subclasses():
-                if self._append_info_if(data, item, root, user):
-                    children.append(item)
-            if i >= len(data):
-                break
-            curr_node = children[i]
-            i += 1
-        logging.error('children %s' % children)
-        return data
+    def _get_inodes(self, target_hashes):
+        """
+        Return the inodes cast to subclasses, in a fixed number of queries
+        """
+        return self.inode_model.objects.get_hashes(target_hashes)
+
+    def _iter_children_tree(self, root, node, user=None, depth=None,
+                            folders_only=False):
+        """
+        Yields the informations of the inodes under node readable by user,
+        down to depth levels (None means the whole subtree), while they are
+        read from the database cursor
+        """
+        if depth == 0:
+            return
+        if depth == 1:
+            items = node.children.all()
+        else:
+            items = node.get_descendants()
+            if depth:
+                items = items.filter(level__lte=node.level + depth)
+        if folders_only:
+            items = items.filter(itype=self.inode_model.TYPES.folder)
+        # a node is returned only if its parent has been returned too
+        visible = set([node.pk])
+        for info in serializers.iter_infos(items.order_by('level', 'name'),
+                                           user, root):
+            if info['read'] and info['phash'] in visible:
+                visible.add(info['hash'])
+                yield info
 
     def _ancestors_tree(self, root, node, siblings=False,
                         include_self=False, user=None):
         """
         Returns the tree from root to node INode object according to user
-        permissions. Append siblings and self if required with paramenters
+        permissions. Append self and the subfolders of every ancestor
+        (siblings) if required with paramenters
         """
         if not node:
             return []
-        data = []
-        curr_node = node if include_self else node.parent
-        while curr_node:
-            self._append_info_if(data, curr_node, root, user)
-            if curr_node == root:
-                break
-            curr_node = curr_node.parent
-        logging.error('root: %s, ancestors: %s' % (root, data))
-        if siblings and node.parent:
-            self._extend_info_if(data,
-                node.parent.children.select_subclasses(), root, user)
-        logging.error('with siblings: %s' % data)
-        return data
-    
-    def _tree(self, root, target, user=None, tree=None):
-        curr_node = self._get_inode(target)
-        root_node = self._get_inode(root)
-        data = self._children_tree(root_node, curr_node, user)
+        # the position in the materialized path is the level
+        ancestors = models.parse_tree_path(node.tree_path)[root.level:]
+        if not include_self:
+            ancestors = ancestors[:-1]
+        # from the node up to the root
+        querysets = [self.inode_model.objects.filter(
+            pk__in=ancestors).order_by('-level')]
+        if siblings and node.parent_id:
+            path = [pk for pk in ancestors if pk != node.pk]
+            querysets.append(self.inode_model.objects.filter(
+                parent__in=path, itype=self.inode_model.TYPES.folder).exclude(
+                pk__in=path + [node.pk]))
+        return [info for queryset in querysets
+                for info in serializers.iter_infos(queryset, user, root)
+                if info['read']]
+
+    def _tree(self, root, target, user=None, tree=None, depth=None,
+              folders_only=False, stream=False):
+        """
+        Returns the children of target down to depth and, if tree is True,
+        its ancestors with their subfolders. With stream the children are
+        returned as an iterator, see FinderDriver.streaming.
+        """
+        # no subclass is needed to walk the tree
+        curr_node = self.inode_model.objects.get(pk=target)
+        root_node = self.inode_model.objects.get(pk=root)
+        data = self._iter_children_tree(root_node, curr_node, user, depth,
+                                        folders_only)
+        if not stream:
+            data = list(data)
         # if tree == True data must contain also all ancestors and siblings of
         # the target
         if tree:
-            data.extend(
-                self._ancestors_tree(root_node, curr_node, siblings=True,
-                                     include_self=True, user=user)
-            )
+            ancestors = self._ancestors_tree(root_node, curr_node,
+                                             siblings=True,
+                                             include_self=True, user=user)
+            if stream:
+                data = itertools.chain(data, ancestors)
+            else:
+                data.extend(ancestors)
         return data
 
+    def _page_limit(self, limit=None):
+        """
+        Size of the page of a listing, None if the listing is not paginated.
+        Listings of whole subtrees are never paginated.
+        """
+        if limit is not None and limit < 1:
+            raise Exception('Invalid limit %s' % limit)
+        if self._depth() != 1:
+            return None
+        if self.page_size:
+            return min(limit or self.page_size, self.page_size)
+        return limit
+
+    def _page(self, target, limit, user=None, sort=None, cursor=None):
+        """
+        Returns the informations of a page of the children of target and
+        the cursor of the next page, '' after the last one
+        """
+        rows, cursor = pagination.page(
+            self.inode_model.objects.filter(parent=target), limit, sort,
+            cursor)
+        return [info for info in serializers.iter_infos(rows, user)
+                if info['read']], cursor or ''
+
     def _get_cwd(self, root, target, user=None):
-        node = self._get_inode(target)
-        cwd = node.info(user)
-        if target == root:
-            cwd['phash'] = ''
-        return cwd
+        for cwd in serializers.iter_infos(
+                self.inode_model.objects.filter(pk=target), user):
+            if target == root:
+                cwd['phash'] = ''
+            return cwd
+        raise self.inode_model.DoesNotExist('INode %s does not exist' %
+                                            target)
+
+    def info(self, target, user=None, root=None):
+        """
+        Returns the informations of target, as the cwd of open
+        """
+        return self._get_cwd(root or target, target, user)
+
+    def _get_infos(self, inodes, user=None):
+        """
+        Informations of inodes, read again with a query for every 500
+        """
+        infos = []
+        for batch in elutils.chunked([inode.pk for inode in inodes], 500):
+            infos.extend(serializers.iter_infos(
+                self.inode_model.objects.filter(pk__in=batch), user))
+        return infos
         
 
     def parents(self, root, target, user=None):
-        tree = self._tree(root, target, tree=True, user=user)
+        tree = self._tree(root, target, tree=True, user=user,
+                          depth=self._depth(0))
         return {
             'parents': tree
         }
     
     def tree(self, root, target, user=None):
-        tree = self._tree(root, target, user=user)
+        tree = self._tree(root, target, user=user, folders_only=self.lazy,
+                          depth=self._depth(self.tree_depth))
         return {
             'tree': tree
         }
 
+    def versions(self, root, target=None, cmd=None, tree=None):
+        """
+        Versions of the folders whose changes show in the response of cmd
+        for target, or root: open, tree and parents return the same
+        response until one of them changes (see models.listing_ids). They
+        are target and the folders listed below it and, for parents and
+        open with tree, the folders from the top of the tree down to
+        target. Without cmd only target is included. None if target is
+        not a folder or if the response lists whole subtrees.
+        """
+        depth = {
+            'open'   : self._depth(),
+            'tree'   : self._depth(self.tree_depth),
+            'parents': self._depth(0),
+        }.get(cmd, 0)
+        if depth is None:
+            return None
+        nodes = self.folder_model.objects.filter(
+            pk=target or root).values_list('tree_path', 'level')
+        if not nodes:
+            return None
+        tree_path, level = nodes[0]
+        # the folders whose children are in the response
+        folders = self.folder_model.objects.filter(
+            tree_path__startswith=tree_path, level__lt=level + max(depth, 1))
+        if cmd == 'parents' or (cmd == 'open' and tree):
+            folders = folders | self.folder_model.objects.filter(
+                pk__in=models.parse_tree_path(tree_path))
+        return list(folders.order_by('level', 'pk').values_list('pk',
+                                                                'version'))
+
     def open(self, root, target=None, tree=None,
-             user=None):
+             user=None, limit=None, sort=None, cursor=None):
         """
-        Handles the open command
+        Handles the open command. Paginated listings (see page_size) are
+        sorted by sort, 'name', 'modified' or 'size' with a '-' prefix for
+        the descending order, and start after cursor: the response has the
+        cursor of the next page, the ancestors of tree are added to every
+        page.
         """
         target = target or root
-        files = self._tree(root, target, user=user, tree=tree)
+        limit = self._page_limit(limit)
+        if limit is None:
+            files = self._tree(root, target, user=user, tree=tree,
+                               depth=self._depth(), stream=self.streaming)
+            return {
+                'files': files,
+                'cwd': self._get_cwd(root, target, user)
+            }
+        files, cursor = self._page(target, limit, user, sort, cursor)
+        if tree:
+            files.extend(self._tree(root, target, user=user, tree=tree,
+                                    depth=0))
         return {
             'files': files,
-            'cwd': self._get_cwd(root, target, user)
+            'cwd': self._get_cwd(root, target, user),
+            'cursor': cursor
         }
         
-    def list(self, target, user=None, root=None):
+    def list(self, target, user=None, root=None, limit=None, sort=None,
+             cursor=None):
         """
-        Returns a list of files/directories in the target directory.
+        Returns a list of files/directories in the target directory,
+        paginated as in open.
         """
-        tree = self._tree(root, target, user=user)
-        inode_list = [inode['name'] for inode in tree]
+        limit = self._page_limit(limit)
+        if limit is not None:
+            files, cursor = self._page(target, limit, user, sort, cursor)
+            return {
+                'list': [inode['name'] for inode in files],
+                'cursor': cursor
+            }
+        tree = self._tree(root, target, user=user, depth=self._depth(),
+                          stream=self.streaming)
+        inode_list = (inode['name'] for inode in tree)
+        if not self.streaming:
+            inode_list = list(inode_list)
         return {
             'list': inode_list
         }
@@ -290,102 +458,273 @@ class FinderDriver(BaseDriver):
         }
 
     def remove(self, targets, user=None):
-        removed = []
-        for target in targets:
-            inode = self._get_inode(target)
+        inodes = self._get_inodes(targets)
+        for inode in inodes:
             if not inode.has_perm('remove', user):
                 raise PermissionDenied('You do not have permission \
                                    to remove %s' % inode.name)
-            inode.delete()
-            removed.append(target)
+        # the subtrees are only marked, purge_deleted_inodes removes them
+        bulk.delete_nodes(inodes)
         return {
-            'removed': removed
+            'removed': targets
         }
 
     def paste(self, targets, src, dst, cut, user=None):
-        removed, added = [], []
-        src_dir = self._get_inode(src)
         dst_dir = self._get_inode(dst)
         # check user permission on destination folder
         if not dst_dir.has_perm('add', user):
             raise PermissionDenied('You do not have permission \
                                     to add anything in %s' % dst_dir.name)
-        for target in targets:
-            inode = self._get_inode(target)
+        inodes = self._get_inodes(targets)
+        for inode in inodes:
             # check read permission on target inode
             if not inode.has_perm('read', user):
                 raise PermissionDenied('You do not have permission \
                                         to read %s' % inode.name)
-            # check if inode.name is not already present in destination folder
-            if dst_dir.children.filter(name=inode.name).count():
-                raise Exception('%s is already present in %s' % (inode.name,
-                                                             dst_dir.name))
-            new_inode = inode.clone(parent=dst_dir)
-            added.append(new_inode.info(user))
-            if cut == '1':
+            if cut:
                 if not inode.has_perm('remove', user):
                      raise PermissionDenied('You do not have permission \
                                             to remove %s' % inode.name)
-                inode.delete()
-                removed.append(target)
+            if dst_dir.tree_path.startswith(inode.tree_path):
+                raise Exception('%s cannot be pasted inside itself' %
+                                inode.name)
+        # check if names are not already present in destination folder
+        present = dst_dir.children.filter(
+            name__in=[inode.name for inode in inodes]).values_list(
+            'name', flat=True)
+        if present:
+            raise Exception('%s is already present in %s' % (
+                ', '.join(present), dst_dir.name))
+        if cut:
+            added = bulk.move_nodes(inodes, dst_dir)
+            removed = targets
+        else:
+            added = bulk.copy_nodes(inodes, dst_dir)
+            removed = []
         return {
-            'added': added,
+            'added': self._get_infos(added, user),
             'removed': removed
         }
 
     def size(self, targets, user=None):
-        size = 0
-        for target in targets:
-            inode = self._get_inode(target)
-            size += inode.total_size
         return {
-            'size': size
+            'size': sum(inode.total_size
+                        for inode in self._get_inodes(targets))
+        }
+
+    def _create_file(self, parent, filename, content, user=None):
+        if self.inode_model.objects.filter(name=filename,
+                parent=parent).count() > 0:
+            raise Exception('File %s already exists here!' % filename)
+        # guess the type from the filename and get the class that handles it
+        # guess_type return a tuple (mimetype, extensions)
+        mimetype = mimetypes.guess_type(filename)[0]
+        FileKlass = self.inode_model.MIMETYPES.get(mimetype,
+                                                   self.file_model)
+        obj = FileKlass(
+            name=filename,
+            parent=parent,
+            owner=user,
+            data=content
+        )
+        obj.save()
+        return obj
+
+    def _upload_chunk(self, parent, content, chunk, cid, range, user=None):
+        """
+        Stores a chunk of a file in the staging area. When all the chunks
+        are there the client is asked to send the request that creates
+        the file.
+        """
+        uploads.purge_staging()
+        upload, part, first, length = uploads.ChunkedUpload.start(
+            user, cid, chunk, range)
+        upload.write(part, first, length, content)
+        result = {
+            'added': []
         }
+        if upload.is_complete():
+            result['_chunkmerged'] = upload.key
+            result['_name'] = upload.meta['name']
+        return result
 
-    def upload(self, target, files, user=None):
+    def upload(self, target, files=None, user=None, chunk=None, cid=None,
+               range=None):
         parent = self._get_inode(target)
         added = []
         if not parent.has_perm('add', user):
             raise PermissionDenied('You do not have permission \
                                     to add anything in %s' % parent.name)
-        for key, value in files.items():
-            # guess the type from the filename and get the class that handles it
-            filename = value.name
-            if self.inode_model.objects.filter(name=filename,
-                    parent=parent).count() > 0:
-                raise Exception('File %s already exists here!' % filename)
-            # guess_type return a tuple (mimetype, extensions)
-            mimetype = mimetypes.guess_type(filename)[0]
-            FileKlass = self.inode_model.MIMETYPES.get(mimetype,
-                                                       self.file_model)
-            obj = FileKlass(
-                name=filename,
-                parent=parent,
-                owner=user,
-                data=value
-            )
-            obj.save()
-            added.append(obj.info(user))
+        if chunk and files:
+            return self._upload_chunk(parent, files.values()[0], chunk, cid,
+                                      range, user)
+        if chunk:
+            # every chunk has been received, create the file
+            staged = uploads.ChunkedUpload(chunk)
+            content = staged.open(user)
+            try:
+                added.append(self._create_file(parent, content.name,
+                                               content, user).info(user))
+            finally:
+                content.close()
+            staged.delete()
+        for key in files or []:
+            for value in files.getlist(key):
+                metrics.add_bytes(written=value.size)
+                added.append(self._create_file(parent, value.name, value,
+                                               user).info(user))
         return {
             'added': added
         }
 
-    def file(self, target, user=None):
+    def file(self, target, user=None, request=None, download=None):
         inode = self._get_inode(target)
         if not inode.has_perm('read', user):
             raise PermissionDenied('You do not have permission \
                                     to read anything in %s' % inode.name)
-        url = elutils.get_url(inode.data.name)
-        return HttpResponseRedirect(url)
-
-    def search(self, q, user=None, root=None):
-        data = self._tree(root, root, user)
-        logging.error('root: %s data: %s' % (root, data))
-        files = []
-        for item in data:
-            if q in item['name']:
-                files.append(item)
+        if self.file_delivery == 'redirect' or request is None:
+            url = elutils.get_url(inode.data.name)
+            return HttpResponseRedirect(url)
+        return delivery.serve_file(request, inode.data, inode.name,
+                                   inode.mime or 'application/octet-stream',
+                                   inode.size,
+                                   inode.data_mtime or inode.modified,
+                                   mode=self.file_delivery,
+                                   sendfile_root=self.sendfile_root,
+                                   attachment=download)
+
+    def search(self, q, user=None, root=None, target=None, limit=None,
+               offset=None):
+        """
+        Returns the inodes under target (or root) whose name contains q,
+        or starts with q if it is shorter than three characters, best
+        matches first, paginated with limit and offset.
+        """
+        root_node = self._get_inode(root)
+        target_node = self._get_inode(target) if target else root_node
+        offset = offset or 0
+        limit = min(limit or self.search_limit, self.search_limit)
+        inodes = self.inode_model.objects.search(q, target_node)
+        files = [info for info in serializers.iter_infos(
+            serializers.info_values(inodes)[offset:offset + limit], user,
+            root_node) if info['read']]
         return {
             'files': files,
         }
-    
\ No newline at end of file
+    
+    def archive(self, targets, type, current=None, user=None, name=None,
+                download=None):
+        """
+        Creates a zip archive of targets in the current folder, or sends it
+        to the client while it is written when download is set.
+        """
+        if type not in self.archivers['create']:
+            raise Exception('Archives of type %s are not supported' % type)
+        inodes = self._get_inodes(targets)
+        for inode in inodes:
+            if not inode.has_perm('read', user):
+                raise PermissionDenied('You do not have permission \
+                                        to read %s' % inode.name)
+        # inodes in the subtrees are skipped as in listings
+        itypes = [itype for itype, model in (
+            (models.INode.TYPES.folder, self.folder_model),
+            (models.INode.TYPES.file, self.file_model))
+            if model().has_perm('read', user)]
+        entries, size = archives.zip_entries(inodes, itypes)
+        if not name:
+            name = (inodes[0].name if len(inodes) == 1 else 'Archive') + '.zip'
+        if download:
+            metrics.add_bytes(read=size)
+            response = delivery.StreamingHttpResponse(
+                archives.iter_zip(entries), content_type='application/zip')
+            response['Content-Disposition'] = 'attachment; filename="%s"' % (
+                name.replace('"', '').encode('utf-8'))
+            return response
+        # the root has no parent, its archive is created inside it
+        parent = self._get_inode(current or inodes[0].parent_id or
+                                 inodes[0].pk)
+        if not parent.has_perm('add', user):
+            raise PermissionDenied('You do not have permission \
+                                    to add anything in %s' % parent.name)
+        staged = archives.stage_zip(entries)
+        content = uploads.StagedFile(open(staged, 'rb'), name)
+        try:
+            added = self._create_file(parent, name, content, user)
+        finally:
+            content.close()
+            if os.path.exists(staged):
+                os.remove(staged)
+        return {
+            'added': [added.info(user)]
+        }
+
+    def extract(self, target, user=None, makedir=None):
+        """
+        Extracts the zip archive target in its folder, or in a new folder
+        named after the archive when makedir is set.
+        """
+        inode = self._get_inode(target)
+        if not inode.has_perm('read', user):
+            raise PermissionDenied('You do not have permission \
+                                    to read %s' % inode.name)
+        if inode.mime not in self.archivers['extract']:
+            raise Exception('%s is not a supported archive' % inode.name)
+        parent = self._get_inode(inode.parent_id)
+        if not parent.has_perm('add', user):
+            raise PermissionDenied('You do not have permission \
+                                    to add anything in %s' % parent.name)
+        folder = os.path.splitext(inode.name)[0] if makedir else None
+        content = inode.data.storage.open(inode.data.name, 'rb')
+        try:
+            added = archives.extract_zip(content, parent, user, folder)
+        finally:
+            content.close()
+        return {
+            'added': self._get_infos(added, user)
+        }
+
+    def resize(self, target, mode, user=None, width=None, height=None,
+               x=None, y=None, degree=None, quality=None):
+        """
+        Queues the resize, crop or rotation of the image target, executed
+        by the process_image_jobs workers. The edited image replaces the
+        content of target when the job is done.
+        """
+        inode = self._get_inode(target)
+        try:
+            # ImageNode is not a direct subclass of INode
+            inode = models.ImageNode.objects.get(pk=inode.pk)
+        except models.ImageNode.DoesNotExist:
+            raise Exception('%s is not an image' % inode.name)
+        if not inode.has_perm('write', user):
+            raise PermissionDenied('You do not have permission \
+                                    to modify %s' % inode.name)
+        if mode not in imaging.EDIT_MODES:
+            raise Exception('Unknown resize mode %s' % mode)
+        params = {'mode': mode}
+        if mode == 'rotate':
+            params['degree'] = (degree or 0) % 360
+        else:
+            if not (width > 0 and height > 0):
+                raise Exception('Invalid size %sx%s' % (width, height))
+            if (x or 0) < 0 or (y or 0) < 0:
+                raise Exception('Invalid position %sx%s' % (x, y))
+            params.update(width=width, height=height, x=x or 0, y=y or 0)
+            if mode == 'resize':
+                imaging.check_pixels(width, height)
+        if inode.width and inode.height:
+            imaging.check_pixels(inode.width, inode.height)
+            if mode == 'rotate':
+                imaging.check_pixels(*imaging.rotated_size(
+                    inode.width, inode.height, params['degree']))
+            elif mode == 'crop' and (params['x'] + width > inode.width or
+                                     params['y'] + height > inode.height):
+                raise Exception('The crop area is outside the image')
+        if quality:
+            params['quality'] = quality
+        models.ImageJob.objects.create(image=inode,
+                                       action=models.ImageJob.ACTIONS.resize,
+                                       params=json.dumps(params))
+        return {
+            'changed': [inode.info(user)]
+        }
@@ -0,0 +1,331 @@
+"""
+Driver serving an existing directory tree as it is, without rows in the
+database, so that big shares can be browsed without importing them. The
+driver is read only.
+
+Directories are read with scandir (os.scandir, or the scandir backport on
+Python 2, listed in requirements.txt, os.listdir if it is missing) and
+their listings are cached with the mtime of the directory: a directory is
+scanned again only when entries are added, removed or renamed in it. Sizes
+and dates of the files listed come from the cached listing too, while the
+file command always reads them again.
+
+Every command checks has_access(user) first, by default the users with the
+read permission on the files of the database can read the whole tree.
+
+Hashes are the urlsafe base64 of the paths relative to the root. Use it as
+a volume of a site:
+
+    site = ElfinderSite(volumes=[
+        Volume('1'),
+        Volume('2', LocalFileSystemDriver('/srv/share')),
+    ])
+"""
+import base64
+import mimetypes
+import os
+import stat
+from datetime import datetime
+from functools import partial
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import get_cache
+from django.core.exceptions import PermissionDenied
+from django.core.files.storage import FileSystemStorage
+from django.utils.encoding import force_unicode
+
+from elfinder import delivery, pools
+from elfinder.dispatch import to_bool, to_list
+from elfinder.drivers.base import BaseDriver
+from elfinder.models import FileNode
+from elfinder.permissions import get_resolver
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        # backport of os.scandir for Python 2
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+# cache of the listings of the directories
+listing_cache = get_cache(getattr(settings, 'ELFINDER_CACHE', 'default'))
+LISTING_TIMEOUT = getattr(settings, 'ELFINDER_LISTING_TIMEOUT', 24 * 3600)
+
+
+def can_read_files(user):
+    """
+    Default access check of LocalFileSystemDriver: the users that can read
+    the files of the database can read the whole tree
+    """
+    return get_resolver(user).has_perm('read', FileNode)
+
+
+def _entry(name, st):
+    """
+    The listing entry of name: (name, is_dir, size, mtime, dirs)
+    """
+    is_dir = stat.S_ISDIR(st.st_mode)
+    # directories without subdirectories have exactly 2 links, other
+    # counts are subdirectories or filesystems not counting them
+    return (name, is_dir, 0 if is_dir else st.st_size, st.st_mtime,
+            is_dir and st.st_nlink != 2)
+
+
+def _stat(stat_func):
+    # broken symbolic links are skipped
+    try:
+        return stat_func()
+    except OSError:
+        return None
+
+
+def scan(path):
+    """
+    Returns the listing entries of the directory path, following symbolic
+    links. The entries are stat in the I/O pool, the slow part on network
+    filesystems.
+    """
+    if scandir is not None:
+        items = [(entry.name, entry.stat) for entry in scandir(path)]
+    else:
+        items = [(name, partial(os.stat, os.path.join(path, name)))
+                 for name in os.listdir(path) if isinstance(name, unicode)]
+    # names not valid in the filesystem encoding are skipped
+    items = [item for item in items if isinstance(item[0], unicode)]
+    stats = pools.io_map(_stat, [stat_func for _, stat_func in items],
+                         chunksize=64)
+    return [_entry(name, st) for (name, _), st in zip(items, stats)
+            if st is not None]
+
+
+class StoredFile(object):
+    """
+    A file of the tree, with the attributes of FieldFile used by
+    delivery.serve_file
+    """
+
+    def __init__(self, storage, name):
+        self.storage = storage
+        self.name = name
+        self.path = storage.path(name)
+
+
+class LocalFileSystemDriver(BaseDriver):
+    commands = {
+        'open'   : 'open',
+        'tree'   : 'tree',
+        'parents': 'parents',
+        'list'   : 'list',
+        'size'   : 'size',
+        'file'   : 'file',
+    }
+    param_types = {
+        'targets' : to_list,
+        'tree'    : to_bool,
+        'download': to_bool,
+    }
+
+    def __init__(self, root, name=None, show_hidden=False,
+                 file_delivery='stream', sendfile_root=None,
+                 has_access=can_read_files):
+        self.root = os.path.realpath(force_unicode(root))
+        self.name = name or os.path.basename(self.root)
+        self.show_hidden = show_hidden
+        # function of the user telling if the tree can be read by the user
+        self.has_access = has_access
+        # one of delivery.MODES, sendfile_root is mapped on root
+        delivery.check_mode(file_delivery, sendfile_root)
+        self.file_delivery = file_delivery
+        self.sendfile_root = sendfile_root
+        self.storage = FileSystemStorage(location=self.root)
+        self.root_hash = self.encode(self.root)
+
+    def encode(self, path):
+        """
+        Returns the hash of path, a path under root
+        """
+        relpath = os.path.relpath(path, self.root)
+        if relpath == '.':
+            relpath = ''
+        return base64.urlsafe_b64encode(
+            ('/' + relpath).encode('utf-8')).rstrip('=')
+
+    def _inside(self, realpath):
+        return realpath == self.root or realpath.startswith(self.root + os.sep)
+
+    def decode(self, target_hash):
+        """
+        Returns the path of target_hash, that must be under root
+        """
+        try:
+            target_hash = str(target_hash)
+            relpath = base64.urlsafe_b64decode(
+                target_hash + '=' * (-len(target_hash) % 4)).decode('utf-8')
+        except (TypeError, UnicodeError):
+            raise Exception('Invalid hash %s' % target_hash)
+        path = os.path.realpath(os.path.join(self.root, relpath.lstrip('/')))
+        if not self._inside(path):
+            raise Exception('Invalid hash %s' % target_hash)
+        # hidden files are not served, even with a hash built by hand
+        if not os.path.exists(path) or (
+                not self.show_hidden and self._hidden(path)):
+            raise Exception('%s does not exist' % relpath)
+        return path
+
+    def _hidden(self, path):
+        return path != self.root and any(
+            part.startswith('.') for part in
+            os.path.relpath(path, self.root).split(os.sep))
+
+    def listing(self, path):
+        """
+        Returns the entries of the directory path, scanning it only when
+        its mtime changed since the last scan
+        """
+        mtime = os.stat(path).st_mtime
+        key = 'elfinder:listing:%s' % md5(path.encode('utf-8')).hexdigest()
+        cached = listing_cache.get(key)
+        if cached is not None and cached[0] == mtime:
+            entries = cached[1]
+        else:
+            entries = scan(path)
+            listing_cache.set(key, (mtime, entries), LISTING_TIMEOUT)
+        if not self.show_hidden:
+            entries = [entry for entry in entries
+                       if not entry[0].startswith('.')]
+        return entries
+
+    def _info(self, path, entry):
+        name, is_dir, size, mtime, dirs = entry
+        info = {
+            'name'  : name,
+            'hash'  : self.encode(path),
+            'phash' : ('' if path == self.root else
+                       self.encode(os.path.dirname(path))),
+            'mime'  : ('directory' if is_dir else
+                       mimetypes.guess_type(name)[0] or
+                       'application/octet-stream'),
+            'size'  : size,
+            'ts'    : mtime,
+            'read'  : 1,
+            'write' : 0,
+            'rm'    : 0,
+            'locked': 1,
+        }
+        if is_dir:
+            info['dirs'] = int(dirs)
+        return info
+
+    def _path_info(self, path):
+        name = self.name if path == self.root else os.path.basename(path)
+        return self._info(path, _entry(name, os.stat(path)))
+
+    def _children(self, path, folders_only=False):
+        return [self._info(os.path.join(path, entry[0]), entry)
+                for entry in self.listing(path)
+                if entry[1] or not folders_only]
+
+    def _ancestors(self, path):
+        """
+        Directories from root down to path
+        """
+        paths = [path]
+        while path != self.root:
+            path = os.path.dirname(path)
+            paths.insert(0, path)
+        return paths
+
+    def _directory(self, target):
+        path = self.decode(target or self.root_hash)
+        if not os.path.isdir(path):
+            raise Exception('%s is not a directory' % os.path.basename(path))
+        return path
+
+    def _authorize(self, user):
+        if not self.has_access(user):
+            raise PermissionDenied('You do not have permission to read %s'
+                                   % self.name)
+
+    def info(self, target, user=None, root=None):
+        self._authorize(user)
+        return self._path_info(self.decode(target))
+
+    def open(self, root, target=None, tree=None, user=None):
+        self._authorize(user)
+        path = self._directory(target)
+        files = self._children(path)
+        if tree:
+            # the folders from the root down to target, as FinderDriver
+            files.append(self._path_info(self.root))
+            for ancestor in self._ancestors(path)[:-1]:
+                files.extend(self._children(ancestor, folders_only=True))
+        return {
+            'files': files,
+            'cwd': self._path_info(path)
+        }
+
+    def tree(self, root, target, user=None):
+        self._authorize(user)
+        return {
+            'tree': self._children(self._directory(target), folders_only=True)
+        }
+
+    def parents(self, root, target, user=None):
+        self._authorize(user)
+        path = self._directory(target)
+        tree = [self._path_info(self.root)]
+        for ancestor in self._ancestors(path):
+            tree.extend(self._children(ancestor, folders_only=True))
+        return {
+            'parents': tree
+        }
+
+    def list(self, target, user=None):
+        self._authorize(user)
+        return {
+            'list': [entry[0] for entry in
+                     self.listing(self._directory(target))]
+        }
+
+    def _size(self, path, seen):
+        if not os.path.isdir(path):
+            return os.path.getsize(path)
+        # symbolic links may make loops, reach a directory twice or leave
+        # the tree
+        realpath = os.path.realpath(path)
+        if realpath in seen or not self._inside(realpath):
+            return 0
+        seen.add(realpath)
+        return sum(self._size(os.path.join(path, entry[0]), seen)
+                   if entry[1] else entry[2]
+                   for entry in self.listing(path))
+
+    def size(self, targets, user=None):
+        self._authorize(user)
+        seen = set()
+        return {
+            'size': sum(self._size(self.decode(target), seen)
+                        for target in targets)
+        }
+
+    def file(self, target, user=None, request=None, download=None):
+        self._authorize(user)
+        path = self.decode(target)
+        if os.path.isdir(path):
+            raise Exception('%s is not a file' % os.path.basename(path))
+        st = os.stat(path)
+        name = os.path.basename(path)
+        return delivery.serve_file(request,
+                                   StoredFile(self.storage, os.path.relpath(
+                                       path, self.root)), name,
+                                   mimetypes.guess_type(name)[0] or
+                                   'application/octet-stream',
+                                   st.st_size,
+                                   datetime.fromtimestamp(st.st_mtime),
+                                   mode=self.file_delivery,
+                                   sendfile_root=self.sendfile_root,
+                                   attachment=download,
+                                   media_root=self.root)
@@ -0,0 +1,172 @@
+"""
+Image processing executed by the process_image_jobs command in a pool of
+worker processes, so that web requests never decode images.
+"""
+import math
+import os
+import tempfile
+
+import Image
+from django.conf import settings
+
+from elfinder.uploads import STAGING_ROOT
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# sizes of the thumbnails generated for every image, the first one is the
+# thumbnail returned to elFinder
+THUMBNAIL_SIZES = getattr(settings, 'ELFINDER_THUMBNAIL_SIZES',
+                          ((128, 128),))
+# largest image, in pixels, read or written by an edit
+MAX_PIXELS = getattr(settings, 'ELFINDER_IMAGE_MAX_PIXELS', 64 * 1024 * 1024)
+# address space of a worker process in bytes, None for no limit
+WORKER_MEMORY = getattr(settings, 'ELFINDER_IMAGE_WORKER_MEMORY',
+                        1024 * 1024 * 1024)
+EDIT_MODES = ('resize', 'crop', 'rotate')
+
+
+def limit_memory(limit=WORKER_MEMORY):
+    """
+    Initializer of the worker processes: an image too big for the limit
+    fails its job with a MemoryError instead of exhausting the memory
+    """
+    if limit and resource is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def check_pixels(width, height, max_pixels=None):
+    max_pixels = max_pixels or MAX_PIXELS
+    if width * height > max_pixels:
+        raise ValueError('%dx%d images exceed the limit of %d pixels' % (
+            width, height, max_pixels))
+
+
+def rotated_size(width, height, degree):
+    """
+    Size of the image width x height rotated by degree with expand
+    """
+    angle = math.radians(degree)
+    cos, sin = abs(math.cos(angle)), abs(math.sin(angle))
+    # rounded first, so that right angles give exact sizes
+    return (int(math.ceil(round(width * cos + height * sin, 6))),
+            int(math.ceil(round(width * sin + height * cos, 6))))
+
+
+def thumbnail_path(path, size):
+    """
+    Returns the path of the size thumbnail of the image stored in path
+    """
+    rel_path = os.path.relpath(path, settings.MEDIA_ROOT)
+    return os.path.join(settings.MEDIA_ROOT, 'thumbs', '%dx%d' % size,
+                        rel_path + '.jpg')
+
+
+def delete_thumbnails(path, sizes=THUMBNAIL_SIZES):
+    """
+    Removes the thumbnails of the image stored in path, when its content is
+    deleted
+    """
+    for size in sizes:
+        thumbname = thumbnail_path(path, tuple(size))
+        if os.path.exists(thumbname):
+            os.remove(thumbname)
+
+
+def make_thumbnails(path, sizes=THUMBNAIL_SIZES):
+    """
+    Writes the thumbnails of the image stored in path and returns the
+    dimensions of the image together with the paths of the thumbnails.
+    """
+    sizes = [tuple(size) for size in sizes]
+    image = Image.open(path)
+    width, height = image.size
+    # the size is read from the header, a decompression bomb fails here
+    # instead of exhausting the worker
+    check_pixels(width, height)
+    # JPEG images are decoded directly at a reduced scale, still bigger
+    # than the biggest thumbnail
+    image.draft('RGB', max(sizes, key=lambda size: size[0] * size[1]))
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    thumbs = []
+    for size in sizes:
+        thumb = image.copy()
+        thumb.thumbnail(size, Image.ANTIALIAS)
+        thumbname = thumbnail_path(path, size)
+        if not os.path.exists(os.path.dirname(thumbname)):
+            os.makedirs(os.path.dirname(thumbname))
+        thumb.save(thumbname, 'JPEG')
+        thumbs.append(thumbname)
+    return {
+        'width': width,
+        'height': height,
+        'thumbs': thumbs,
+    }
+
+
+def edit_image(path, mode, width=None, height=None, x=0, y=0, degree=0,
+               quality=90):
+    """
+    Resizes, crops or rotates the image stored in path. The original is
+    never modified, it may be shared by copies of the file: the result is
+    written to a new file of the staging area, returned with its dimensions.
+    """
+    if mode not in EDIT_MODES:
+        raise ValueError('Unknown mode %s' % mode)
+    image = Image.open(path)
+    # the size is read from the header, before decoding the pixels
+    check_pixels(*image.size)
+    fmt = image.format
+    if mode == 'resize':
+        check_pixels(width, height)
+        image = image.resize((width, height), Image.ANTIALIAS)
+    elif mode == 'crop':
+        if x < 0 or y < 0 or x + width > image.size[0] or \
+                y + height > image.size[1]:
+            raise ValueError('The crop area is outside the image')
+        image = image.crop((x, y, x + width, y + height))
+    else:
+        # the expanded image is bigger than the original
+        check_pixels(*rotated_size(image.size[0], image.size[1], degree))
+        # elFinder rotates clockwise
+        image = image.rotate(-degree, expand=True)
+    if not os.path.exists(STAGING_ROOT):
+        os.makedirs(STAGING_ROOT)
+    staged = tempfile.NamedTemporaryFile(dir=STAGING_ROOT, delete=False)
+    try:
+        if fmt == 'JPEG':
+            image.save(staged, fmt, quality=quality)
+        else:
+            image.save(staged, fmt)
+    except Exception:
+        staged.close()
+        os.remove(staged.name)
+        raise
+    staged.close()
+    return {
+        'width': image.size[0],
+        'height': image.size[1],
+        'staged': staged.name,
+    }
+
+
+ACTIONS = {
+    'thumbnail': make_thumbnails,
+    'resize': edit_image,
+}
+
+
+def run_job(job):
+    """
+    Entry point of the worker processes, job is a (pk, action, path, params)
+    tuple. Returns a (pk, result, error) tuple, the caller stores the result
+    in the database.
+    """
+    pk, action, path, params = job
+    try:
+        return pk, ACTIONS[action](path, **params), None
+    except Exception as e:
+        return pk, None, '%s: %s' % (e.__class__.__name__, e)
@@ -0,0 +1,158 @@
+import time
+from optparse import make_option
+
+import simplejson as json
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import CommandError, NoArgsCommand
+from django.conf import settings
+from django.db import connection
+from django.test.client import RequestFactory
+from django.utils.importlib import import_module
+
+from elfinder.bulk import purge_deleted
+from elfinder.models import FolderNode, INode
+from elfinder.sites import ElfinderSite
+
+# maximum number of queries of every command, measured with a superuser
+# (permissions add no queries). They do not depend on the size of the tree
+# or of the listings: lower them when a change saves queries, so that
+# regressions are caught.
+QUERY_BUDGETS = {
+    'open': 8,
+    'tree': 5,
+    'parents': 6,
+    'list': 3,
+    'search': 3,
+    'size': 1,
+    'upload': 15,
+    'paste': 22,
+    'rm': 5,
+}
+
+
+class Command(NoArgsCommand):
+    help = ('Time the connector commands on an existing tree (see '
+            'generate_tree) and fail if they exceed their query budget')
+    option_list = NoArgsCommand.option_list + (
+        make_option('--folder', dest='folder', type='int',
+                    default=INode.ROOT['PK'],
+                    help='Primary key of the folder the commands run on'),
+        make_option('--user', dest='user', default=None,
+                    help='Username running the commands, the first '
+                         'superuser if not given'),
+        make_option('--site', dest='site', default=None,
+                    help='Dotted path of the ElfinderSite to benchmark, a '
+                         'default one if not given'),
+        make_option('--repeat', dest='repeat', type='int', default=5,
+                    help='Runs of every command'),
+        make_option('--budgets', dest='budgets', default=None,
+                    help='JSON file mapping commands to their maximum '
+                         'number of queries'),
+    )
+
+    def handle_noargs(self, **options):
+        if options['user']:
+            self.user = User.objects.get(username=options['user'])
+        else:
+            self.user = User.objects.filter(
+                is_superuser=True).order_by('pk')[0]
+        if options['site']:
+            module, name = options['site'].rsplit('.', 1)
+            self.site = getattr(import_module(module), name)
+        else:
+            self.site = ElfinderSite()
+        budgets = dict(QUERY_BUDGETS)
+        if options['budgets']:
+            with open(options['budgets']) as budgets_file:
+                budgets.update(json.load(budgets_file))
+        folder = FolderNode.objects.get(pk=options['folder'])
+        # the deepest folder, opened and copied by paste
+        deepest = folder.get_descendants(include_self=True).filter(
+            itype=INode.TYPES.folder).order_by('-level', 'pk')[0]
+        self.results = []
+        scratch = self.call('mkdir', target=folder.pk,
+                            name='benchmark-%d' % time.time())['added'][0]
+        try:
+            for i in range(options['repeat']):
+                self.run('open', target=deepest.pk, tree=1, init=1)
+                self.run('tree', target=deepest.pk)
+                self.run('parents', target=deepest.pk)
+                self.run('list', target=folder.pk)
+                self.run('search', q='file-1', target=folder.pk)
+                self.run('size', targets=[folder.pk])
+                added = self.run('upload', target=scratch['hash'], files={
+                    'upload[]': SimpleUploadedFile('upload-%d.txt' % i,
+                                                   'benchmark\n')})
+                self.run('rm', targets=[added['added'][0]['hash']])
+                copied = self.run('paste', src=folder.pk,
+                                  dst=scratch['hash'], cut=0,
+                                  targets=[deepest.pk])
+                self.run('rm', targets=[copied['added'][0]['hash']])
+        finally:
+            self.call('rm', targets=[scratch['hash']])
+            purge_deleted()
+        self.report(budgets)
+
+    def request(self, cmd, files=None, **params):
+        data = {'cmd': cmd}
+        for key, value in params.items():
+            if isinstance(value, list):
+                key += '[]'
+            data[key] = value
+        if files:
+            data.update(files)
+        request = RequestFactory().post('/', data)
+        request.user = self.user
+        return request
+
+    def call(self, cmd, **params):
+        response = self.site.connector(self.request(cmd, **params),
+                                       INode.ROOT['PK'])
+        content = json.loads(response.content)
+        if 'error' in content:
+            raise CommandError('%s failed: %s' % (cmd, content['error']))
+        return content
+
+    def run(self, cmd, **params):
+        request = self.request(cmd, **params)
+        use_debug_cursor = connection.use_debug_cursor
+        connection.use_debug_cursor = True
+        first = len(connection.queries)
+        start = time.time()
+        try:
+            response = self.site.connector(request, INode.ROOT['PK'])
+            content = json.loads(response.content)
+        finally:
+            elapsed = time.time() - start
+            queries = len(connection.queries) - first
+            if not (use_debug_cursor or settings.DEBUG):
+                del connection.queries[first:]
+            connection.use_debug_cursor = use_debug_cursor
+        if 'error' in content:
+            raise CommandError('%s failed: %s' % (cmd, content['error']))
+        self.results.append((cmd, elapsed, queries))
+        return content
+
+    def report(self, budgets):
+        commands = []
+        for cmd, _, _ in self.results:
+            if cmd not in commands:
+                commands.append(cmd)
+        self.stdout.write('%-10s %6s %10s %10s %8s %8s\n' % (
+            'command', 'runs', 'median ms', 'max ms', 'queries', 'budget'))
+        exceeded = []
+        for cmd in commands:
+            times = sorted(elapsed for name, elapsed, _ in self.results
+                           if name == cmd)
+            queries = max(count for name, _, count in self.results
+                          if name == cmd)
+            budget = budgets.get(cmd)
+            self.stdout.write('%-10s %6d %10.1f %10.1f %8d %8s\n' % (
+                cmd, len(times), times[len(times) // 2] * 1000,
+                times[-1] * 1000, queries, budget or '-'))
+            if budget is not None and queries > budget:
+                exceeded.append('%s (%d > %d)' % (cmd, queries, budget))
+        if exceeded:
+            raise CommandError('query budget exceeded: %s' %
+                               ', '.join(exceeded))
@@ -0,0 +1,129 @@
+from cStringIO import StringIO
+from datetime import datetime
+from optparse import make_option
+
+import Image
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.management.base import CommandError, NoArgsCommand
+
+from elfinder import bulk, utils as elutils
+from elfinder.models import Blob, FileNode, FolderNode, ImageNode, INode, \
+    atomic
+
+
+class Command(NoArgsCommand):
+    help = ('Generate a synthetic tree of folders, files and images, used '
+            'to benchmark the driver. All the generated files share the '
+            'same two contents.')
+    option_list = NoArgsCommand.option_list + (
+        make_option('--parent', dest='parent', type='int',
+                    default=INode.ROOT['PK'],
+                    help='Primary key of the folder that will contain the '
+                         'tree'),
+        make_option('--name', dest='name', default='generated',
+                    help='Name of the top folder of the tree'),
+        make_option('--depth', dest='depth', type='int', default=4,
+                    help='Levels of folders under the top folder'),
+        make_option('--fanout', dest='fanout', type='int', default=10,
+                    help='Subfolders of every folder'),
+        make_option('--files', dest='files', type='int', default=20,
+                    help='Files in every folder'),
+        make_option('--images', dest='images', type='int', default=5,
+                    help='Images in every folder'),
+        make_option('--owner', dest='owner', default=None,
+                    help='Username of the owner, the first superuser if '
+                         'not given'),
+    )
+
+    def handle_noargs(self, **options):
+        if options['owner']:
+            owner = User.objects.get(username=options['owner'])
+        else:
+            owner = User.objects.filter(is_superuser=True).order_by('pk')[0]
+        parent = FolderNode.objects.get(pk=options['parent'])
+        if parent.children.filter(name=options['name']).exists():
+            raise CommandError('%s already contains %s' % (
+                parent.name, options['name']))
+        self.depth = options['depth']
+        self.fanout = options['fanout']
+        self.files = options['files']
+        self.images = options['images']
+        storage = FileNode._meta.get_field('data').storage
+        self.file_data = storage.save('generated/file.txt',
+                                      ContentFile('generated file\n'))
+        image = StringIO()
+        Image.new('RGB', (64, 48), (128, 128, 128)).save(image, 'JPEG')
+        self.image_data = storage.save('generated/image.jpg',
+                                       ContentFile(image.getvalue()))
+        self.file_size = storage.size(self.file_data)
+        self.image_size = storage.size(self.image_data)
+        self.owner = owner
+        self.now = datetime.now()
+        self.count = 0
+        with atomic():
+            top = FolderNode(name=options['name'], parent=parent,
+                             owner=owner)
+            top.save()
+            self._generate([top], 0)
+            # every folder at the same level has the same aggregates
+            for level in range(self.depth + 1):
+                total_bytes, total_items = self._aggregates(level)
+                FolderNode.objects.filter(
+                    tree_path__startswith=top.tree_path,
+                    level=top.level + level).update(
+                    total_bytes=total_bytes, total_items=total_items)
+            total_bytes, total_items = self._aggregates(0)
+            FolderNode.objects.update_aggregates(top.ancestor_ids,
+                                                 total_bytes, total_items)
+            folders = sum(self.fanout ** level
+                          for level in range(self.depth + 1))
+            Blob.objects.acquire([self.file_data] * folders * self.files +
+                                 [self.image_data] * folders * self.images)
+        self.stdout.write('%d inodes generated under %s\n' % (
+            self.count + 1, top.path))
+
+    def _aggregates(self, level):
+        """
+        Bytes and items under a generated folder at level from the top
+        """
+        total_bytes = (self.files * self.file_size +
+                       self.images * self.image_size)
+        total_items = self.files + self.images
+        if level < self.depth:
+            below_bytes, below_items = self._aggregates(level + 1)
+            total_bytes += self.fanout * below_bytes
+            total_items += self.fanout * (below_items + 1)
+        return total_bytes, total_items
+
+    def _generate(self, parents, level):
+        """
+        Fills parents, folders at level from the top, depth first so that
+        only a batch of folders for each level is kept in memory
+        """
+        nodes = []
+        for parent in parents:
+            for i in range(self.files):
+                nodes.append(FileNode(
+                    name='file-%d.txt' % i, parent_id=parent.pk,
+                    owner=self.owner, data=self.file_data,
+                    data_size=self.file_size, data_mtime=self.now,
+                    mime='text/plain'))
+            for i in range(self.images):
+                nodes.append(ImageNode(
+                    name='image-%d.jpg' % i, parent_id=parent.pk,
+                    owner=self.owner, data=self.image_data,
+                    data_size=self.image_size, data_mtime=self.now,
+                    mime='image/jpeg',
+                    width=64, height=48))
+            if level < self.depth:
+                for i in range(self.fanout):
+                    nodes.append(FolderNode(
+                        name='folder-%d' % i, parent_id=parent.pk,
+                        owner=self.owner))
+        nodes = bulk.insert_nodes(nodes, dict((parent.pk, parent)
+                                              for parent in parents))
+        self.count += len(nodes)
+        folders = [node for node in nodes if isinstance(node, FolderNode)]
+        for batch in elutils.chunked(folders, bulk.BATCH_SIZE):
+            self._generate(batch, level + 1)
@@ -0,0 +1,80 @@
+import time
+from datetime import datetime, timedelta
+from multiprocessing import Pool
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from elfinder.imaging import limit_memory, run_job
+from elfinder.models import ImageJob
+from elfinder.volumes import Volume
+
+
+class Command(NoArgsCommand):
+    help = ('Execute the pending image jobs (thumbnails, image metadata and '
+            'edits) in a pool of worker processes')
+    option_list = NoArgsCommand.option_list + (
+        make_option('--processes', dest='processes', type='int', default=None,
+                    help='Number of worker processes, default one per CPU'),
+        make_option('--batch-size', dest='batch_size', type='int',
+                    default=100,
+                    help='Number of jobs claimed with each query'),
+        make_option('--loop', dest='loop', action='store_true',
+                    default=False,
+                    help='Keep waiting for new jobs instead of exiting'),
+        make_option('--sleep', dest='sleep', type='float', default=2.0,
+                    help='Seconds between two polls when no job is pending'),
+        make_option('--database', dest='database', default=DEFAULT_DB_ALIAS,
+                    help='Database of the volume whose jobs are executed'),
+        make_option('--stale-after', dest='stale_after', type='int',
+                    default=3600,
+                    help='Seconds after which a running job is considered '
+                         'abandoned by a stopped consumer and run again'),
+    )
+
+    def handle_noargs(self, **options):
+        with Volume(options['database'], using=options['database']):
+            self.process(**options)
+
+    def process(self, **options):
+        # jobs left running by a consumer that has been stopped, the recent
+        # ones may belong to another consumer still running
+        ImageJob.objects.filter(
+            status=ImageJob.STATUS.running,
+            modified__lt=datetime.now() - timedelta(
+                seconds=options['stale_after'])).update(
+            status=ImageJob.STATUS.pending)
+        # workers must not inherit the database connections
+        for connection in connections.all():
+            connection.close()
+        # every worker has the memory budget of imaging.WORKER_MEMORY
+        pool = Pool(options['processes'], initializer=limit_memory)
+        count = 0
+        try:
+            while True:
+                jobs = dict((job.pk, job) for job in
+                            ImageJob.objects.claim(options['batch_size']))
+                if not jobs:
+                    if not options['loop']:
+                        break
+                    time.sleep(options['sleep'])
+                    continue
+                payloads = []
+                for pk, job in jobs.items():
+                    # i.e. no content or a storage without paths
+                    try:
+                        payloads.append(job.payload())
+                    except Exception as e:
+                        job.fail(str(e) or e.__class__.__name__)
+                        count += 1
+                for pk, result, error in pool.imap_unordered(run_job,
+                                                             payloads):
+                    if error:
+                        jobs[pk].fail(error)
+                    else:
+                        jobs[pk].complete(result)
+                    count += 1
+        finally:
+            pool.terminate()
+        self.stdout.write('%d image jobs processed\n' % count)
@@ -0,0 +1,37 @@
+import time
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from elfinder.bulk import purge_deleted
+from elfinder.volumes import Volume
+
+
+class Command(NoArgsCommand):
+    help = ('Remove the rows of the deleted inodes and the contents not '
+            'referenced anymore')
+    option_list = NoArgsCommand.option_list + (
+        make_option('--batch-size', dest='batch_size', type='int',
+                    default=500,
+                    help='Number of inodes removed in each transaction'),
+        make_option('--loop', dest='loop', action='store_true',
+                    default=False,
+                    help='Keep waiting for deleted inodes instead of exiting'),
+        make_option('--sleep', dest='sleep', type='float', default=10.0,
+                    help='Seconds between two runs when nothing is deleted'),
+        make_option('--database', dest='database', default=DEFAULT_DB_ALIAS,
+                    help='Database of the volume whose inodes are purged'),
+    )
+
+    def handle_noargs(self, **options):
+        count = 0
+        with Volume(options['database'], using=options['database']):
+            while True:
+                purged = purge_deleted(options['batch_size'])
+                count += purged
+                if not options['loop']:
+                    break
+                if not purged:
+                    time.sleep(options['sleep'])
+        self.stdout.write('%d inodes purged\n' % count)
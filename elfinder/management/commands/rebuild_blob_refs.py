@@ -0,0 +1,20 @@
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+
+from elfinder.models import Blob
+
+
+class Command(NoArgsCommand):
+    help = ('Count again the files sharing every content, creating the '
+            'missing references of the files stored before reference '
+            'counting')
+    option_list = NoArgsCommand.option_list + (
+        make_option('--batch-size', dest='batch_size', type='int',
+                    default=1000,
+                    help='Number of contents inserted with each query'),
+    )
+
+    def handle_noargs(self, **options):
+        count = Blob.objects.rebuild(options['batch_size'])
+        self.stdout.write('%d contents counted\n' % count)
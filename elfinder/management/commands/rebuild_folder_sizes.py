@@ -0,0 +1,18 @@
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+
+from elfinder.models import FolderNode
+
+
+class Command(NoArgsCommand):
+    help = 'Rebuild the total size and items of all the folders'
+    option_list = NoArgsCommand.option_list + (
+        make_option('--batch-size', dest='batch_size', type='int',
+                    default=1000,
+                    help='Number of inodes read with each query'),
+    )
+
+    def handle_noargs(self, **options):
+        count = FolderNode.objects.rebuild_aggregates(options['batch_size'])
+        self.stdout.write('%d folders updated\n' % count)
@@ -0,0 +1,18 @@
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+
+from elfinder.models import NameTrigram
+
+
+class Command(NoArgsCommand):
+    help = 'Rebuild the search index of the inode names'
+    option_list = NoArgsCommand.option_list + (
+        make_option('--batch-size', dest='batch_size', type='int',
+                    default=1000,
+                    help='Number of inodes indexed with each query'),
+    )
+
+    def handle_noargs(self, **options):
+        count = NameTrigram.objects.rebuild(options['batch_size'])
+        self.stdout.write('%d inodes indexed\n' % count)
@@ -0,0 +1,20 @@
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+
+from elfinder.models import INode
+
+
+class Command(NoArgsCommand):
+    help = 'Rebuild the materialized path of all the inodes'
+    option_list = NoArgsCommand.option_list + (
+        make_option('--batch-size', dest='batch_size', type='int',
+                    default=1000,
+                    help='Number of parents whose children are updated '
+                         'with each query'),
+    )
+
+    def handle_noargs(self, **options):
+        count = INode.objects.rebuild_tree(options['batch_size'])
+        self.stdout.write('%d inodes updated
+' % count)
@@ -0,0 +1,42 @@
+from optparse import make_option
+
+from django.core.management.base import NoArgsCommand
+
+from elfinder.models import FileNode, FolderNode, atomic
+
+
+class Command(NoArgsCommand):
+    help = ('Read size, mimetype and modification time of all the files '
+            'from storage and store them in the database')
+    option_list = NoArgsCommand.option_list + (
+        make_option('--batch-size', dest='batch_size', type='int',
+                    default=1000,
+                    help='Number of files updated in each transaction'),
+    )
+
+    def handle_noargs(self, **options):
+        count, last_pk = 0, 0
+        while True:
+            batch = list(FileNode.objects.filter(pk__gt=last_pk).order_by(
+                'pk')[:options['batch_size']])
+            if not batch:
+                break
+            with atomic():
+                parents = set()
+                for inode in batch:
+                    try:
+                        inode.refresh_metadata()
+                    except (IOError, OSError) as e:
+                        self.stderr.write('%s: %s\n' % (inode.data.name, e))
+                        continue
+                    FileNode.objects.filter(pk=inode.pk).update(
+                        data_size=inode.data_size,
+                        data_mtime=inode.data_mtime,
+                        mime=inode.mime)
+                    parents.add(inode.parent_id)
+                    count += 1
+                # the listings cached with the old metadata are dropped
+                FolderNode.objects.touch(parents)
+            last_pk = batch[-1].pk
+        self.stdout.write('%d files updated, run rebuild_folder_sizes to '
+                          'update the folders\n' % count)
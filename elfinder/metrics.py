@@ -0,0 +1,248 @@
+"""
+Instrumentation of the connector commands. For every command the registry
+keeps a latency histogram, the number and time of the database queries,
+the bytes read and written on the storage and the size of the responses.
+ElfinderSite.stats exposes them in the Prometheus text format.
+
+The registry lives in the memory of the process, so with several worker
+processes every one of them reports its own counters.
+"""
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends import util
+
+ENABLED = getattr(settings, 'ELFINDER_METRICS', True)
+# upper bounds, in seconds, of the buckets of the latency histograms
+BUCKETS = getattr(settings, 'ELFINDER_METRICS_BUCKETS',
+                  (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+# fraction of the commands whose request and response are logged at DEBUG
+DEBUG_SAMPLE_RATE = getattr(settings, 'ELFINDER_DEBUG_SAMPLE_RATE', 0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+logger = logging.getLogger('elfinder')
+
+_local = threading.local()
+
+
+class Measurement(object):
+    """
+    Counters of a single command, filled while it runs
+    """
+
+    def __init__(self, command):
+        self.command = command
+        self.duration = 0
+        self.queries = 0
+        self.query_seconds = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.response_bytes = 0
+        self.error = False
+
+
+class Registry(object):
+    """
+    Counters of all the commands executed by this process
+    """
+    COUNTERS = (
+        ('queries', 'elfinder_command_queries_total',
+         'Database queries executed by the command'),
+        ('query_seconds', 'elfinder_command_query_seconds_total',
+         'Time spent in database queries by the command'),
+        ('bytes_read', 'elfinder_storage_bytes_read_total',
+         'Bytes read from the storage'),
+        ('bytes_written', 'elfinder_storage_bytes_written_total',
+         'Bytes written to the storage'),
+        ('response_bytes', 'elfinder_response_bytes_total',
+         'Size of the responses'),
+        ('errors', 'elfinder_command_errors_total',
+         'Commands ended with an error'),
+    )
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.lock = threading.Lock()
+        self.commands = {}
+
+    def observe(self, measurement):
+        with self.lock:
+            stats = self.commands.get(measurement.command)
+            if stats is None:
+                stats = self.commands[measurement.command] = {
+                    'buckets': [0] * len(self.buckets), 'count': 0,
+                    'sum': 0, 'errors': 0, 'queries': 0, 'query_seconds': 0,
+                    'bytes_read': 0, 'bytes_written': 0,
+                    'response_bytes': 0,
+                }
+            for i, bound in enumerate(self.buckets):
+                if measurement.duration <= bound:
+                    stats['buckets'][i] += 1
+            stats['count'] += 1
+            stats['sum'] += measurement.duration
+            stats['errors'] += int(measurement.error)
+            for name in ('queries', 'query_seconds', 'bytes_read',
+                         'bytes_written', 'response_bytes'):
+                stats[name] += getattr(measurement, name)
+
+    def render(self):
+        """
+        Returns the counters in the Prometheus text exposition format
+        """
+        with self.lock:
+            commands = sorted((command, dict(stats, buckets=list(
+                stats['buckets']))) for command, stats in
+                self.commands.items())
+        lines = [
+            '# HELP elfinder_command_duration_seconds Latency of the '
+            'connector commands',
+            '# TYPE elfinder_command_duration_seconds histogram',
+        ]
+        for command, stats in commands:
+            for bound, count in zip(self.buckets, stats['buckets']):
+                lines.append('elfinder_command_duration_seconds_bucket'
+                             '{command="%s",le="%s"} %d' % (command, bound,
+                                                           count))
+            lines.append('elfinder_command_duration_seconds_bucket'
+                         '{command="%s",le="+Inf"} %d' % (command,
+                                                          stats['count']))
+            lines.append('elfinder_command_duration_seconds_sum'
+                         '{command="%s"} %f' % (command, stats['sum']))
+            lines.append('elfinder_command_duration_seconds_count'
+                         '{command="%s"} %d' % (command, stats['count']))
+        for name, metric, help in self.COUNTERS:
+            lines.append('# HELP %s %s' % (metric, help))
+            lines.append('# TYPE %s counter' % metric)
+            for command, stats in commands:
+                lines.append('%s{command="%s"} %s' % (metric, command,
+                                                      stats[name]))
+        return '\n'.join(lines) + '\n'
+
+registry = Registry()
+
+
+class CountingCursor(object):
+    """
+    Cursor adding its queries and their time to a measurement, without
+    formatting or keeping the SQL as the debug cursor of Django does
+    """
+
+    def __init__(self, cursor, measurement):
+        self.cursor = cursor
+        self.measurement = measurement
+
+    def execute(self, sql, params=()):
+        start = time.time()
+        try:
+            return self.cursor.execute(sql, params)
+        finally:
+            self._count(start)
+
+    def executemany(self, sql, param_list):
+        start = time.time()
+        try:
+            return self.cursor.executemany(sql, param_list)
+        finally:
+            self._count(start)
+
+    def _count(self, start):
+        self.measurement.queries += 1
+        self.measurement.query_seconds += time.time() - start
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+
+def _counting_cursor(connection, debug, measurement):
+    """
+    Returns the make_debug_cursor of connection while a command is
+    measured. The debug cursor of Django is kept if debug is True, i.e.
+    with DEBUG on.
+    """
+    make_debug_cursor = connection.make_debug_cursor
+
+    def make_cursor(cursor):
+        if debug:
+            cursor = make_debug_cursor(cursor)
+        else:
+            cursor = util.CursorWrapper(cursor, connection)
+        return CountingCursor(cursor, measurement)
+    return make_cursor
+
+
+@contextmanager
+def measure(command):
+    """
+    Measures the command executed inside the with block. The cursors of
+    the connections are wrapped in a CountingCursor for the duration of
+    the block.
+    """
+    measurement = Measurement(command)
+    if not ENABLED:
+        yield measurement
+        return
+    saved = []
+    for connection in connections.all():
+        use_debug_cursor = connection.use_debug_cursor
+        debug = use_debug_cursor or (use_debug_cursor is None and
+                                     settings.DEBUG)
+        saved.append((connection, use_debug_cursor,
+                      connection.__dict__.get('make_debug_cursor')))
+        # Django asks make_debug_cursor for the cursors only if
+        # use_debug_cursor is set
+        connection.make_debug_cursor = _counting_cursor(connection, debug,
+                                                        measurement)
+        connection.use_debug_cursor = True
+    _local.measurement = measurement
+    start = time.time()
+    try:
+        yield measurement
+    finally:
+        measurement.duration = time.time() - start
+        _local.measurement = None
+        for connection, use_debug_cursor, make_debug_cursor in saved:
+            connection.use_debug_cursor = use_debug_cursor
+            if make_debug_cursor is None:
+                del connection.make_debug_cursor
+            else:
+                connection.make_debug_cursor = make_debug_cursor
+        registry.observe(measurement)
+
+
+def add_bytes(read=0, written=0):
+    """
+    Adds the bytes read from or written to the storage to the command
+    being measured in this thread, if any
+    """
+    measurement = getattr(_local, 'measurement', None)
+    if measurement is not None:
+        measurement.bytes_read += read
+        measurement.bytes_written += written
+
+
+def response_size(response):
+    """
+    Size of the body of response, without consuming streamed contents
+    """
+    if response.has_header('Content-Length'):
+        return int(response['Content-Length'])
+    if (getattr(response, 'streaming', False) or
+            getattr(response, '_base_content_is_iter', False)):
+        return 0
+    return len(response.content)
+
+
+def sampled():
+    """
+    True if the current command has to be logged, see DEBUG_SAMPLE_RATE
+    """
+    return DEBUG_SAMPLE_RATE > 0 and random.random() < DEBUG_SAMPLE_RATE
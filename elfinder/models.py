@@ -1,14 +1,24 @@
 import mimetypes
 import os
+import threading
 import time
-import Image
-from django.contrib.auth.models import Permission, User
+import simplejson as json
+from datetime import datetime
+from django.contrib.auth.models import User
 from django.conf import settings
-from django.db import models
+from django.core.exceptions import ValidationError
+from contextlib import contextmanager
+from functools import partial, wraps
+from django.db import IntegrityError, connections, models, router, \
+    transaction
+from django.db.models import Count, F, signals
 from django.utils.translation import ugettext as _
 from model_utils.fields import AutoCreatedField, AutoLastModifiedField, Choices
 from model_utils.managers import InheritanceManager
-from elfinder import utils as elutils
+from elfinder import imaging, pools, utils as elutils
+from elfinder.permissions import get_resolver
+from elfinder.storage import get_file_storage
+from elfinder.uploads import StagedFile
 
 import logging
 
@@ -32,20 +42,16 @@ class INodeOptions(object):
         # add basic file/folder permissions functions
         if self.base_permissions:
             for perm in cls.PERMISSIONS:
-                def func(self, user):
-                    permission = Permission.objects.get(
-                        codename='%s_%s' % (perm,
-                                            cls._meta.verbose_name.lower())
-                    )
-                    # superuser can everything
-                    if isinstance(user, User):
-                        return (user.is_superuser or
-                                user.has_perm(permission, cls))
-                    return False
-                setattr(cls, 'has_%s_permission' % perm, func)
+                setattr(cls, 'has_%s_permission' % perm,
+                        self.permission_function(cls, perm))
         for mimetype in self.mimetypes:
             INode.MIMETYPES[mimetype] = cls
 
+    def permission_function(self, cls, perm):
+        def func(self, user):
+            return get_resolver(user).has_perm(perm, cls)
+        return func
+
 class INodeBase(models.base.ModelBase):
 
     def __new__(cls, name, bases, attrs):
@@ -55,14 +61,293 @@ class INodeBase(models.base.ModelBase):
         return new_class
 
 
+def validate_name(name):
+    """
+    Rejects the names that cannot be a component of a path
+    """
+    if '/' in name or name in ('.', '..'):
+        raise ValidationError(_('%s is not a valid name') % name)
+
+
+def parse_tree_path(tree_path):
+    """
+    Returns the list of primary keys stored in a materialized path
+    """
+    return [int(pk) for pk in tree_path.strip('/').split('/') if pk]
+
+
+def listing_ids(tree_path):
+    """
+    Primary keys of the folders whose responses show the inode at
+    tree_path, the ones touched when it changes: the inode itself, as the
+    cwd of open, its parent, that lists it, and the parent of the parent,
+    that tells whether the parent has subfolders
+    """
+    return parse_tree_path(tree_path)[-3:]
+
+
+def db_alias():
+    """
+    Alias of the database of the inodes, chosen by the routers (see
+    elfinder.volumes.VolumeRouter)
+    """
+    return router.db_for_write(INode)
+
+
+def get_connection():
+    return connections[db_alias()]
+
+
+# functions waiting for the end of the atomic blocks of the thread, one
+# list for every open block
+_pending = threading.local()
+
+
+@contextmanager
+def atomic():
+    """
+    Runs the block in a transaction on the database of the inodes. A block
+    inside another one runs in a savepoint of the outer transaction: a
+    nested transaction.commit_on_success would commit the whole outer
+    transaction when it exits. The functions given to on_commit run when
+    the outermost block succeeds, and are dropped if their block fails.
+    """
+    using = db_alias()
+    stack = _pending.__dict__.setdefault('stack', [])
+    stack.append([])
+    try:
+        if not transaction.is_managed(using=using):
+            with transaction.commit_on_success(using=using):
+                yield
+        else:
+            sid = transaction.savepoint(using=using)
+            try:
+                yield
+            except:
+                transaction.savepoint_rollback(sid, using=using)
+                raise
+            transaction.savepoint_commit(sid, using=using)
+    except:
+        stack.pop()
+        raise
+    funcs = stack.pop()
+    if stack:
+        stack[-1].extend(funcs)
+    else:
+        for func in funcs:
+            func()
+
+
+def on_commit(func):
+    """
+    Calls func when the atomic block running this code succeeds, right
+    away outside of atomic blocks. Used for the changes that cannot be
+    rolled back, i.e. deleting stored contents.
+    """
+    stack = getattr(_pending, 'stack', None)
+    if stack:
+        stack[-1].append(func)
+    else:
+        func()
+
+
+def commit_on_success(func):
+    """
+    Runs func in atomic(), on the database of the inodes when func is
+    called
+    """
+    @wraps(func)
+    def inner(*args, **kwargs):
+        with atomic():
+            return func(*args, **kwargs)
+    return inner
+
+
 class INodeManager(InheritanceManager):
+    """
+    Manager of the inodes in the tree, the ones removed and waiting for
+    the garbage collector are seen only if include_deleted is True
+    """
+
+    def __init__(self, include_deleted=False):
+        super(INodeManager, self).__init__()
+        self.include_deleted = include_deleted
+
+    def get_query_set(self):
+        qs = super(INodeManager, self).get_query_set()
+        if not self.include_deleted:
+            qs = qs.filter(deleted=False)
+        return qs
 
     def get_hash(self, target_hash):
         """
         In this implementation hash is the inode primary key,
         but this method hides the magic.
         """
-        return self.get_subclass(pk=target_hash)
+        return self.get_subclass(pk=self._parse_hash(target_hash))
+
+    def get_hashes(self, target_hashes):
+        """
+        Like get_hash for many hashes, with a query for every 500 of them.
+        The inodes are returned in the order of target_hashes.
+        """
+        pks = [self._parse_hash(target_hash) for target_hash in target_hashes]
+        inodes = {}
+        for batch in elutils.chunked(set(pks), 500):
+            for inode in self.select_subclasses().filter(pk__in=batch):
+                inodes[inode.pk] = inode
+        try:
+            return [inodes[pk] for pk in pks]
+        except KeyError, e:
+            raise self.model.DoesNotExist('INode %s does not exist' % e)
+
+    def _parse_hash(self, target_hash):
+        # a malformed hash is a missing inode, not a server error
+        try:
+            return int(target_hash)
+        except (TypeError, ValueError):
+            raise self.model.DoesNotExist('INode %s does not exist' %
+                                          target_hash)
+
+    def search(self, q, root=None):
+        """
+        Returns the inodes whose name contains q, looking for candidates in
+        the trigrams index. Exact and prefix matches are returned first.
+        Queries shorter than a trigram have no candidates in the index, they
+        only match the names starting with q. If root is given, only its
+        descendants are returned.
+        """
+        q = q.lower()
+        trigrams = elutils.get_trigrams(q)
+        if trigrams:
+            candidates = NameTrigram.objects.filter(
+                trigram__in=trigrams).values('inode').annotate(
+                matches=Count('trigram')).filter(
+                matches=len(trigrams)).values('inode')
+            inodes = self.filter(name__icontains=q, pk__in=candidates)
+        else:
+            inodes = self.filter(name__istartswith=q)
+        if root is not None:
+            inodes = inodes.filter(
+                tree_path__startswith=root.tree_path).exclude(pk=root.pk)
+        qn = get_connection().ops.quote_name
+        name = '%s.%s' % (qn(INode._meta.db_table), qn('name'))
+        return inodes.extra(
+            select={'rank': 'CASE WHEN LOWER(%s) = %%s THEN 0 '
+                            'WHEN LOWER(%s) LIKE %%s THEN 1 '
+                            'ELSE 2 END' % (name, name)},
+            select_params=(q, q + '%')).order_by('rank', 'name')
+
+    def move_subtree(self, old_path, new_path, level_delta):
+        """
+        Rewrite the materialized path of all the descendants of old_path
+        with a single UPDATE, used when a folder is moved.
+        """
+        self.move_subtrees([old_path], old_path, new_path, level_delta)
+
+    def move_subtrees(self, old_paths, old_prefix, new_prefix, level_delta):
+        """
+        Like move_subtree for the subtrees at old_paths, all starting with
+        old_prefix, that is replaced by new_prefix in a single UPDATE.
+        """
+        connection = get_connection()
+        qn = connection.ops.quote_name
+        cursor = connection.cursor()
+        cursor.execute(
+            'UPDATE %s SET %s = REPLACE(%s, %%s, %%s), %s = %s + %%s '
+            'WHERE %s' % (
+                qn(INode._meta.db_table), qn('tree_path'), qn('tree_path'),
+                qn('level'), qn('level'), ' OR '.join(
+                    ['%s LIKE %%s' % qn('tree_path')] * len(old_paths))),
+            [old_prefix, new_prefix, level_delta] +
+            [old_path + '%' for old_path in old_paths])
+        transaction.commit_unless_managed(using=connection.alias)
+
+    @commit_on_success
+    def rebuild_tree(self, batch_size=1000):
+        """
+        Compute again tree_path and level of all the inodes, walking the
+        tree one level at a time. The children of batch_size parents are
+        read with one query and updated with one executemany. Returns the
+        number of updated inodes.
+        """
+        connection = get_connection()
+        qn = connection.ops.quote_name
+        sql = 'UPDATE %s SET %s = %%s, %s = %%s WHERE %s = %%s' % (
+            qn(INode._meta.db_table), qn('tree_path'), qn('level'), qn('id'))
+        count, level = 0, 0
+        # paths of the inodes of the previous level
+        parents = {None: '/'}
+        while parents:
+            paths = {}
+            for batch in elutils.chunked(parents, batch_size):
+                if batch == [None]:
+                    nodes = INode.objects.filter(parent__isnull=True)
+                else:
+                    nodes = INode.objects.filter(parent__in=batch)
+                rows = []
+                for pk, parent_id in nodes.values_list('pk', 'parent'):
+                    paths[pk] = '%s%s/' % (parents[parent_id], pk)
+                    rows.append((paths[pk], level, pk))
+                for rows_batch in elutils.chunked(rows, batch_size):
+                    connection.cursor().executemany(sql, rows_batch)
+            count += len(paths)
+            parents = paths
+            level += 1
+        return count
+
+
+class FolderNodeManager(INodeManager):
+
+    def update_aggregates(self, pks, total_bytes, total_items):
+        """
+        Add total_bytes and total_items to the aggregates of the pks folders
+        """
+        if pks and (total_bytes or total_items):
+            self.filter(pk__in=pks).update(
+                total_bytes=F('total_bytes') + total_bytes,
+                total_items=F('total_items') + total_items)
+
+    def touch(self, pks):
+        """
+        Increment the version of the pks folders, the responses cached for
+        them are not used anymore. Only the folders whose responses change
+        are touched (see listing_ids), a write does not drop the responses
+        cached for the rest of the tree.
+        """
+        if pks:
+            self.filter(pk__in=pks).update(version=F('version') + 1)
+
+    @commit_on_success
+    def rebuild_aggregates(self, batch_size=1000):
+        """
+        Compute again the aggregates of all the folders reading the inodes
+        in batches of batch_size. Returns the number of updated folders.
+        """
+        totals = {}
+        last_pk = 0
+        while True:
+            batch = list(INode.objects.filter(pk__gt=last_pk).order_by(
+                'pk').values_list('pk', 'tree_path', 'data_size')[:batch_size])
+            if not batch:
+                break
+            for pk, tree_path, data_size in batch:
+                for ancestor in parse_tree_path(tree_path)[:-1]:
+                    total = totals.setdefault(ancestor, [0, 0])
+                    total[0] += data_size
+                    total[1] += 1
+            last_pk = batch[-1][0]
+        count = 0
+        folders = self.values_list('pk', 'total_bytes', 'total_items')
+        for pk, old_bytes, old_items in folders.order_by('pk').iterator():
+            total_bytes, total_items = totals.get(pk, (0, 0))
+            # the cached responses of the folders that changed are dropped
+            if (total_bytes, total_items) != (old_bytes, old_items):
+                self.filter(pk=pk).update(total_bytes=total_bytes,
+                                          total_items=total_items,
+                                          version=F('version') + 1)
+            count += 1
+        return count
 
 
 class INode(models.Model):
@@ -85,8 +370,12 @@ class INode(models.Model):
     # dictionary filled at runtime with 'mimetype': ModelClass that handle
     # the upload
     MIMETYPES = {}
+    # columns changed only by the UPDATEs of the managers, see
+    # _reload_denormalized
+    DENORMALIZED_FIELDS = ()
 
-    name = models.CharField(_('name'), max_length=256)
+    name = models.CharField(_('name'), max_length=256,
+                            validators=[validate_name])
     itype = models.CharField(_('type'), max_length=10, null=True,
                              choices=TYPES)
     parent = models.ForeignKey('self', null=True, blank=True,
@@ -97,13 +386,33 @@ class INode(models.Model):
                             },
                             default=ROOT['PK']
     )
-    mime = models.CharField(max_length=30, blank=True, null=True)
+    # materialized path of primary keys from the root to the node itself,
+    # i.e. '/1/5/23/', used to fetch ancestors and descendants in one query.
+    # A text column, so that the depth of the tree has no limit. The index
+    # is created by syncdb on SQLite and PostgreSQL (where a btree entry is
+    # at most ~2700 bytes, a few hundred levels). MySQL cannot index a text
+    # column without a prefix length: there syncdb fails on it, create the
+    # tables from the output of manage.py sqlall elfinder with the index
+    # changed to a prefix one, i.e. (tree_path(255)).
+    tree_path = models.TextField(_('tree path'), blank=True, db_index=True,
+                                 editable=False)
+    level = models.PositiveIntegerField(_('level'), default=0,
+                                        db_index=True, editable=False)
+    mime = models.CharField(max_length=255, blank=True, null=True)
+    # size of the file content, 0 for folders. It is stored in the inode
+    # table so that listings can read and sort it without joins
+    data_size = models.BigIntegerField(_('data size'), default=0)
+    # removed inodes are only marked, rows and contents are purged later
+    # by the purge_deleted_inodes command
+    deleted = models.BooleanField(_('deleted'), default=False,
+                                  db_index=True, editable=False)
     owner = models.ForeignKey('auth.user', related_name='%(class)s_list',
                               verbose_name=_('owner'))
     created = AutoCreatedField(_('created'))
     modified = AutoLastModifiedField(_('modified'))
 
     objects = INodeManager()
+    all_objects = INodeManager(include_deleted=True)
     
     class Meta:
         verbose_name = _('INode')
@@ -128,10 +437,78 @@ class INode(models.Model):
         # set type of the inode
         if hasattr(self, 'TYPE'):
             self.itype = self.TYPE
+        # parent and name stored in the db, to know when tree_path and
+        # search index must be updated
+        self._tree_parent_id = self.parent_id
+        self._indexed_name = self.name
+
+    def clean(self):
+        if (self.pk and self.parent_id and
+                '/%s/' % self.pk in self.parent.tree_path):
+            raise ValidationError(_('A folder cannot be moved inside itself'))
 
     def save(self, *args, **kwargs):
         self.full_clean()
-        return super(INode, self).save(*args, **kwargs)
+        created = self.pk is None
+        with atomic():
+            if not created:
+                self._reload_denormalized()
+            result = super(INode, self).save(*args, **kwargs)
+            old_ancestors = set()
+            touched = set(listing_ids(self.tree_path))
+            if created or self.parent_id != self._tree_parent_id:
+                old_ancestors = set(self.ancestor_ids)
+                self._update_tree_path(created)
+                new_ancestors = set(self.ancestor_ids)
+                total_bytes, total_items = self.aggregates
+                FolderNode.objects.update_aggregates(
+                    old_ancestors - new_ancestors, -total_bytes, -total_items)
+                FolderNode.objects.update_aggregates(
+                    new_ancestors - old_ancestors, total_bytes, total_items)
+            if created or self.name != self._indexed_name:
+                NameTrigram.objects.index(self)
+            FolderNode.objects.touch(
+                touched.union(listing_ids(self.tree_path)))
+        return result
+
+    def delete(self, *args, **kwargs):
+        with atomic():
+            self._reload_denormalized()
+            total_bytes, total_items = self.aggregates
+            FolderNode.objects.update_aggregates(
+                self.ancestor_ids, -total_bytes, -total_items)
+            FolderNode.objects.touch(listing_ids(self.tree_path))
+            super(INode, self).delete(*args, **kwargs)
+
+    def _reload_denormalized(self):
+        """
+        Reads again, locking the row, the DENORMALIZED_FIELDS. Model.save
+        writes the whole row: the values loaded earlier in the request
+        would undo the updates committed in the meantime by the requests
+        working in the subtree.
+        """
+        if not self.DENORMALIZED_FIELDS:
+            return
+        rows = self.__class__._base_manager.select_for_update().filter(
+            pk=self.pk).values(*self.DENORMALIZED_FIELDS)
+        for row in rows:
+            for name, value in row.items():
+                setattr(self, name, value)
+
+    def _update_tree_path(self, created):
+        old_path, old_level = self.tree_path, self.level
+        if self.parent_id:
+            self.tree_path = '%s%s/' % (self.parent.tree_path, self.pk)
+            self.level = self.parent.level + 1
+        else:
+            self.tree_path = '/%s/' % self.pk
+            self.level = 0
+        INode.objects.filter(pk=self.pk).update(tree_path=self.tree_path,
+                                                level=self.level)
+        if not created:
+            INode.objects.move_subtree(old_path, self.tree_path,
+                                       self.level - old_level)
+        self._tree_parent_id = self.parent_id
     
     @property
     def hash(self):
@@ -139,20 +516,31 @@ class INode(models.Model):
 
     @property
     def phash(self):
-        if self.parent:
-            return self.parent.pk
-        return ''
+        return self.parent_id or ''
 
     @property
     def size(self):
         return 0
+
+    @property
+    def aggregates(self):
+        """
+        Bytes and items this inode adds to the aggregates of its ancestors
+        """
+        return 0, 1
     
     @property
     def path(self):
-        p = self.name
-        while self.parent:
-            p = '/'.join([self.parent.name, p])
-        return '/%s' % p
+        names = self.get_ancestors(include_self=True).values_list('name',
+                                                                   flat=True)
+        return '/%s' % '/'.join(names)
+
+    @property
+    def ancestor_ids(self):
+        """
+        Primary keys of the ancestors, from the root to the parent
+        """
+        return parse_tree_path(self.tree_path)[:-1]
 
     def to_timestamp(self, datetime):
         return time.mktime(datetime.timetuple())
@@ -178,12 +566,17 @@ class INode(models.Model):
         return INode.objects.filter(itype=INode.file)
 
     def get_ancestors(self, include_self=False):
-        ancestors = []
-        curr_node = self if include_self else self.parent
-        while curr_node:
-            ancestors.insert(0, curr_node) # insert at the beggining
-            curr_node = curr_node.parent
-        return ancestors
+        pks = self.ancestor_ids
+        if include_self:
+            pks.append(self.pk)
+        return INode.objects.filter(pk__in=pks).order_by('level')
+
+    def get_descendants(self, include_self=False):
+        descendants = INode.objects.filter(
+            tree_path__startswith=self.tree_path)
+        if not include_self:
+            descendants = descendants.exclude(pk=self.pk)
+        return descendants
 
     def get_siblings(self):
         siblings = []
@@ -191,11 +584,12 @@ class INode(models.Model):
             siblings = INode.objects.filter(parent=self.parent)
         return siblings
 
+    @commit_on_success
     def clone(self, **kwargs):
         initial = {}
         for f in self._meta.fields:
             if (isinstance(f, models.AutoField) or
-                    isinstance(f, models.OneToOneField)):
+                    isinstance(f, models.OneToOneField) or not f.editable):
                 continue
             key = f.name
             if isinstance(f, models.FileField):
@@ -203,7 +597,210 @@ class INode(models.Model):
             else:
                 base = getattr(self, f.name)
             initial[key] = kwargs.get(key, base)
-        return self.__class__.objects.create(**initial)
+        clone = self.__class__.objects.create(**initial)
+        # the copy shares the contents of the original
+        names = [getattr(clone, f.name).name for f in self._meta.fields
+                 if isinstance(f, models.FileField) and getattr(clone, f.name)]
+        if names:
+            Blob.objects.acquire(names, untracked_refs=1)
+        return clone
+
+
+class NameTrigramManager(models.Manager):
+
+    def index(self, inode):
+        """
+        Replace the trigrams of inode with the ones of its current name
+        """
+        self.filter(inode=inode.pk).delete()
+        self.bulk_create([
+            NameTrigram(inode_id=inode.pk, trigram=trigram)
+            for trigram in elutils.get_trigrams(inode.name)
+        ])
+        inode._indexed_name = inode.name
+
+    @commit_on_success
+    def rebuild(self, batch_size=1000):
+        """
+        Index again the names of all the inodes, reading them in batches of
+        batch_size. Returns the number of indexed inodes.
+        """
+        self.all().delete()
+        count, last_pk = 0, 0
+        while True:
+            batch = list(INode.objects.filter(pk__gt=last_pk).order_by(
+                'pk').values_list('pk', 'name')[:batch_size])
+            if not batch:
+                break
+            self.bulk_create([
+                NameTrigram(inode_id=pk, trigram=trigram)
+                for pk, name in batch
+                for trigram in elutils.get_trigrams(name)
+            ])
+            count += len(batch)
+            last_pk = batch[-1][0]
+        return count
+
+
+class NameTrigram(models.Model):
+    """
+    Search index of the inode names: every inode has a row for each
+    distinct trigram of its lowercase name
+    """
+    inode = models.ForeignKey(INode, related_name='trigrams')
+    trigram = models.CharField(_('trigram'), max_length=3)
+
+    objects = NameTrigramManager()
+
+    class Meta:
+        unique_together = ('trigram', 'inode')
+
+
+class BlobManager(models.Manager):
+
+    def acquire(self, names, untracked_refs=0):
+        """
+        Add a reference to the contents stored with names, names may repeat.
+        Contents without a row are assumed to have untracked_refs references
+        (1 for files uploaded before reference counting was introduced).
+        """
+        counts = {}
+        for name in names:
+            counts[name] = counts.get(name, 0) + 1
+        with atomic():
+            tracked = set()
+            for batch in elutils.chunked(counts, 500):
+                tracked.update(self.filter(name__in=batch).values_list(
+                    'name', flat=True))
+            self._update_refs(tracked, counts, 1)
+            missing = [name for name in counts if name not in tracked]
+            if not self._insert(missing, counts, untracked_refs):
+                # rows created by another transaction in the meantime, i.e.
+                # the same content uploaded twice at the same time
+                for name in missing:
+                    if not self._insert([name], counts, untracked_refs):
+                        self._update_refs([name], counts, 1)
+
+    def _insert(self, names, counts, untracked_refs):
+        """
+        Creates the rows of names in a savepoint, returns False if one of
+        them exists already
+        """
+        try:
+            with atomic():
+                self.bulk_create([Blob(name=name,
+                                       refs=counts[name] + untracked_refs)
+                                  for name in names])
+        except IntegrityError:
+            return False
+        return True
+
+    def release(self, names, storage):
+        """
+        Drop a reference to the contents stored with names and delete from
+        storage the ones that are not referenced anymore, once the
+        transaction commits (see on_commit). Contents without a row (i.e.
+        shared by copies made before reference counting) or whose count
+        dropped to zero are deleted only if no file points to them anymore,
+        so a wrong count never loses data.
+        """
+        counts = {}
+        for name in names:
+            counts[name] = counts.get(name, 0) + 1
+        self._update_refs(counts, counts, -1)
+        alive = set()
+        for batch in elutils.chunked(counts, 500):
+            alive.update(self.filter(name__in=batch, refs__gt=0).values_list(
+                'name', flat=True))
+        unreferenced = [name for name in counts if name not in alive]
+        for batch in elutils.chunked(unreferenced, 500):
+            alive.update(FileNode.objects.filter(data__in=batch).values_list(
+                'data', flat=True))
+        dead = [name for name in unreferenced if name not in alive]
+        for batch in elutils.chunked(dead, 500):
+            self.filter(name__in=batch).delete()
+        # a rollback would restore the counts, not the contents
+        on_commit(partial(delete_contents, storage, dead))
+
+    def discard(self, names, storage):
+        """
+        Delete from storage the contents stored with names whose rows could
+        not be created. Content addressed storages return the name of a
+        content already stored, the ones with a row or a file pointing to
+        them are kept.
+        """
+        names = set(names)
+        used = set()
+        for batch in elutils.chunked(names, 500):
+            used.update(self.filter(name__in=batch).values_list(
+                'name', flat=True))
+            used.update(FileNode.objects.filter(data__in=batch).values_list(
+                'data', flat=True))
+        on_commit(partial(delete_contents, storage, names - used))
+
+    @commit_on_success
+    def rebuild(self, batch_size=1000):
+        """
+        Count again the references of all the contents from the files
+        pointing to them, creating the missing rows (i.e. for the files
+        uploaded or copied before reference counting was introduced).
+        Returns the number of contents.
+        """
+        self.all().delete()
+        count = 0
+        names = FileNode.objects.exclude(data='').values('data').annotate(
+            refs=Count('pk')).order_by('data')
+        for batch in elutils.chunked(names.values_list('data', 'refs'),
+                                     batch_size):
+            self.bulk_create([Blob(name=name, refs=refs)
+                              for name, refs in batch])
+            count += len(batch)
+        return count
+
+    def _update_refs(self, names, counts, sign):
+        # one UPDATE for all the names with the same count
+        by_count = {}
+        for name in names:
+            by_count.setdefault(counts[name], []).append(name)
+        for count, same_count in by_count.items():
+            for batch in elutils.chunked(same_count, 500):
+                self.filter(name__in=batch).update(
+                    refs=F('refs') + sign * count)
+
+
+def delete_contents(storage, names):
+    """
+    Deletes the contents stored with names, with their thumbnails
+    """
+    pools.io_map(partial(delete_content, storage), names)
+
+
+def delete_content(storage, name):
+    """
+    Deletes a content from storage together with its thumbnails, that are
+    shared by all the images pointing to the content
+    """
+    try:
+        path = storage.path(name)
+    except NotImplementedError:
+        path = None
+    storage.delete(name)
+    if path is not None:
+        imaging.delete_thumbnails(path)
+
+
+class Blob(models.Model):
+    """
+    Number of FileNode sharing the content stored with name, copies of a
+    file point to the same content until they are deleted
+    """
+    name = models.CharField(_('name'), max_length=256, unique=True)
+    refs = models.IntegerField(_('references'), default=0)
+
+    objects = BlobManager()
+
+    def __unicode__(self):
+        return self.name
 
 
 class FolderNode(INode):
@@ -211,8 +808,20 @@ class FolderNode(INode):
     Base folder node
     """
     TYPE = INode.TYPES.folder
+    DENORMALIZED_FIELDS = ('total_bytes', 'total_items', 'version')
 
-    objects = INodeManager()
+    # size and number of all the inodes in the subtree
+    total_bytes = models.BigIntegerField(_('total bytes'), default=0,
+                                         editable=False)
+    total_items = models.PositiveIntegerField(_('total items'), default=0,
+                                              editable=False)
+    # incremented whenever something changes in the subtree, see
+    # FolderNodeManager.touch. It only grows: a value already used would
+    # bring back the responses cached with it.
+    version = models.PositiveIntegerField(_('version'), default=0,
+                                          editable=False)
+
+    objects = FolderNodeManager()
 
     class Meta:
         verbose_name = _('Folder')
@@ -228,11 +837,11 @@ class FolderNode(INode):
 
     @property
     def total_size(self):
-        s = 0
-        # size from all subdirectories
-        for item in self.children.select_subclasses():
-            s += item.total_size
-        return s
+        return self.total_bytes
+
+    @property
+    def aggregates(self):
+        return self.total_bytes, self.total_items + 1
 
     def info(self, user):
         info = super(FolderNode, self).info(user)
@@ -247,8 +856,13 @@ class FileNode(INode):
     """
     TYPE = INode.TYPES.file
     
-    data = models.FileField(_('File'), max_length=256,
-                            upload_to=elutils.get_path_for_upload)
+    # indexed to find the files sharing a content, see BlobManager.release
+    data = models.FileField(_('File'), max_length=256, db_index=True,
+                            upload_to=elutils.get_path_for_upload,
+                            storage=get_file_storage())
+    # last modification of the file content
+    data_mtime = models.DateTimeField(_('data modified'), blank=True,
+                                      null=True)
 
     class Meta:
         verbose_name = _('File')
@@ -259,19 +873,39 @@ class FileNode(INode):
         mimetypes = ['application/octet-stream']
 
 
-    def __init__(self, *args, **kwargs):
-        super(FileNode, self).__init__(*args, **kwargs)
-        if hasattr(self.data, 'name'):
+    def save(self, *args, **kwargs):
+        # new content is being uploaded, record its metadata
+        new_content = self.data and not self.data._committed
+        if new_content:
+            self.data_size = self.data.size
+            self.data_mtime = datetime.now()
             self.mime = mimetypes.guess_type(self.data.name)[0]
+        with atomic():
+            super(FileNode, self).save(*args, **kwargs)
+            if new_content:
+                Blob.objects.acquire([self.data.name])
+
+    def refresh_metadata(self):
+        """
+        Read again size and modification time of the content from storage
+        """
+        self.data_size = self.data.size
+        self.data_mtime = self.data.storage.modified_time(self.data.name)
+        # content addressed names have no extension, guess from the node
+        self.mime = mimetypes.guess_type(self.name)[0]
 
     @property
     def size(self):
-        return self.data.size
+        return self.data_size
 
     @property
     def total_size(self):
         return self.size
 
+    @property
+    def aggregates(self):
+        return self.size, 1
+
     @property
     def base_path(self):
         p = self.path
@@ -285,6 +919,8 @@ class FileNode(INode):
     def info(self, user):
         info = super(FileNode, self).info(user)
         info['mime'] = self.mime
+        if self.data_mtime:
+            info['ts'] = self.to_timestamp(self.data_mtime)
         return info
 
 
@@ -296,21 +932,12 @@ class ImageNode(FileNode):
     height = models.IntegerField(_('height'), blank=True, null=True)
 
     def save(self, *args, **kwargs):
-        # analyze image to find characteristics when created
-        if not self.pk and not os.path.exists(self.data.name):
-            try:
-                image = Image.open(self.data)
-                self.width, self.height = image.size
-                image.thumbnail((128, 128))
-                thumbname = elutils.get_path_for_upload(
-                    self, '128x128_%s'% self.data, rel_path='thumbs')
-                image.save(thumbname, 'JPEG')
-                # get a valid url starting from a file system path
-                self.thumb = elutils.get_url(thumbname)
-            except Exception as e:
-                logging.error(e.message)
-                logging.error('%s is not a valid image' % self.data.name)
+        new_content = self.data and not self.data._committed
         super(ImageNode, self).save(*args, **kwargs)
+        # dimensions and thumbnails are computed by the image workers
+        if new_content:
+            ImageJob.objects.create(image=self,
+                                    action=ImageJob.ACTIONS.thumbnail)
 
     class Meta:
         verbose_name = _('Image')
@@ -323,6 +950,127 @@ class ImageNode(FileNode):
         inf = super(ImageNode, self).info(user=user)
         if self.width and self.height:
             inf['dim'] = '%sx%s' % (self.width, self.height)
-        inf['tmb'] = self.thumb
+        if self.thumb:
+            inf['tmb'] = self.thumb
         return inf
-        
+
+
+class ImageJobManager(models.Manager):
+
+    def claim(self, limit):
+        """
+        Mark as running at most limit pending jobs and return them. The
+        jobs of an image run one at a time and in order, so that every edit
+        starts from the content left by the previous one.
+        """
+        jobs = []
+        images = set(self.filter(status=ImageJob.STATUS.running).values_list(
+            'image', flat=True))
+        pending = self.filter(status=ImageJob.STATUS.pending)
+        for job in pending.select_related('image').order_by('pk')[:limit]:
+            if job.image_id in images:
+                continue
+            images.add(job.image_id)
+            # modified is when the job started, see process_image_jobs
+            if self.filter(pk=job.pk, status=ImageJob.STATUS.pending).update(
+                    status=ImageJob.STATUS.running, modified=datetime.now(),
+                    attempts=F('attempts') + 1):
+                jobs.append(job)
+        return jobs
+
+
+class ImageJob(models.Model):
+    """
+    Image processing requested by the web requests and executed in
+    background by the process_image_jobs command
+    """
+    ACTIONS = Choices(('thumbnail', _('thumbnail')), ('resize', _('resize')))
+    STATUS = Choices(('pending', _('pending')), ('running', _('running')),
+                     ('done', _('done')), ('failed', _('failed')))
+
+    image = models.ForeignKey(ImageNode, related_name='jobs')
+    action = models.CharField(_('action'), max_length=20, choices=ACTIONS)
+    # json encoded keyword arguments of the action
+    params = models.TextField(_('parameters'), default='{}')
+    status = models.CharField(_('status'), max_length=10, choices=STATUS,
+                              default=STATUS.pending, db_index=True)
+    attempts = models.PositiveIntegerField(_('attempts'), default=0)
+    error = models.TextField(_('error'), blank=True)
+    created = AutoCreatedField(_('created'))
+    modified = AutoLastModifiedField(_('modified'))
+
+    objects = ImageJobManager()
+
+    class Meta:
+        verbose_name = _('Image job')
+        verbose_name_plural = _('Image jobs')
+
+    def __unicode__(self):
+        return u'%s %s' % (self.action, self.image_id)
+
+    def payload(self):
+        """
+        Arguments passed to elfinder.imaging.run_job by the workers
+        """
+        return (self.pk, self.action, self.image.data.path,
+                json.loads(self.params))
+
+    def complete(self, result):
+        if self.action == ImageJob.ACTIONS.resize:
+            return self._replace_content(result)
+        ImageNode.objects.filter(pk=self.image_id).update(
+            width=result['width'], height=result['height'],
+            thumb=elutils.get_url(result['thumbs'][0]))
+        FolderNode.objects.touch(listing_ids(self.image.tree_path))
+        ImageJob.objects.filter(pk=self.pk).update(
+            status=ImageJob.STATUS.done, error='')
+
+    def _replace_content(self, result):
+        """
+        Points the image to the edited content staged by the worker. The
+        old content is released, as it may be shared by copies, and new
+        thumbnails are requested: the old thumbnails are deleted with the
+        old content, when no copy uses it anymore.
+        """
+        image = self.image
+        storage = image.data.storage
+        staged = StagedFile(open(result['staged'], 'rb'),
+                            os.path.basename(image.name))
+        try:
+            name = storage.save(
+                image._meta.get_field('data').generate_filename(
+                    image, image.name), staged)
+        finally:
+            staged.close()
+            if os.path.exists(result['staged']):
+                os.remove(result['staged'])
+        size = storage.size(name)
+        with atomic():
+            ImageNode.objects.filter(pk=image.pk).update(
+                data=name, data_size=size, data_mtime=datetime.now(),
+                width=result['width'], height=result['height'], thumb=None)
+            FolderNode.objects.update_aggregates(
+                image.ancestor_ids, size - image.data_size, 0)
+            FolderNode.objects.touch(listing_ids(image.tree_path))
+            Blob.objects.acquire([name])
+            Blob.objects.release([image.data.name], storage)
+            ImageJob.objects.create(image=image,
+                                    action=ImageJob.ACTIONS.thumbnail)
+            ImageJob.objects.filter(pk=self.pk).update(
+                status=ImageJob.STATUS.done, error='')
+
+    def fail(self, error):
+        logging.error('%s is not a valid image: %s' % (self.image_id, error))
+        ImageJob.objects.filter(pk=self.pk).update(
+            status=ImageJob.STATUS.failed, error=error)
+
+
+def release_file_data(sender, instance, **kwargs):
+    """
+    Drop the reference of a deleted file to its content
+    """
+    if instance.data:
+        Blob.objects.release([instance.data.name], instance.data.storage)
+
+signals.post_delete.connect(release_file_data, sender=FileNode,
+                            dispatch_uid='elfinder.release_file_data')
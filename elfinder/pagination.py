@@ -0,0 +1,104 @@
+"""
+Keyset pagination of the listings of open and list. A page is read
+following the index of its order (see sql/inode.sql) from the position
+after the last inode of the previous page, so every page costs the same
+whatever the size of the folder and of the pages before it, unlike
+OFFSET.
+
+The position is sent to the client as an opaque cursor, the urlsafe base64
+of the order and of the keys of the last inode returned.
+"""
+import base64
+import operator
+from datetime import datetime
+
+import simplejson as json
+from django.db.models import Q
+
+from elfinder import serializers
+
+# orders of the listings, with the columns read from the index: the last
+# one breaks the ties, names are unique in a folder
+SORT_KEYS = {
+    'name'    : ('name',),
+    'modified': ('modified', 'id'),
+    'size'    : ('data_size', 'id'),
+}
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+
+def parse_sort(sort):
+    """
+    Returns (column names, descending) of sort, i.e. 'name' or '-size'
+    """
+    sort = sort or 'name'
+    descending = sort.startswith('-')
+    if sort.lstrip('-') not in SORT_KEYS:
+        raise Exception('Invalid sort %s' % sort)
+    return SORT_KEYS[sort.lstrip('-')], descending
+
+
+def encode_cursor(sort, row):
+    keys, _ = parse_sort(sort)
+    values = [row[key].strftime(DATETIME_FORMAT)
+              if isinstance(row[key], datetime) else row[key]
+              for key in keys]
+    return base64.urlsafe_b64encode(json.dumps([sort] + values)).rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Returns (sort, values of the keys) of cursor
+    """
+    try:
+        cursor = str(cursor)
+        values = json.loads(base64.urlsafe_b64decode(
+            cursor + '=' * (-len(cursor) % 4)))
+        sort, values = values[0], values[1:]
+        keys, _ = parse_sort(sort)
+        if len(values) != len(keys):
+            raise ValueError
+        values = [datetime.strptime(value, DATETIME_FORMAT)
+                  if key == 'modified' else value
+                  for key, value in zip(keys, values)]
+    except (TypeError, ValueError, IndexError, UnicodeError):
+        raise Exception('Invalid cursor %s' % cursor)
+    return sort, values
+
+
+def _after(keys, values, descending):
+    """
+    The condition of the rows after values in the order of keys, as
+    (k1 > v1) OR (k1 = v1 AND k2 > v2) OR ...
+    """
+    lookup = 'lt' if descending else 'gt'
+    conditions = []
+    for i, key in enumerate(keys):
+        condition = dict(zip(keys[:i], values[:i]))
+        condition['%s__%s' % (key, lookup)] = values[i]
+        conditions.append(Q(**condition))
+    return reduce(operator.or_, conditions)
+
+
+def page(queryset, limit, sort=None, cursor=None):
+    """
+    Returns the rows of info_values of the page of queryset, an INode
+    queryset, after cursor (from the first inode if None) and the cursor
+    of the next page, None after the last page. The order of a cursor wins
+    over sort.
+    """
+    if limit < 1:
+        raise Exception('Invalid limit %s' % limit)
+    if cursor:
+        sort, values = decode_cursor(cursor)
+    sort = sort or 'name'
+    keys, descending = parse_sort(sort)
+    if cursor:
+        queryset = queryset.filter(_after(keys, values, descending))
+    queryset = queryset.order_by(*[('-' if descending else '') + key
+                                   for key in keys])
+    rows = list(serializers.info_values(queryset)[:limit + 1])
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(sort, rows[-1])
@@ -0,0 +1,62 @@
+from hashlib import md5
+
+from django.contrib.auth.models import User
+
+
+class PermissionResolver(object):
+    """
+    Resolves the inode permissions of a user. The effective permissions of
+    the user are loaded the first time they are needed and then kept for the
+    lifetime of the resolver, so that checks on many inodes cost no queries.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self._perms = None
+
+    @property
+    def perms(self):
+        if self._perms is None:
+            self._perms = self.user.get_all_permissions()
+        return self._perms
+
+    def has_perm(self, perm, klass):
+        if not isinstance(self.user, User):
+            return False
+        # superuser can everything
+        if self.user.is_superuser:
+            return True
+        if not self.user.is_active:
+            return False
+        # same codename created by elfinder_create_permissions
+        codename = '%s.%s_%s' % (klass._meta.app_label, perm,
+                                 klass._meta.verbose_name.lower())
+        return codename in self.perms
+
+    @property
+    def fingerprint(self):
+        """
+        Digest of the permissions of the user, the same for users that can
+        do the same things. Used in the keys of the cached responses.
+        """
+        if not isinstance(self.user, User):
+            return 'anonymous'
+        if self.user.is_superuser:
+            return 'superuser'
+        if not self.user.is_active:
+            return 'inactive'
+        return md5(','.join(sorted(self.perms))).hexdigest()
+
+
+def get_resolver(user):
+    """
+    Returns the resolver of the user. It is stored on the user object, that
+    is created for each request, so permissions are loaded once per request.
+    """
+    if user is None:
+        return PermissionResolver(user)
+    resolver = getattr(user, '_elfinder_resolver', None)
+    if resolver is None:
+        resolver = PermissionResolver(user)
+        user._elfinder_resolver = resolver
+    return resolver
@@ -0,0 +1,44 @@
+"""
+Threads for the blocking calls to storage and filesystem of a single
+request, i.e. the stat of the entries of a big directory on a network share
+or the contents written by extract. The calls overlap their I/O waits, the
+request still waits for all of them: this makes one slow command faster,
+it does not free the worker serving the request for other requests. The
+transfers of file and upload run in the worker as any other command, the
+number of concurrent transfers is the one of the server workers: hand the
+downloads to the web server with the 'x-sendfile' or 'x-accel-redirect'
+file_delivery of the drivers to free the workers.
+
+Every call of io_map has its own threads, at most IO_THREADS, and stops
+them before returning, so the work of a request never queues behind the
+work of another one.
+
+The functions run in the threads must not use the ORM, the database
+connections are per thread and the transaction of the request would not
+include their queries.
+"""
+from multiprocessing.pool import ThreadPool
+
+from django.conf import settings
+
+# threads of every io_map call, 0 runs everything in the calling thread
+IO_THREADS = getattr(settings, 'ELFINDER_IO_THREADS', 8)
+
+
+def io_map(func, items, chunksize=1):
+    """
+    Returns [func(item) for item in items], with the calls running in at
+    most IO_THREADS threads. The first exception raised by func is raised
+    again.
+    """
+    items = list(items)
+    chunks = (len(items) + chunksize - 1) // chunksize
+    # a single chunk would run in a single thread anyway
+    if IO_THREADS < 1 or chunks < 2:
+        return map(func, items)
+    pool = ThreadPool(min(IO_THREADS, chunks))
+    try:
+        return pool.map(func, items, chunksize)
+    finally:
+        pool.close()
+        pool.join()
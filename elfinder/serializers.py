@@ -0,0 +1,94 @@
+"""
+Informations of many inodes in the format of elFinder, read with a single
+values() query that joins the subclass tables, without creating model
+instances. 'dirs' comes from an EXISTS subquery and 'phash' from the
+parent_id column, so a listing costs the same queries whatever its size.
+
+Permissions are checked once for every class, as INode.has_perm does:
+subclasses that check permissions on single instances must use info().
+"""
+import time
+
+from django.db.models.query import ValuesQuerySet
+
+from elfinder.models import FileNode, FolderNode, ImageNode, INode, \
+    get_connection
+
+INFO_FIELDS = (
+    'id', 'name', 'parent', 'mime', 'data_size', 'modified', 'itype',
+    'filenode__data_mtime', 'filenode__imagenode__filenode_ptr',
+    'filenode__imagenode__width', 'filenode__imagenode__height',
+    'filenode__imagenode__thumb',
+)
+
+PERMISSIONS = (('read', 'read'), ('write', 'write'), ('rm', 'remove'))
+
+
+def _dirs_sql():
+    qn = get_connection().ops.quote_name
+    return ('EXISTS (SELECT 1 FROM %(table)s %(child)s '
+            'WHERE %(child)s.%(parent)s = %(table)s.%(id)s '
+            'AND %(child)s.%(itype)s = %%s AND %(child)s.%(deleted)s = %%s)'
+            % {'table': qn(INode._meta.db_table), 'child': qn('child'),
+               'parent': qn('parent_id'), 'id': qn('id'),
+               'itype': qn('itype'), 'deleted': qn('deleted')})
+
+
+def info_values(queryset):
+    """
+    Returns the values() of an INode queryset needed by iter_infos. It can
+    still be sliced, but not filtered.
+    """
+    queryset = queryset.extra(select={'dirs': _dirs_sql()},
+                              select_params=(INode.TYPES.folder, False))
+    return queryset.values(*(INFO_FIELDS +
+                             tuple(queryset.query.extra_select)))
+
+
+def iter_infos(queryset, user, root=None):
+    """
+    Yields the informations of the inodes of queryset, an INode queryset,
+    the result of info_values or a list of its rows. root has no parent for
+    elFinder.
+    """
+    if isinstance(queryset, list):
+        rows = iter(queryset)
+    else:
+        if not isinstance(queryset, ValuesQuerySet):
+            queryset = info_values(queryset)
+        rows = queryset.iterator()
+    perms = {}
+    for row in rows:
+        if row['itype'] == INode.TYPES.folder:
+            klass = FolderNode
+        elif row['filenode__imagenode__filenode_ptr'] is not None:
+            klass = ImageNode
+        else:
+            klass = FileNode
+        if klass not in perms:
+            node = klass()
+            perms[klass] = dict((key, node.has_perm(perm, user))
+                                for key, perm in PERMISSIONS)
+        ts = row['filenode__data_mtime'] or row['modified']
+        info = {
+            'name'  : row['name'],
+            'hash'  : row['id'],
+            'phash' : row['parent'] or '',
+            'mime'  : row['mime'],
+            'size'  : row['data_size'],
+            'ts'    : time.mktime(ts.timetuple()),
+            'locked': int(row['id'] == INode.ROOT['PK']),
+        }
+        info.update(perms[klass])
+        if root is not None and row['id'] == root.pk:
+            info['phash'] = ''
+        if klass is FolderNode:
+            info['dirs'] = int(bool(row['dirs']))
+        elif klass is ImageNode:
+            width = row['filenode__imagenode__width']
+            height = row['filenode__imagenode__height']
+            if width and height:
+                info['dim'] = '%sx%s' % (width, height)
+            if row['filenode__imagenode__thumb']:
+                info['tmb'] = row['filenode__imagenode__thumb']
+        yield info
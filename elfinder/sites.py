@@ -1,21 +1,37 @@
-import inspect
-import logging
+import itertools
 import simplejson as json
+from contextlib import nested
 from functools import update_wrapper
+from hashlib import md5
 
+from django.conf import settings
+from django.core.cache import get_cache
+from django.core.exceptions import PermissionDenied
 from django.core.urlresolvers import reverse
-from django.http import Http404, HttpResponseRedirect, HttpResponse
+from django.http import HttpResponseRedirect, HttpResponse, \
+    HttpResponseForbidden, HttpResponseNotModified
 from django.template.response import TemplateResponse
-from django.utils.translation import ugettext as _
 from django.views.decorators.cache import never_cache
 from django.views.decorators.csrf import csrf_protect
 
-from elfinder.drivers.base import FinderDriver
-from elfinder import models
+from elfinder import metrics, streaming, uploads
+from elfinder.dispatch import to_bool
+from elfinder.permissions import get_resolver
+from elfinder.volumes import Volume
+
+# cache of the responses of cached_commands
+response_cache = get_cache(getattr(settings, 'ELFINDER_CACHE', 'default'))
+CACHE_TIMEOUT = getattr(settings, 'ELFINDER_CACHE_TIMEOUT', 600)
+# the stats view is open to everyone, i.e. to a scraper without a session,
+# instead of the staff only
+PUBLIC_STATS = getattr(settings, 'ELFINDER_PUBLIC_STATS', False)
+
 
 class ElfinderSite(object):
     index_template = 'elfinder/base.html'
     title = 'File manager'
+    # commands whose responses are cached, see _cache_key
+    cached_commands = ('open', 'tree', 'parents')
     _options = {
         'ui_options': {
             'toolbar': [
@@ -23,7 +39,8 @@ class ElfinderSite(object):
                 ['download', 'mkdir', 'upload'],
                 ['copy', 'cut', 'paste'],
                 ['rm'],
-                ['rename'],
+                ['rename', 'resize'],
+                ['archive', 'extract'],
                 ['info', 'quicklook'],
                 ['view', 'sort'],
                 ['search'],
@@ -34,11 +51,11 @@ class ElfinderSite(object):
             'cwd': ['reload', 'back', '|', 'mkdir', 'paste' '|',
                     'upload'],
             'files': ['edit', 'open', '|', 'copy', 'cut', 'paste', '|',
-                  'rm', 'rename']
+                  'rm', 'rename', '|', 'archive', 'extract']
         },
         'init_params': {
             'api': '2.0',
-            'uplMaxSize': '1024M', 
+            'uplMaxSize': '%dK' % (uploads.MAX_SIZE // 1024),
             'options': {
                 'separator': '/',
                 'disabled': [],
@@ -46,17 +63,26 @@ class ElfinderSite(object):
                 'copyOverwrite': 1,
             }
         },
-        'allowed_http_params': ['cmd', 'target', 'targets[]', 'current', 'tree',
-                'name', 'content', 'src', 'dst', 'cut', 'init',
+        'allowed_http_params': ['cmd', 'target', 'targets[]', 'current',
+                'tree', 'name', 'content', 'src', 'dst', 'cut', 'init',
                 'type', 'width', 'height', 'upload[]', 'q', 'root',
+                'limit', 'offset', 'download', 'chunk', 'cid', 'range',
+                'makedir', 'mode', 'x', 'y', 'degree', 'quality',
+                'sort', 'cursor',
         ]
     }
 
     def __init__(self, finderDriver=None,
                  name='elfinder', app_name='elfinder',
                  ui_options={}, context_menu={}, init_params={},
-                 allowed_http_params=[]):
-        self.driver = finderDriver or FinderDriver()
+                 allowed_http_params=[], volumes=None):
+        # the first volume is the default one, opened by the client
+        self.volumes = volumes or [Volume('1', finderDriver)]
+        if len(self.volumes) > 1:
+            # hashes without prefix would reach the default volume
+            for volume in self.volumes:
+                volume.strict = True
+        self.driver = self.volumes[0].driver
         self.name = name
         self.app_name = app_name
         # options dictionary based on default_options
@@ -66,6 +92,10 @@ class ElfinderSite(object):
             self._options['context_menu'], **context_menu)
         self.init_params = dict(
             self._options['init_params'], **init_params)
+        # advertise the archives the driver can handle
+        if 'options' not in init_params and hasattr(self.driver, 'archivers'):
+            self.init_params['options'] = dict(
+                self.init_params['options'], archivers=self.driver.archivers)
         self.allowed_http_params = (allowed_http_params or
             self._options['allowed_http_params'])
 
@@ -91,7 +121,7 @@ class ElfinderSite(object):
         return update_wrapper(inner, view)
 
     def get_urls(self):
-        from django.conf.urls import patterns, url, include
+        from django.conf.urls import patterns, url
 
         def wrap(view, cacheable=False):
             """
@@ -107,6 +137,10 @@ class ElfinderSite(object):
             url(r'^connector/(?P<root>.*)$',
                 wrap(self.connector),
                 name='connector'),
+            # matched before index, the root of the index cannot be 'stats/'
+            url(r'^stats/$',
+                wrap(self.stats),
+                name='stats'),
             url(r'^(?P<root>.*)$',
                 wrap(self.index),
                 name='index'),
@@ -137,32 +171,41 @@ class ElfinderSite(object):
             'title'      : self.title,
             'contextmenu': self.context_menu,
             'uiOptions'  : self.ui_options,
-            'root'       : root or models.INode.ROOT['HASH'],
+            'root'       : root or self.volumes[0].encode(
+                self.volumes[0].root),
         }
         if extra_context:
             context.update(extra_context)
         return TemplateResponse(request, self.index_template, context)
 
-    def run_command(self, cmd, **data):
-        # pick the driver function from commands dictionary
-        driver_func = getattr(self.driver, self.driver.commands[cmd])
-        args, _, _, defaults = inspect.getargspec(driver_func)
-        # driver_func accept only args and defaults
-        index = len(args) - len(defaults or []) # index of args with defaults
-        params = {}
-        for arg in args:
-            if arg is 'self':
-                continue
-            # arg present in data
-            if arg in data and data[arg]:
-                params[arg] = data[arg]
-                continue
-            # means mandatory argument and no default value present
-            if args.index(arg) < index:
-               raise Exception(
-                   'mandatory argument %s missing in command %s' % (arg, cmd))
+    def get_volume(self, hash):
+        """
+        Returns the volume of hash, the default one for hashes without the
+        prefix of a volume
+        """
+        for volume in self.volumes:
+            if volume.owns(hash):
+                return volume
+        return self.volumes[0]
+
+    def run_command(self, volume, cmd, **data):
         # call the driver function with parameters of the request
-        content = driver_func(**params)
+        content = volume.encode_content(volume.binders[cmd](data))
+        if cmd == 'open' and data.get('tree') and len(self.volumes) > 1:
+            # the client shows the roots of all the volumes in the tree
+            # that the user can read
+            roots = []
+            for other in self.volumes:
+                if other is volume:
+                    continue
+                try:
+                    roots.append(other.root_info(data['user']))
+                except PermissionDenied:
+                    pass
+            if streaming.is_iterator(content['files']):
+                content['files'] = itertools.chain(content['files'], roots)
+            else:
+                content['files'].extend(roots)
         if 'init' in data:
             content.update(self.init_params)
         return content
@@ -178,25 +221,122 @@ class ElfinderSite(object):
          # Copy allowed parameters from the given request's GET to self.data
         for field in self.allowed_http_params:
             if field in data_src:
-                if field == "targets[]":
-                    data['targets'] = data_src.getlist(field)
+                if field.endswith('[]'):
+                    data[field[:-2]] = data_src.getlist(field)
                 else:
                     data[field] = data_src[field]
-        logging.error('Request: %s' % data)
         if not 'cmd' in data:
             return self.error_response('no cmd paramater found in the request')
         # check if 'cmd' is available in the driver and run it
         cmd = data.pop('cmd')
-        if not cmd in self.driver.commands:
+        # the volume of the target runs the command
+        volume = self.get_volume(data.get('target') or data.get('current') or
+                                 (data.get('targets') or [None])[0] or
+                                 data.get('dst') or root)
+        if not cmd in volume.driver.commands:
             return self.error_response(
                 'command %s not available!' % cmd)
+        debug = metrics.sampled()
+        if debug:
+            metrics.logger.debug('Request: %s', data)
+        with nested(volume, metrics.measure(cmd)) as (volume, measurement):
+            try:
+                volume.decode_params(data)
+                if root and self.get_volume(root) is volume:
+                    data['root'] = volume.decode(root)
+                else:
+                    data['root'] = volume.root
+                key = self._cache_key(volume, cmd, data)
+                if key is None:
+                    content = self.run_command(volume, cmd, request=request,
+                                               **data)
+                else:
+                    response = self._cached_response(request, volume, cmd,
+                                                     data, key)
+                    content = None
+            except Exception as e:
+                measurement.error = True
+                response = self.error_response(e.message)
+            else:
+                # special commands (i.e. file) not return a dict to submit
+                # by ajax so return the content from driver as it comes
+                if streaming.is_streamed(content):
+                    response = streaming.json_response(content)
+                elif isinstance(content, dict):
+                    if debug:
+                        metrics.logger.debug('Response: %s', content)
+                    response = self._ajax_response(content)
+                elif content is not None:
+                    response = content
+            measurement.response_bytes = metrics.response_size(response)
+        return response
+
+    def _cache_key(self, volume, cmd, data):
+        """
+        Returns the key of the cached response of cmd, None if the command
+        is not cached. The key changes when a folder shown in the response
+        changes (see FinderDriver.versions) or when the permissions of the
+        user are different.
+        """
+        if (cmd not in self.cached_commands or
+                not hasattr(volume.driver, 'versions')):
+            return None
         try:
-            content = self.run_command(cmd, **data)
-        except Exception as e:
-            return self.error_response(e.message)
-        # special commands (i.e. file) not return a dict to submit by ajax
-        # so return the content from driver as it comes from the run_command
-        if not isinstance(content, dict):
-            return content
-        logging.error('Response: %s' % content)
-        return self._ajax_response(content)
\ No newline at end of file
+            versions = volume.driver.versions(data.get('root'),
+                                              data.get('target'), cmd,
+                                              to_bool(data.get('tree')))
+        except ValueError:
+            return None
+        if versions is None:
+            return None
+        if cmd == 'open' and data.get('tree'):
+            # the roots of the other volumes are in the response
+            versions = [versions] + [other.versions() for other in
+                                     self.volumes if other is not volume]
+            if None in versions:
+                return None
+        params = sorted((name, value) for name, value in data.items()
+                        if name not in ('user', 'request', 'files'))
+        return md5(repr((self.name, volume.id, cmd, params, versions,
+                         get_resolver(data['user']).fingerprint))).hexdigest()
+
+    def _cached_response(self, request, volume, cmd, data, key):
+        """
+        Returns the response of cmd from the cache, or 304 if the client
+        has it already, running the command only when it is missing
+        """
+        etag = '"%s"' % key
+        if etag in request.META.get('HTTP_IF_NONE_MATCH', ''):
+            response = HttpResponseNotModified()
+        else:
+            body = response_cache.get('elfinder:%s' % key)
+            if body is None:
+                content = self.run_command(volume, cmd, request=request,
+                                           **data)
+                # streamed listings are too big to be cached
+                if streaming.is_streamed(content):
+                    response = streaming.json_response(content)
+                    response['ETag'] = etag
+                    return response
+                body = json.dumps(content)
+                response_cache.set('elfinder:%s' % key, body, CACHE_TIMEOUT)
+            response = HttpResponse(body, mimetype='application/json')
+        response['ETag'] = etag
+        return response
+
+    def has_stats_permission(self, request):
+        """
+        The counters are shown to the staff, or to everyone with
+        ELFINDER_PUBLIC_STATS
+        """
+        return PUBLIC_STATS or (request.user.is_active and
+                                request.user.is_staff)
+
+    def stats(self, request):
+        """
+        Counters of the connector commands, in the Prometheus text format
+        """
+        if not self.has_stats_permission(request):
+            return HttpResponseForbidden()
+        return HttpResponse(metrics.registry.render(),
+                            content_type=metrics.CONTENT_TYPE)
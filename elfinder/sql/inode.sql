@@ -0,0 +1,8 @@
+-- Indexes of the paginated listings of open and list (see
+-- FinderDriver.page_size): the children of a folder are read in the order
+-- of the index, one page at a time. syncdb runs this file when it creates
+-- the table, on existing databases run the output of
+-- manage.py sqlcustom elfinder.
+CREATE INDEX elfinder_inode_parent_name ON elfinder_inode (parent_id, name);
+CREATE INDEX elfinder_inode_parent_modified ON elfinder_inode (parent_id, modified, id);
+CREATE INDEX elfinder_inode_parent_size ON elfinder_inode (parent_id, data_size, id);
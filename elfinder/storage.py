@@ -0,0 +1,85 @@
+"""
+Content addressed storage: every content is stored once, under the sha1 of
+its bytes, in a directory tree sharded by the first characters of the hash
+(cas/ab/cd/abcd...). Uploading a content already present does not write
+anything, the FileNode simply points to the existing file and the Blob
+table counts how many nodes reference it.
+
+Enable it with:
+
+    ELFINDER_STORAGE = 'elfinder.storage.ContentAddressedStorage'
+"""
+import errno
+import hashlib
+import os
+import uuid
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage, default_storage, \
+    get_storage_class
+
+# dotted path of the storage used by FileNode.data, default_storage if None
+FILE_STORAGE = getattr(settings, 'ELFINDER_STORAGE', None)
+# directory, relative to the storage location, holding the contents
+CAS_ROOT = getattr(settings, 'ELFINDER_CAS_ROOT', 'cas')
+# number of directory levels and hash characters for each level
+CAS_SHARD_DEPTH = getattr(settings, 'ELFINDER_CAS_SHARD_DEPTH', 2)
+CAS_SHARD_WIDTH = getattr(settings, 'ELFINDER_CAS_SHARD_WIDTH', 2)
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    FileSystemStorage naming files after the sha1 of their content, the
+    name passed to save is ignored
+    """
+    # tells upload_to that there is no need to look for an available name
+    content_addressed = True
+
+    def __init__(self, location=None, base_url=None, root=CAS_ROOT,
+                 depth=CAS_SHARD_DEPTH, width=CAS_SHARD_WIDTH):
+        super(ContentAddressedStorage, self).__init__(location, base_url)
+        self.root = root
+        self.depth = depth
+        self.width = width
+
+    def digest(self, content):
+        sha1 = hashlib.sha1()
+        content.seek(0)
+        for chunk in content.chunks():
+            sha1.update(chunk)
+        content.seek(0)
+        return sha1.hexdigest()
+
+    def hashed_name(self, digest):
+        shards = [digest[i * self.width:(i + 1) * self.width]
+                  for i in range(self.depth)]
+        return '/'.join([self.root] + shards + [digest])
+
+    def save(self, name, content):
+        if not hasattr(content, 'chunks'):
+            from django.core.files import File
+            content = File(content)
+        name = self.hashed_name(self.digest(content))
+        if self.exists(name):
+            return name
+        # write under a unique name and rename in place, the rename is
+        # atomic so concurrent uploads of the same content are harmless
+        tmp_name = self._save('%s/tmp/%s' % (self.root, uuid.uuid4().hex),
+                              content)
+        path = self.path(name)
+        try:
+            os.makedirs(os.path.dirname(path))
+        except OSError, e:
+            if e.errno != errno.EEXIST:
+                raise
+        os.rename(self.path(tmp_name), path)
+        return name
+
+
+def get_file_storage():
+    """
+    Returns the storage configured with ELFINDER_STORAGE
+    """
+    if FILE_STORAGE is None:
+        return default_storage
+    return get_storage_class(FILE_STORAGE)()
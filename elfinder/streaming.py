@@ -0,0 +1,64 @@
+"""
+Incremental JSON encoding of the connector responses. The values of a
+response that are iterators, i.e. the files of a streaming driver, are
+encoded one item at a time while the response is sent, so the memory used
+does not depend on the number of files.
+"""
+import simplejson as json
+
+from elfinder.delivery import StreamingHttpResponse
+
+# size of the pieces of the body handed to the web server
+BUFFER_SIZE = 64 * 1024
+
+
+def is_iterator(value):
+    return hasattr(value, 'next')
+
+
+def is_streamed(content):
+    """
+    True if some of the values of the content dict are iterators
+    """
+    return isinstance(content, dict) and any(is_iterator(value)
+                                             for value in content.values())
+
+
+def _pieces(content):
+    yield '{'
+    for i, (key, value) in enumerate(content.items()):
+        if i:
+            yield ', '
+        yield json.dumps(key)
+        yield ': '
+        if is_iterator(value):
+            yield '['
+            for j, item in enumerate(value):
+                if j:
+                    yield ', '
+                yield json.dumps(item)
+            yield ']'
+        else:
+            yield json.dumps(value)
+    yield '}'
+
+
+def iterencode(content, buffer_size=BUFFER_SIZE):
+    """
+    Yields the JSON encoding of the content dict in pieces of about
+    buffer_size bytes
+    """
+    buf, size = [], 0
+    for piece in _pieces(content):
+        buf.append(piece)
+        size += len(piece)
+        if size >= buffer_size:
+            yield ''.join(buf)
+            buf, size = [], 0
+    if buf:
+        yield ''.join(buf)
+
+
+def json_response(content):
+    return StreamingHttpResponse(iterencode(content),
+                                 content_type='application/json')
@@ -0,0 +1,22 @@
+from elfinder.tests.test_permissions import *
+from elfinder.tests.test_bulk import *
+from elfinder.tests.test_tree import *
+from elfinder.tests.test_aggregates import *
+from elfinder.tests.test_metadata import *
+from elfinder.tests.test_search import *
+from elfinder.tests.test_images import *
+from elfinder.tests.test_storage import *
+from elfinder.tests.test_delete import *
+from elfinder.tests.test_commands import *
+from elfinder.tests.test_streaming import *
+from elfinder.tests.test_serializers import *
+from elfinder.tests.test_cache import *
+from elfinder.tests.test_archives import *
+from elfinder.tests.test_pagination import *
+from elfinder.tests.test_delivery import *
+from elfinder.tests.test_dispatch import *
+from elfinder.tests.test_volumes import *
+from elfinder.tests.test_uploads import *
+from elfinder.tests.test_pools import *
+from elfinder.tests.test_metrics import *
+from elfinder.tests.test_localfs import *
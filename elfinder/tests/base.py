@@ -0,0 +1,63 @@
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase
+
+from elfinder import bulk
+from elfinder.models import FileNode, FolderNode, INode, parse_tree_path
+
+
+class TreeTestCase(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_superuser('admin', 'a@a.com', 'x')
+        # the root of initial_data is owned by the first user
+        call_command('loaddata', 'initial_data', verbosity=0)
+        self.root = FolderNode.objects.get(pk=INode.ROOT['PK'])
+        self.storage = FileNode._meta.get_field('data').storage
+        self.names = []
+
+    def tearDown(self):
+        for name in self.names:
+            if self.storage.exists(name):
+                self.storage.delete(name)
+
+    def mkdir(self, name, parent):
+        return FolderNode.objects.create(name=name, parent=parent,
+                                         owner=self.user)
+
+    def upload(self, name, parent, content='content'):
+        node = FileNode(name=name, parent=parent, owner=self.user,
+                        data=SimpleUploadedFile(name, content))
+        node.save()
+        self.names.append(node.data.name)
+        return node
+
+    def reload(self, *nodes):
+        # the bulk functions need the subclasses, as the driver passes them
+        return INode.objects.get_hashes([node.pk for node in nodes])
+
+    def remove(self, *nodes):
+        bulk.delete_nodes(self.reload(*nodes))
+        bulk.purge_deleted()
+
+    def assertTreeConsistent(self):
+        """
+        Paths and levels follow the parents, the aggregates of the folders
+        are the ones rebuild_aggregates computes
+        """
+        for node in INode.objects.select_related('parent'):
+            if node.parent is None:
+                self.assertEqual(node.tree_path, '/%s/' % node.pk)
+            else:
+                self.assertEqual(node.tree_path, '%s%s/' % (
+                    node.parent.tree_path, node.pk))
+            self.assertEqual(node.level,
+                             len(parse_tree_path(node.tree_path)) - 1)
+        aggregates = dict((folder.pk, (folder.total_bytes,
+                                       folder.total_items))
+                          for folder in FolderNode.objects.all())
+        FolderNode.objects.rebuild_aggregates()
+        for folder in FolderNode.objects.all():
+            self.assertEqual(aggregates[folder.pk],
+                             (folder.total_bytes, folder.total_items))
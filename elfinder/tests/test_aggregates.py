@@ -0,0 +1,64 @@
+from elfinder.drivers.base import FinderDriver
+from elfinder.models import FolderNode
+from elfinder.tests.base import TreeTestCase
+
+
+class AggregatesTestCase(TreeTestCase):
+
+    def aggregates(self, *folders):
+        return [FolderNode.objects.get(pk=folder.pk).aggregates
+                for folder in folders]
+
+    def test_upload_and_remove(self):
+        a = self.mkdir('a', self.root)
+        b = self.mkdir('b', a)
+        self.upload('f.txt', b, 'x' * 10)
+        self.upload('g.txt', a, 'x' * 5)
+        self.assertEqual(self.aggregates(self.root, a, b),
+                         [(15, 5), (15, 4), (10, 2)])
+        self.remove(b)
+        self.assertEqual(self.aggregates(self.root, a), [(5, 3), (5, 2)])
+        self.assertTreeConsistent()
+
+    def test_delete(self):
+        a = self.mkdir('a', self.root)
+        self.upload('f.txt', self.mkdir('b', a), 'x' * 10)
+        FolderNode.objects.get(pk=a.pk).delete()
+        self.assertEqual(self.aggregates(self.root), [(0, 1)])
+
+    def test_size(self):
+        a = self.mkdir('a', self.root)
+        f = self.upload('f.txt', a, 'x' * 10)
+        self.upload('g.txt', self.mkdir('b', a), 'x' * 5)
+        with self.assertNumQueries(1):
+            self.assertEqual(FinderDriver().size([a.pk, f.pk]),
+                             {'size': 25})
+
+    def test_rebuild(self):
+        a = self.mkdir('a', self.root)
+        self.upload('f.txt', a, 'x' * 10)
+        FolderNode.objects.update(total_bytes=0, total_items=0)
+        self.assertEqual(FolderNode.objects.rebuild_aggregates(batch_size=1),
+                         2)
+        self.assertEqual(self.aggregates(self.root, a), [(10, 3), (10, 2)])
+
+    def test_upload_during_rename(self):
+        a = self.mkdir('a', self.root)
+        # loaded by the rename before the upload commits
+        renamed = FolderNode.objects.get(pk=a.pk)
+        self.upload('f.txt', a, 'x' * 10)
+        renamed.name = 'b'
+        renamed.save()
+        self.assertEqual(FolderNode.objects.get(pk=a.pk).aggregates, (10, 2))
+        self.assertTreeConsistent()
+
+    def test_upload_during_move(self):
+        a = self.mkdir('a', self.root)
+        other = self.mkdir('other', self.root)
+        moved = FolderNode.objects.get(pk=a.pk)
+        self.upload('f.txt', a, 'x' * 10)
+        moved.parent = other
+        moved.save()
+        self.assertEqual(FolderNode.objects.get(pk=other.pk).aggregates,
+                         (10, 3))
+        self.assertTreeConsistent()
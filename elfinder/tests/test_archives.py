@@ -0,0 +1,98 @@
+import struct
+import zipfile
+from cStringIO import StringIO
+
+from django.core.exceptions import ValidationError
+
+from elfinder import archives, pools
+from elfinder.models import FileNode, FolderNode, INode
+from elfinder.tests.base import TreeTestCase
+
+
+class ArchiveTestCase(TreeTestCase):
+
+    def zip(self, *entries):
+        content = StringIO()
+        archive = zipfile.ZipFile(content, 'w', zipfile.ZIP_DEFLATED)
+        for name, data in entries:
+            archive.writestr(name, data)
+        archive.close()
+        return content.getvalue()
+
+    def extract(self, content):
+        try:
+            return archives.extract_zip(StringIO(content), self.root,
+                                        self.user)
+        finally:
+            self.names.extend(FileNode.objects.values_list('data', flat=True))
+
+    def test_archive(self):
+        a = self.mkdir('a', self.root)
+        self.upload('f.txt', self.mkdir('b', a), 'hello')
+        self.upload('g.txt', self.root, 'other')
+        entries, size = archives.zip_entries(
+            self.reload(a), [INode.TYPES.folder, INode.TYPES.file])
+        self.assertEqual(size, 5)
+        archive = zipfile.ZipFile(StringIO(''.join(
+            archives.iter_zip(entries))))
+        self.assertEqual(archive.namelist(), ['a/', 'a/b/', 'a/b/f.txt'])
+        self.assertEqual(archive.read('a/b/f.txt'), 'hello')
+        self.assertEqual(archive.testzip(), None)
+        # unix permissions
+        self.assertEqual([(info.create_system, info.external_attr >> 16)
+                          for info in archive.infolist()],
+                         [(3, 040755), (3, 040755), (3, 0100644)])
+
+    def test_extract(self):
+        self.extract(self.zip(('d/a.txt', 'abc'), ('b.txt', 'hello')))
+        self.assertEqual(
+            sorted(FileNode.objects.values_list('name', 'data_size')),
+            [(u'a.txt', 3), (u'b.txt', 5)])
+        self.assertTreeConsistent()
+
+    def test_extract_batches(self):
+        io_threads = pools.IO_THREADS
+        # the files are stored two at a time, in batches of four
+        pools.IO_THREADS = 2
+        try:
+            added = self.extract(self.zip(*[
+                ('d/%d.txt' % i, 'x' * i) for i in range(10)]))
+        finally:
+            pools.IO_THREADS = io_threads
+        self.assertEqual([node.name for node in added], ['d'])
+        self.assertEqual(sorted(
+            (node.name, node.data_size, node.data.read())
+            for node in FileNode.objects.all()),
+            [('%d.txt' % i, i, 'x' * i) for i in range(10)])
+        self.assertTreeConsistent()
+
+    def test_invalid_names(self):
+        # the names upload and mkdir reject
+        self.assertRaises(Exception, self.extract, self.zip(
+            ('a.txt', 'a'), ('d/%s.txt' % ('x' * 300), 'b')))
+        self.assertRaises(Exception, archives.extract_zip, StringIO(
+            self.zip(('a.txt', 'a'))), self.root, self.user, 'a/b')
+        self.assertFalse(FileNode.objects.exists())
+        self.assertRaises(ValidationError, self.mkdir, 'a/b', self.root)
+        self.assertRaises(ValidationError, self.mkdir, '..', self.root)
+
+    def test_entries_limit(self):
+        max_entries = archives.MAX_ENTRIES
+        archives.MAX_ENTRIES = 2
+        try:
+            self.assertRaises(Exception, self.extract, self.zip(
+                ('a.txt', 'a'), ('b.txt', 'b'), ('c.txt', 'c')))
+        finally:
+            archives.MAX_ENTRIES = max_entries
+        self.assertFalse(FileNode.objects.exists())
+
+    def test_entry_bigger_than_declared(self):
+        content = bytearray(self.zip(('a.txt', 'fine'),
+                                     ('b.txt', '\0' * 100000)))
+        # the central directory of b.txt declares 10 bytes
+        offset = content.find('PK\x01\x02', content.find('PK\x01\x02') + 4)
+        struct.pack_into('<L', content, offset + 24, 10)
+        self.assertRaises(Exception, self.extract, str(content))
+        self.assertFalse(FileNode.objects.exists())
+        self.assertEqual(FolderNode.objects.get(pk=self.root.pk).aggregates,
+                         (0, 1))
@@ -0,0 +1,108 @@
+from django.core.files.uploadedfile import SimpleUploadedFile
+
+from elfinder import bulk
+from elfinder.models import Blob, FolderNode, ImageNode, INode
+from elfinder.tests.base import TreeTestCase
+
+
+class BlobTestCase(TreeTestCase):
+
+    def test_copies_share_content(self):
+        original = self.upload('a.txt', self.root)
+        folder = self.mkdir('copies', self.root)
+        copy = bulk.copy_nodes([original], folder)[0]
+        clone = original.clone(name='b.txt')
+        name = original.data.name
+        self.assertEqual(Blob.objects.get(name=name).refs, 3)
+        self.remove(original)
+        self.remove(copy)
+        self.assertTrue(self.storage.exists(name))
+        self.remove(clone)
+        self.assertFalse(self.storage.exists(name))
+        self.assertFalse(Blob.objects.filter(name=name).exists())
+
+    def test_untracked_content_is_kept(self):
+        # contents stored before reference counting have no row
+        original = self.upload('a.txt', self.root)
+        clone = original.clone(name='b.txt')
+        Blob.objects.all().delete()
+        self.remove(original)
+        self.assertTrue(self.storage.exists(clone.data.name))
+        self.remove(clone)
+        self.assertFalse(self.storage.exists(clone.data.name))
+
+    def test_concurrent_acquire(self):
+        update_refs = Blob.objects._update_refs
+
+        def concurrent(names, counts, sign):
+            # the row is created by another upload after the lookup
+            if not Blob.objects.filter(name='a').exists():
+                Blob.objects.create(name='a', refs=1)
+            update_refs(names, counts, sign)
+        Blob.objects._update_refs = concurrent
+        try:
+            Blob.objects.acquire(['a', 'b'])
+        finally:
+            Blob.objects._update_refs = update_refs
+        self.assertEqual(sorted(Blob.objects.values_list('name', 'refs')),
+                         [(u'a', 2), (u'b', 1)])
+
+    def test_rebuild_refs(self):
+        original = self.upload('a.txt', self.root)
+        original.clone(name='b.txt')
+        Blob.objects.all().delete()
+        self.assertEqual(Blob.objects.rebuild(), 1)
+        self.assertEqual(Blob.objects.get(name=original.data.name).refs, 2)
+
+
+class MoveTestCase(TreeTestCase):
+
+    def test_move_nested_targets(self):
+        a = self.mkdir('a', self.root)
+        x = self.mkdir('x', a)
+        self.upload('f.txt', x, 'x' * 10)
+        other = self.mkdir('other', self.root)
+        moved = bulk.move_nodes(self.reload(x, a), other)
+        self.assertEqual([node.pk for node in moved], [a.pk])
+        self.assertEqual(INode.objects.get(pk=x.pk).parent_id, a.pk)
+        self.assertTreeConsistent()
+        self.assertEqual(FolderNode.objects.get(pk=other.pk).aggregates,
+                         (10, 4))
+
+    def test_copy_nested_targets(self):
+        a = self.mkdir('a', self.root)
+        x = self.mkdir('x', a)
+        copies = bulk.copy_nodes(self.reload(a, x),
+                                 self.mkdir('other', self.root))
+        self.assertEqual(len(copies), 1)
+        self.assertEqual(INode.objects.filter(name='x').count(), 2)
+        self.assertTreeConsistent()
+
+    def test_copy_images(self):
+        a = self.mkdir('a', self.root)
+        for name, parent in (('top.jpg', self.root), ('inner.jpg', a)):
+            image = ImageNode(name=name, parent=parent, owner=self.user,
+                              data=SimpleUploadedFile(name, 'jpeg'))
+            image.save()
+            self.names.append(image.data.name)
+        ImageNode.objects.update(width=64, height=48, thumb='/thumb.jpg')
+        other = self.mkdir('other', self.root)
+        bulk.copy_nodes(self.reload(a, INode.objects.get(name='top.jpg')),
+                        other)
+        copies = ImageNode.objects.filter(
+            tree_path__startswith=other.tree_path)
+        self.assertEqual(sorted(copies.values_list(
+            'name', 'width', 'height', 'thumb')),
+            [(u'inner.jpg', 64, 48, u'/thumb.jpg'),
+             (u'top.jpg', 64, 48, u'/thumb.jpg')])
+        self.assertTreeConsistent()
+
+    def test_copy_and_remove(self):
+        a = self.mkdir('a', self.root)
+        self.upload('f.txt', self.mkdir('b', a), 'x' * 10)
+        bulk.copy_nodes(self.reload(a), self.mkdir('other', self.root))
+        self.assertTreeConsistent()
+        self.remove(a)
+        self.assertTreeConsistent()
+        self.assertEqual(FolderNode.objects.get(pk=self.root.pk).aggregates,
+                         (10, 5))
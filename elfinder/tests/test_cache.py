@@ -0,0 +1,102 @@
+from cStringIO import StringIO
+
+from django.core.management import call_command
+from django.test.client import RequestFactory
+
+from elfinder import sites
+from elfinder.drivers.base import FinderDriver
+from elfinder.models import FileNode, FolderNode
+from elfinder.tests.base import TreeTestCase
+
+
+class VersionTestCase(TreeTestCase):
+
+    def version(self, folder):
+        return FolderNode.objects.get(pk=folder.pk).version
+
+    def test_rename_after_upload(self):
+        a = self.mkdir('a', self.root)
+        renamed = FolderNode.objects.get(pk=a.pk)
+        self.upload('f.txt', a)
+        uploaded = self.version(a)
+        renamed.name = 'b'
+        renamed.save()
+        # the version loaded before the upload is never written back
+        self.assertTrue(self.version(a) > uploaded)
+
+    def test_rebuild_aggregates(self):
+        a = self.mkdir('a', self.root)
+        self.upload('f.txt', a, 'x' * 10)
+        FolderNode.objects.filter(pk=a.pk).update(total_bytes=0)
+        before = self.version(a), self.version(self.root)
+        FolderNode.objects.rebuild_aggregates()
+        self.assertEqual(FolderNode.objects.get(pk=a.pk).total_bytes, 10)
+        self.assertEqual((self.version(a), self.version(self.root)),
+                         (before[0] + 1, before[1]))
+
+    def test_refresh_file_metadata(self):
+        a = self.mkdir('a', self.root)
+        f = self.upload('f.txt', a, 'x' * 10)
+        FileNode.objects.filter(pk=f.pk).update(data_size=0)
+        before = self.version(a)
+        call_command('refresh_file_metadata', stdout=StringIO())
+        self.assertEqual(FileNode.objects.get(pk=f.pk).data_size, 10)
+        self.assertEqual(self.version(a), before + 1)
+
+
+class CacheTestCase(TreeTestCase):
+
+    def setUp(self):
+        super(CacheTestCase, self).setUp()
+        self.site = sites.ElfinderSite(FinderDriver())
+        sites.response_cache.clear()
+        self.a = self.mkdir('a', self.root)
+        self.b = self.mkdir('b', self.a)
+        self.c = self.mkdir('c', self.b)
+        # the commands that are not served from the cache
+        self.commands = []
+
+    def get(self, cmd, target, **params):
+        params.update(cmd=cmd, target=self.site.volumes[0].encode(target.pk))
+        request = RequestFactory().get('/', params)
+        request.user = self.user
+        run_command = self.site.run_command
+
+        def counted(volume, cmd, **data):
+            self.commands.append(cmd)
+            return run_command(volume, cmd, **data)
+        self.site.run_command = counted
+        try:
+            return self.site.connector(request, '')['ETag']
+        finally:
+            self.site.run_command = run_command
+
+    def test_unrelated_write(self):
+        etag = self.get('open', self.a)
+        self.upload('f.txt', self.c)
+        self.mkdir('other', self.root)
+        self.assertEqual(self.get('open', self.a), etag)
+        self.assertEqual(self.commands, ['open'])
+
+    def test_listing_changes(self):
+        etags = [self.get('open', self.a), self.get('open', self.b)]
+        # b has no subfolders anymore, the listing of a shows it
+        FolderNode.objects.get(pk=self.c.pk).delete()
+        self.assertNotEqual(self.get('open', self.a), etags[0])
+        self.assertNotEqual(self.get('open', self.b), etags[1])
+        etag = self.get('open', self.a)
+        self.upload('f.txt', self.a)
+        self.assertNotEqual(self.get('open', self.a), etag)
+        self.assertEqual(self.commands, ['open'] * 5)
+
+    def test_ancestors(self):
+        etags = [self.get('parents', self.c),
+                 self.get('open', self.c, tree='1'),
+                 self.get('open', self.c)]
+        renamed = FolderNode.objects.get(pk=self.a.pk)
+        renamed.name = 'renamed'
+        renamed.save()
+        self.assertNotEqual(self.get('parents', self.c), etags[0])
+        self.assertNotEqual(self.get('open', self.c, tree='1'), etags[1])
+        # the plain listing does not show the ancestors
+        self.assertEqual(self.get('open', self.c), etags[2])
@@ -0,0 +1,70 @@
+import json
+import os
+import tempfile
+from cStringIO import StringIO
+
+from django.core.management import call_command
+
+from elfinder.models import Blob, FileNode, FolderNode, ImageNode
+from elfinder.tests.base import TreeTestCase
+
+
+class GenerateTreeTestCase(TreeTestCase):
+
+    def generate(self, **options):
+        out = StringIO()
+        options.setdefault('stderr', StringIO())
+        options.setdefault('depth', 1)
+        options.setdefault('fanout', 2)
+        options.setdefault('files', 2)
+        options.setdefault('images', 1)
+        try:
+            call_command('generate_tree', stdout=out, **options)
+        finally:
+            self.names.extend(set(FileNode.objects.values_list('data',
+                                                               flat=True)))
+        return out.getvalue()
+
+    def test_generate_tree(self):
+        self.assertEqual(self.generate(), '12 inodes generated under '
+                                          '/Home/generated\n')
+        top = FolderNode.objects.get(name='generated')
+        self.assertEqual(top.get_descendants().count(), 11)
+        self.assertEqual(ImageNode.objects.count(), 3)
+        self.assertEqual(sorted(Blob.objects.values_list('refs', flat=True)),
+                         [3, 6])
+        self.assertEqual(top.total_items, 11)
+        self.assertTreeConsistent()
+        # the errors of the commands exit when called by call_command
+        err = StringIO()
+        self.assertRaises(SystemExit, self.generate, stderr=err)
+        self.assertEqual(err.getvalue(),
+                         'Error: Home already contains generated\n')
+
+    def test_benchmark(self):
+        self.generate()
+        out = StringIO()
+        call_command('benchmark', repeat=1, stdout=out)
+        commands = [line.split()[0] for line in
+                    out.getvalue().splitlines()[1:]]
+        self.assertEqual(commands, ['open', 'tree', 'parents', 'list',
+                                    'search', 'size', 'upload', 'rm',
+                                    'paste'])
+        # the scratch folder is gone
+        self.assertEqual(FolderNode.objects.filter(
+            name__startswith='benchmark').count(), 0)
+
+    def test_budget_exceeded(self):
+        self.generate()
+        fd, budgets = tempfile.mkstemp()
+        os.write(fd, json.dumps({'size': 0}))
+        os.close(fd)
+        try:
+            err = StringIO()
+            self.assertRaises(SystemExit, call_command, 'benchmark',
+                              repeat=1, budgets=budgets, stdout=StringIO(),
+                              stderr=err)
+        finally:
+            os.remove(budgets)
+        self.assertEqual(err.getvalue(),
+                         'Error: query budget exceeded: size (1 > 0)\n')
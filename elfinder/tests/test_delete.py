@@ -0,0 +1,52 @@
+from StringIO import StringIO
+
+from django.core.management import call_command
+
+from elfinder import bulk
+from elfinder.models import Blob, FolderNode, INode, NameTrigram
+from elfinder.tests.base import TreeTestCase
+
+
+class SoftDeleteTestCase(TreeTestCase):
+
+    def test_deleted_are_hidden(self):
+        a = self.mkdir('a', self.root)
+        b = self.mkdir('b', a)
+        f = self.upload('f.txt', b)
+        bulk.delete_nodes(self.reload(a))
+        pks = [a.pk, b.pk, f.pk]
+        self.assertFalse(INode.objects.filter(pk__in=pks).exists())
+        self.assertEqual(INode.all_objects.filter(pk__in=pks,
+                                                  deleted=True).count(), 3)
+        # only the top is detached, its name can be used again
+        self.assertEqual(INode.all_objects.get(pk=a.pk).parent_id, None)
+        self.assertEqual(INode.all_objects.get(pk=b.pk).parent_id, a.pk)
+        self.mkdir('a', self.root)
+        self.assertTrue(self.storage.exists(f.data.name))
+
+    def test_purge(self):
+        a = self.mkdir('a', self.root)
+        f = self.upload('f.txt', self.mkdir('b', a))
+        kept = self.upload('g.txt', self.root)
+        bulk.delete_nodes(self.reload(a))
+        self.assertEqual(bulk.purge_deleted(batch_size=1), 3)
+        self.assertEqual(INode.all_objects.filter(deleted=True).count(), 0)
+        self.assertEqual(sorted(INode.objects.values_list('pk', flat=True)),
+                         [self.root.pk, kept.pk])
+        self.assertEqual(sorted(set(NameTrigram.objects.values_list(
+            'inode', flat=True))), [kept.pk])
+        self.assertFalse(self.storage.exists(f.data.name))
+        self.assertFalse(Blob.objects.filter(name=f.data.name).exists())
+        self.assertTrue(self.storage.exists(kept.data.name))
+        self.assertEqual(bulk.purge_deleted(), 0)
+        self.assertTreeConsistent()
+
+    def test_purge_command(self):
+        a = self.mkdir('a', self.root)
+        self.upload('f.txt', a)
+        bulk.delete_nodes(self.reload(a))
+        out = StringIO()
+        call_command('purge_deleted_inodes', batch_size=1, stdout=out)
+        self.assertEqual(out.getvalue(), '2 inodes purged\n')
+        self.assertEqual(FolderNode.objects.get(pk=self.root.pk).aggregates,
+                         (0, 1))
@@ -0,0 +1,54 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase
+from django.test.client import RequestFactory
+from django.utils.http import http_date
+
+from elfinder import delivery
+
+
+class DeliveryTestCase(SimpleTestCase):
+
+    def test_parse_range(self):
+        self.assertEqual(delivery.parse_range('bytes=0-99', 1000), (0, 99))
+        self.assertEqual(delivery.parse_range('bytes=900-', 1000),
+                         (900, 999))
+        # past the end of the content and suffix ranges
+        self.assertEqual(delivery.parse_range('bytes=900-2000', 1000),
+                         (900, 999))
+        self.assertEqual(delivery.parse_range('bytes=-100', 1000),
+                         (900, 999))
+        self.assertEqual(delivery.parse_range('bytes=-2000', 1000),
+                         (0, 999))
+
+    def test_ignored_range(self):
+        for header in ('bytes=-', 'bytes=0-1,5-6', 'lines=0-1', 'bytes=a-'):
+            self.assertEqual(delivery.parse_range(header, 1000), None)
+
+    def test_unsatisfiable_range(self):
+        for header, size in (('bytes=1000-', 1000), ('bytes=5-1', 1000),
+                             ('bytes=-0', 1000), ('bytes=-10', 0)):
+            self.assertRaises(ValueError, delivery.parse_range, header, size)
+
+    def test_not_modified(self):
+        factory = RequestFactory()
+        etag, mtime = '"1-2"', 1000000000
+        self.assertFalse(delivery.not_modified(factory.get('/'), etag,
+                                               mtime))
+        self.assertTrue(delivery.not_modified(factory.get(
+            '/', HTTP_IF_NONE_MATCH='"0-0", "1-2"'), etag, mtime))
+        self.assertTrue(delivery.not_modified(factory.get(
+            '/', HTTP_IF_NONE_MATCH='*'), etag, mtime))
+        self.assertTrue(delivery.not_modified(factory.get(
+            '/', HTTP_IF_MODIFIED_SINCE=http_date(mtime)), etag, mtime))
+        self.assertFalse(delivery.not_modified(factory.get(
+            '/', HTTP_IF_MODIFIED_SINCE=http_date(mtime - 1)), etag, mtime))
+        # If-None-Match wins over If-Modified-Since
+        self.assertFalse(delivery.not_modified(factory.get(
+            '/', HTTP_IF_NONE_MATCH='"0-0"',
+            HTTP_IF_MODIFIED_SINCE=http_date(mtime)), etag, mtime))
+
+    def test_check_mode(self):
+        delivery.check_mode('stream')
+        self.assertRaises(ImproperlyConfigured, delivery.check_mode, 'ftp')
+        self.assertRaises(ImproperlyConfigured, delivery.check_mode,
+                          'x-accel-redirect')
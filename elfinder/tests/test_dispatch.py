@@ -0,0 +1,39 @@
+from django.test import SimpleTestCase
+
+from elfinder.dispatch import CommandBinder, to_bool, to_int, to_list
+
+
+class Driver(object):
+    commands = {'resize': 'resize'}
+
+    def resize(self, target, width=None, rotate=False, targets=None):
+        return target, width, rotate, targets
+
+
+class CommandBinderTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.binder = CommandBinder(Driver(), 'resize', {
+            'width': to_int, 'rotate': to_bool, 'targets': to_list})
+
+    def test_bind(self):
+        self.assertEqual(self.binder.bind({
+            'target': 'l1_2', 'width': '120', 'rotate': 'true',
+            'targets': 'l1_3', 'other': 'ignored'}), {
+            'target': 'l1_2', 'width': 120, 'rotate': True,
+            'targets': ['l1_3']})
+        self.assertEqual(self.binder({'target': 'l1_2', 'rotate': '0'}),
+                         ('l1_2', None, False, None))
+
+    def test_empty_values(self):
+        # empty values are like missing ones
+        self.assertEqual(self.binder.bind({'target': 'l1_2', 'width': ''}),
+                         {'target': 'l1_2'})
+        self.assertRaises(Exception, self.binder.bind, {'target': ''})
+        self.assertRaises(Exception, self.binder.bind, {'width': '1'})
+
+    def test_invalid_values(self):
+        self.assertRaises(Exception, self.binder.bind,
+                          {'target': 'l1_2', 'width': '12px'})
+        self.assertEqual(to_list(['a', 'b']), ['a', 'b'])
+        self.assertRaises(ValueError, to_int, None)
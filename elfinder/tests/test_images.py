@@ -0,0 +1,168 @@
+import os
+from cStringIO import StringIO
+
+import Image
+from django.core.files.uploadedfile import SimpleUploadedFile
+
+from elfinder import imaging
+from elfinder.drivers.base import FinderDriver
+from elfinder.models import Blob, ImageJob, ImageNode
+from elfinder.tests.base import TreeTestCase
+
+
+class ImageTestCase(TreeTestCase):
+
+    def image(self, name, parent, size=(64, 48)):
+        content = StringIO()
+        Image.new('RGB', size, (128, 128, 128)).save(content, 'JPEG')
+        node = ImageNode(name=name, parent=parent, owner=self.user,
+                         data=SimpleUploadedFile(name, content.getvalue()))
+        node.save()
+        self.names.append(node.data.name)
+        return node
+
+    def run_jobs(self):
+        """
+        Runs the pending jobs as process_image_jobs does, in this process
+        """
+        jobs = ImageJob.objects.claim(100)
+        for job in jobs:
+            pk, result, error = imaging.run_job(job.payload())
+            if error:
+                job.fail(error)
+            else:
+                job.complete(result)
+        return jobs
+
+    def tearDown(self):
+        for name in self.names:
+            if self.storage.exists(name):
+                imaging.delete_thumbnails(self.storage.path(name))
+        super(ImageTestCase, self).tearDown()
+
+
+class ThumbnailJobTestCase(ImageTestCase):
+
+    def test_thumbnail(self):
+        image = self.image('a.jpg', self.root, (256, 192))
+        self.assertEqual(list(ImageJob.objects.values_list(
+            'image', 'action', 'status')),
+            [(image.pk, 'thumbnail', 'pending')])
+        self.assertEqual(len(self.run_jobs()), 1)
+        image = ImageNode.objects.get(pk=image.pk)
+        self.assertEqual((image.width, image.height), (256, 192))
+        self.assertEqual(image.info(self.user)['dim'], '256x192')
+        thumb = imaging.thumbnail_path(image.data.path,
+                                       imaging.THUMBNAIL_SIZES[0])
+        self.assertTrue(os.path.exists(thumb))
+        self.assertEqual(Image.open(thumb).size, (128, 96))
+        self.assertEqual(ImageJob.objects.get().status, 'done')
+        # the thumbnails go with the content
+        self.remove(image)
+        self.assertFalse(os.path.exists(thumb))
+
+    def test_claim(self):
+        a = self.image('a.jpg', self.root)
+        self.image('b.jpg', self.root)
+        ImageJob.objects.create(image=a, action='thumbnail')
+        # the jobs of an image run one at a time
+        self.assertEqual(sorted(job.image_id for job in
+                                ImageJob.objects.claim(100)),
+                         sorted([a.pk, a.pk + 1]))
+        self.assertEqual(ImageJob.objects.claim(100), [])
+        self.assertEqual(ImageJob.objects.filter(status='pending').count(),
+                         1)
+
+    def test_pixel_budget(self):
+        image = self.image('a.jpg', self.root)
+        max_pixels = imaging.MAX_PIXELS
+        imaging.MAX_PIXELS = 64 * 48 - 1
+        try:
+            self.run_jobs()
+        finally:
+            imaging.MAX_PIXELS = max_pixels
+        job = ImageJob.objects.get()
+        self.assertEqual(job.status, 'failed')
+        self.assertTrue(job.error.startswith('ValueError'))
+        self.assertFalse(os.path.exists(imaging.thumbnail_path(
+            image.data.path, imaging.THUMBNAIL_SIZES[0])))
+
+    def test_invalid_image(self):
+        image = ImageNode(name='a.jpg', parent=self.root, owner=self.user,
+                          data=SimpleUploadedFile('a.jpg', 'not an image'))
+        image.save()
+        self.names.append(image.data.name)
+        self.run_jobs()
+        job = ImageJob.objects.get()
+        self.assertEqual(job.status, 'failed')
+        self.assertTrue(job.error.startswith('IOError'))
+        self.assertEqual(ImageNode.objects.get(pk=image.pk).width, None)
+
+
+class ImageEditTestCase(ImageTestCase):
+
+    def test_sizes(self):
+        self.assertEqual(imaging.rotated_size(64, 48, 90), (48, 64))
+        self.assertEqual(imaging.rotated_size(64, 48, 180), (64, 48))
+        self.assertEqual(imaging.rotated_size(10, 10, 45), (15, 15))
+        imaging.check_pixels(10, 10, max_pixels=100)
+        self.assertRaises(ValueError, imaging.check_pixels, 10, 11, 100)
+
+    def test_edit_image(self):
+        path = self.image('a.jpg', self.root).data.path
+        for mode, params, size in (
+                ('resize', dict(width=32, height=24), (32, 24)),
+                ('crop', dict(width=10, height=20, x=5, y=5), (10, 20)),
+                ('rotate', dict(degree=90), (48, 64))):
+            result = imaging.edit_image(path, mode, **params)
+            try:
+                self.assertEqual((result['width'], result['height']), size)
+                self.assertEqual(Image.open(result['staged']).size, size)
+            finally:
+                os.remove(result['staged'])
+        self.assertRaises(ValueError, imaging.edit_image, path, 'crop',
+                          width=10, height=10, x=60, y=0)
+        self.assertRaises(ValueError, imaging.edit_image, path, 'flip')
+        # the original is never modified
+        self.assertEqual(Image.open(path).size, (64, 48))
+
+    def test_resize(self):
+        folder = self.mkdir('a', self.root)
+        image = self.image('a.jpg', folder)
+        copy = image.clone(name='b.jpg')
+        self.run_jobs()
+        driver = FinderDriver()
+        driver.resize(image.pk, 'resize', user=self.user, width=32,
+                      height=24)
+        self.assertEqual(self.run_jobs()[0].action, 'resize')
+        image = ImageNode.objects.get(pk=image.pk)
+        self.names.append(image.data.name)
+        self.assertEqual((image.width, image.height, image.thumb),
+                         (32, 24, None))
+        self.assertEqual(Image.open(image.data.path).size, (32, 24))
+        # the copy keeps the original content
+        copy = ImageNode.objects.get(pk=copy.pk)
+        self.assertNotEqual(copy.data.name, image.data.name)
+        self.assertEqual(Image.open(copy.data.path).size, (64, 48))
+        self.assertEqual(Blob.objects.get(name=copy.data.name).refs, 1)
+        self.assertTreeConsistent()
+        # new thumbnails are requested
+        self.assertEqual([job.action for job in self.run_jobs()],
+                         ['thumbnail'])
+        self.assertTrue(ImageNode.objects.get(pk=image.pk).thumb)
+
+    def test_invalid_resize(self):
+        driver = FinderDriver()
+        image = self.image('a.jpg', self.root)
+        ImageJob.objects.all().delete()
+        ImageNode.objects.filter(pk=image.pk).update(width=64, height=48)
+        text = self.upload('a.txt', self.root)
+        for target, mode, params in (
+                (text.pk, 'resize', dict(width=10, height=10)),
+                (image.pk, 'flip', {}),
+                (image.pk, 'resize', dict(width=0, height=10)),
+                (image.pk, 'crop', dict(width=10, height=10, x=-1)),
+                (image.pk, 'crop', dict(width=10, height=10, x=60))):
+            self.assertRaises(Exception, driver.resize, target, mode,
+                              user=self.user, **params)
+        self.assertFalse(ImageJob.objects.exists())
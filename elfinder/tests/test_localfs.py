@@ -0,0 +1,64 @@
+import base64
+import os
+import shutil
+import tempfile
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.exceptions import PermissionDenied
+from django.test import SimpleTestCase
+
+from elfinder.drivers.localfs import LocalFileSystemDriver
+
+
+class LocalFileSystemTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.root = os.path.join(self.path, 'root')
+        for folder in ('a', '.secret'):
+            os.makedirs(os.path.join(self.root, folder))
+        for name in ('a/b.txt', '.secret/key', '../outside.txt'):
+            with open(os.path.join(self.root, name), 'w') as f:
+                f.write('content')
+        os.symlink(os.path.join(self.path, 'outside.txt'),
+                   os.path.join(self.root, 'a', 'link.txt'))
+        self.driver = LocalFileSystemDriver(self.root,
+                                            has_access=lambda user: True)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def hash(self, relpath):
+        return self.driver.encode(os.path.join(self.root, relpath))
+
+    def test_decode(self):
+        self.assertEqual(self.driver.decode(self.driver.root_hash),
+                         self.driver.root)
+        self.assertEqual(self.driver.decode(self.hash('a/b.txt')),
+                         os.path.join(self.driver.root, 'a', 'b.txt'))
+        for hash in ('x', base64.urlsafe_b64encode('/\xff'),
+                     self.hash('a/missing.txt')):
+            self.assertRaises(Exception, self.driver.decode, hash)
+
+    def test_traversal(self):
+        # hashes built by hand and links leading out of the root
+        for hash in (self.hash('../outside.txt'), self.hash('a/../..'),
+                     self.hash('a/link.txt')):
+            self.assertRaises(Exception, self.driver.decode, hash)
+
+    def test_hidden(self):
+        self.assertRaises(Exception, self.driver.decode,
+                          self.hash('.secret/key'))
+        self.assertEqual(self.driver.list(self.driver.root_hash),
+                         {'list': ['a']})
+        self.driver.show_hidden = True
+        self.assertEqual(self.driver.decode(self.hash('.secret/key')),
+                         os.path.join(self.driver.root, '.secret', 'key'))
+
+    def test_access(self):
+        driver = LocalFileSystemDriver(self.root)
+        self.assertRaises(PermissionDenied, driver.list, driver.root_hash,
+                          AnonymousUser())
+        self.assertEqual(driver.list(driver.root_hash,
+                                     User(is_superuser=True, is_active=True)),
+                         {'list': ['a']})
@@ -0,0 +1,36 @@
+from elfinder.drivers.base import FinderDriver
+from elfinder.models import FileNode
+from elfinder.tests.base import TreeTestCase
+
+
+class FileMetadataTestCase(TreeTestCase):
+
+    def test_upload(self):
+        f = FileNode.objects.get(pk=self.upload('f.txt', self.root,
+                                                'x' * 10).pk)
+        self.assertEqual((f.data_size, f.mime), (10, 'text/plain'))
+        self.assertTrue(f.data_mtime is not None)
+        self.assertEqual(f.info(self.user)['ts'],
+                         f.to_timestamp(f.data_mtime))
+
+    def test_listing_without_storage(self):
+        self.upload('f.txt', self.root, 'x' * 10)
+
+        def fail(*args, **kwargs):
+            raise AssertionError('storage accessed by the listing')
+        self.storage.size = self.storage.modified_time = fail
+        try:
+            files = FinderDriver().open(self.root.pk, user=self.user)['files']
+        finally:
+            del self.storage.size, self.storage.modified_time
+        self.assertEqual([(info['name'], info['size'], info['mime'])
+                          for info in files], [(u'f.txt', 10, u'text/plain')])
+
+    def test_refresh_metadata(self):
+        f = self.upload('f.txt', self.root, 'x' * 10)
+        FileNode.objects.filter(pk=f.pk).update(data_size=0, mime=None)
+        f = FileNode.objects.get(pk=f.pk)
+        f.refresh_metadata()
+        self.assertEqual((f.data_size, f.mime), (10, 'text/plain'))
+        self.assertEqual(f.data_mtime,
+                         self.storage.modified_time(f.data.name))
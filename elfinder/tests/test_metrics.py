@@ -0,0 +1,114 @@
+from django.contrib.auth.models import AnonymousUser, User
+from django.db import connection
+from django.http import HttpResponse
+from django.test import SimpleTestCase
+from django.test.client import RequestFactory
+
+from elfinder import metrics, sites
+from elfinder.drivers.base import FinderDriver
+from elfinder.models import INode
+from elfinder.tests.base import TreeTestCase
+
+
+class StatsTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.site = sites.ElfinderSite(FinderDriver())
+
+    def stats(self, user):
+        request = RequestFactory().get('/stats/')
+        request.user = user
+        return self.site.stats(request)
+
+    def test_staff_only(self):
+        self.assertEqual(self.stats(AnonymousUser()).status_code, 403)
+        self.assertEqual(self.stats(User(is_active=True)).status_code, 403)
+        response = self.stats(User(is_active=True, is_staff=True))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+
+    def test_public(self):
+        sites.PUBLIC_STATS = True
+        try:
+            self.assertEqual(self.stats(AnonymousUser()).status_code, 200)
+        finally:
+            sites.PUBLIC_STATS = False
+
+
+class MetricsTestCase(TreeTestCase):
+
+    def setUp(self):
+        super(MetricsTestCase, self).setUp()
+        self.registry = metrics.registry
+        metrics.registry = metrics.Registry(buckets=(10, 0.5))
+
+    def tearDown(self):
+        metrics.registry = self.registry
+        super(MetricsTestCase, self).tearDown()
+
+    def test_measure(self):
+        metrics.add_bytes(read=1)
+        queries = len(connection.queries)
+        with metrics.measure('open') as measurement:
+            INode.objects.count()
+            INode.objects.count()
+            metrics.add_bytes(read=3)
+            metrics.add_bytes(written=5)
+            # the SQL is not kept outside of DEBUG
+            self.assertEqual(len(connection.queries), queries)
+        metrics.add_bytes(written=1)
+        self.assertEqual((measurement.queries, measurement.bytes_read,
+                          measurement.bytes_written), (2, 3, 5))
+        self.assertEqual(len(connection.queries), queries)
+        self.assertEqual(metrics.registry.commands['open']['count'], 1)
+        self.assertFalse('make_debug_cursor' in connection.__dict__)
+        with self.settings(DEBUG=True):
+            with metrics.measure('open') as measurement:
+                INode.objects.count()
+        self.assertEqual(measurement.queries, 1)
+        self.assertEqual(len(connection.queries), queries + 1)
+
+    def test_render(self):
+        for duration, error in ((0.1, False), (1, True)):
+            measurement = metrics.Measurement('open')
+            measurement.duration = duration
+            measurement.error = error
+            measurement.response_bytes = 10
+            metrics.registry.observe(measurement)
+        lines = metrics.registry.render().splitlines()
+        for line in (
+                'elfinder_command_duration_seconds_bucket'
+                '{command="open",le="0.5"} 1',
+                'elfinder_command_duration_seconds_bucket'
+                '{command="open",le="10"} 2',
+                'elfinder_command_duration_seconds_bucket'
+                '{command="open",le="+Inf"} 2',
+                'elfinder_command_duration_seconds_count{command="open"} 2',
+                'elfinder_command_errors_total{command="open"} 1',
+                'elfinder_response_bytes_total{command="open"} 20'):
+            self.assertTrue(line in lines, line)
+
+    def test_connector(self):
+        site = sites.ElfinderSite(FinderDriver())
+        target = site.volumes[0].encode(self.root.pk)
+        for cmd in ('open', 'size'):
+            request = RequestFactory().get('/', {'cmd': cmd,
+                                                 'target': target})
+            request.user = self.user
+            response = site.connector(request, '')
+        stats = metrics.registry.commands
+        self.assertEqual(sorted(stats), ['open', 'size'])
+        self.assertTrue(stats['open']['queries'] > 0)
+        self.assertEqual(stats['open']['errors'], 0)
+        # size wants targets
+        self.assertEqual(stats['size']['errors'], 1)
+        self.assertEqual(stats['size']['response_bytes'],
+                         len(response.content))
+
+    def test_response_size(self):
+        self.assertEqual(metrics.response_size(HttpResponse('abc')), 3)
+        response = HttpResponse('abc')
+        response['Content-Length'] = '10'
+        self.assertEqual(metrics.response_size(response), 10)
+        self.assertEqual(metrics.response_size(
+            HttpResponse(iter(['abc']))), 0)
@@ -0,0 +1,61 @@
+from datetime import datetime
+
+from elfinder import pagination
+from elfinder.models import FileNode, INode
+from elfinder.tests.base import TreeTestCase
+
+
+class PaginationTestCase(TreeTestCase):
+
+    def test_cursor(self):
+        row = {'modified': datetime(2013, 5, 1, 10, 30, 0, 250), 'id': 7}
+        cursor = pagination.encode_cursor('-modified', row)
+        self.assertEqual(pagination.decode_cursor(cursor),
+                         ('-modified', [row['modified'], 7]))
+        self.assertEqual(pagination.decode_cursor(
+            pagination.encode_cursor('name', {'name': u'\xe0.txt'})),
+            ('name', [u'\xe0.txt']))
+
+    def test_invalid_cursor(self):
+        for cursor in ('', 'not a cursor',
+                       pagination.encode_cursor('size', {'data_size': 1,
+                                                         'id': 2})[:-4]):
+            self.assertRaises(Exception, pagination.decode_cursor, cursor)
+        self.assertRaises(Exception, pagination.parse_sort, 'owner')
+
+    def test_after(self):
+        for name, content in (('a', 'xx'), ('b', 'x'), ('c', 'x'),
+                              ('d', '')):
+            self.upload('%s.txt' % name, self.root, content)
+        b = FileNode.objects.get(name='b.txt')
+        files = FileNode.objects.order_by('name')
+        self.assertEqual([node.name for node in files.filter(
+            pagination._after(('data_size', 'id'), (1, b.pk), False))],
+            ['a.txt', 'c.txt'])
+        self.assertEqual([node.name for node in files.filter(
+            pagination._after(('data_size', 'id'), (1, b.pk), True))],
+            ['d.txt'])
+
+    def read(self, limit, sort):
+        names, cursor = [], None
+        while True:
+            rows, cursor = pagination.page(
+                INode.objects.filter(parent=self.root), limit, sort, cursor)
+            names.extend(row['name'] for row in rows)
+            if cursor is None:
+                return names
+
+    def test_pages(self):
+        for i, name in enumerate(['c', 'a', 'e', 'b', 'd']):
+            self.upload('%s.txt' % name, self.root, 'x' * (i % 2))
+        self.assertEqual(self.read(2, 'name'),
+                         ['a.txt', 'b.txt', 'c.txt', 'd.txt', 'e.txt'])
+        # the last uploaded first among the files of the same size
+        self.assertEqual(self.read(1, '-size'),
+                         ['b.txt', 'a.txt', 'd.txt', 'e.txt', 'c.txt'])
+        self.assertEqual(self.read(5, None), self.read(10, 'name'))
+
+    def test_invalid_limit(self):
+        for limit in (0, -1):
+            self.assertRaises(Exception, pagination.page,
+                              INode.objects.all(), limit)
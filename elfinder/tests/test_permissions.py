@@ -0,0 +1,48 @@
+from django.contrib.auth.models import AnonymousUser, Permission, User
+from django.test import TestCase
+
+from elfinder.models import FileNode, FolderNode
+from elfinder.permissions import get_resolver
+
+
+class PermissionResolverTestCase(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('user', 'u@u.com', 'x')
+        self.user.user_permissions.add(*Permission.objects.filter(
+            codename__in=['read_folder', 'read_file', 'add_folder']))
+        # a new instance, as for every request
+        self.user = User.objects.get(pk=self.user.pk)
+
+    def test_perms_loaded_once(self):
+        resolver = get_resolver(self.user)
+        self.assertTrue(get_resolver(self.user) is resolver)
+        with self.assertNumQueries(2):
+            self.assertTrue(FolderNode().has_perm('read', self.user))
+        with self.assertNumQueries(0):
+            self.assertTrue(FileNode().has_perm('read', self.user))
+            self.assertTrue(FolderNode().has_perm('add', self.user))
+            self.assertFalse(FileNode().has_perm('remove', self.user))
+            self.assertFalse(FolderNode().has_perm('write', self.user))
+
+    def test_special_users(self):
+        superuser = User(is_superuser=True, is_active=True)
+        self.assertTrue(FolderNode().has_perm('remove', superuser))
+        for user in (AnonymousUser(), None,
+                     User(is_superuser=False, is_active=False)):
+            self.assertFalse(FolderNode().has_perm('read', user))
+
+    def test_fingerprint(self):
+        other = User.objects.create_user('other', 'o@o.com', 'x')
+        other.user_permissions.add(*Permission.objects.filter(
+            codename__in=['read_folder', 'read_file', 'add_folder']))
+        other = User.objects.get(pk=other.pk)
+        self.assertEqual(get_resolver(self.user).fingerprint,
+                         get_resolver(other).fingerprint)
+        self.assertNotEqual(get_resolver(self.user).fingerprint,
+                            get_resolver(User(pk=3,
+                                              is_active=True)).fingerprint)
+        self.assertEqual(get_resolver(AnonymousUser()).fingerprint,
+                         'anonymous')
+        self.assertEqual(get_resolver(User(is_superuser=True)).fingerprint,
+                         'superuser')
@@ -0,0 +1,68 @@
+import os
+import shutil
+import threading
+import time
+
+from django.conf import settings
+from django.test import SimpleTestCase
+
+from elfinder import pools, utils as elutils
+from elfinder.models import FileNode
+
+
+class IOMapTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.io_threads = pools.IO_THREADS
+
+    def tearDown(self):
+        pools.IO_THREADS = self.io_threads
+
+    def test_order(self):
+        pools.IO_THREADS = 4
+        self.assertEqual(pools.io_map(lambda n: n * 2, xrange(20)),
+                         range(0, 40, 2))
+        self.assertEqual(pools.io_map(lambda n: n * 2, xrange(20), 3),
+                         range(0, 40, 2))
+        self.assertEqual(pools.io_map(lambda n: n, []), [])
+
+    def test_threads(self):
+        pools.IO_THREADS = 4
+
+        def blocking(n):
+            # a thread alone could take all the items otherwise
+            time.sleep(0.01)
+            return threading.current_thread()
+        threads = set(pools.io_map(blocking, range(20)))
+        self.assertTrue(1 < len(threads) <= 4)
+        self.assertFalse(threading.current_thread() in threads)
+        # a single chunk, or no threads, runs in the calling thread
+        self.assertEqual(pools.io_map(lambda n: threading.current_thread(),
+                                      range(3), 3),
+                         [threading.current_thread()] * 3)
+        pools.IO_THREADS = 0
+        self.assertEqual(set(pools.io_map(
+            lambda n: threading.current_thread(), range(20))),
+            set([threading.current_thread()]))
+
+    def test_exception(self):
+        pools.IO_THREADS = 4
+
+        def func(n):
+            if n == 7:
+                raise ValueError(n)
+            return n
+        self.assertRaises(ValueError, pools.io_map, func, range(20))
+
+    def test_new_upload_folder(self):
+        # the threads of an extract create the folder of the day together
+        path = os.path.join(settings.MEDIA_ROOT, 'pools-test')
+        try:
+            names = pools.io_map(
+                lambda name: elutils.get_path_for_upload(
+                    FileNode(), name, 'pools-test/new'),
+                ['a%d.txt' % i for i in range(20)])
+            self.assertEqual(len(set(names)), 20)
+            self.assertTrue(os.path.isdir(os.path.join(path, 'new')))
+        finally:
+            shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,57 @@
+from elfinder.drivers.base import FinderDriver
+from elfinder.models import INode, NameTrigram
+from elfinder.tests.base import TreeTestCase
+
+
+class SearchTestCase(TreeTestCase):
+
+    def setUp(self):
+        super(SearchTestCase, self).setUp()
+        self.a = self.mkdir('a', self.root)
+        for name, parent in (('report.txt', self.root),
+                             ('old report', self.a),
+                             ('Report', self.a),
+                             ('repo', self.root)):
+            self.mkdir(name, parent)
+
+    def search(self, q, root=None):
+        return [node.name for node in INode.objects.search(q, root)]
+
+    def test_ranking(self):
+        # exact matches first, then prefixes, then the others by name
+        self.assertEqual(self.search('REPORT'),
+                         ['Report', 'report.txt', 'old report'])
+        # too short for the trigrams, only the prefixes match
+        self.assertEqual(self.search('po'), [])
+        self.assertEqual(sorted(self.search('RE')),
+                         ['Report', 'repo', 'report.txt'])
+        self.assertEqual(self.search('report', self.a),
+                         ['Report', 'old report'])
+
+    def test_rename(self):
+        node = INode.objects.get(name='repo')
+        node.name = 'summary'
+        node.save()
+        self.assertEqual(self.search('repo'),
+                         ['Report', 'report.txt', 'old report'])
+        self.assertEqual(self.search('summ'), ['summary'])
+        self.assertEqual(set(NameTrigram.objects.filter(
+            inode=node).values_list('trigram', flat=True)),
+            set(['sum', 'umm', 'mma', 'mar', 'ary']))
+
+    def test_rebuild(self):
+        NameTrigram.objects.all().delete()
+        self.assertEqual(NameTrigram.objects.rebuild(batch_size=2),
+                         INode.objects.count())
+        self.assertEqual(self.search('report'),
+                         ['Report', 'report.txt', 'old report'])
+
+    def test_driver(self):
+        driver = FinderDriver(search_limit=2)
+        files = driver.search('report', user=self.user,
+                              root=self.root.pk)['files']
+        self.assertEqual([info['name'] for info in files],
+                         ['Report', 'report.txt'])
+        files = driver.search('report', user=self.user, root=self.root.pk,
+                              offset=2)['files']
+        self.assertEqual([info['name'] for info in files], ['old report'])
@@ -0,0 +1,49 @@
+from django.core.files.uploadedfile import SimpleUploadedFile
+
+from elfinder import serializers
+from elfinder.models import ImageNode, INode
+from elfinder.tests.base import TreeTestCase
+
+
+class IterInfosTestCase(TreeTestCase):
+
+    def setUp(self):
+        super(IterInfosTestCase, self).setUp()
+        self.a = self.mkdir('a', self.root)
+        self.mkdir('b', self.a)
+        self.mkdir('empty', self.root)
+        self.upload('f.txt', self.a)
+        self.image = ImageNode(name='i.jpg', parent=self.a, owner=self.user,
+                               data=SimpleUploadedFile('i.jpg', 'jpeg'))
+        self.image.save()
+        self.names.append(self.image.data.name)
+        # as left by the thumbnail job
+        ImageNode.objects.filter(pk=self.image.pk).update(
+            width=64, height=48, thumb='thumbs/i.jpg')
+
+    def test_same_as_info(self):
+        queryset = INode.objects.order_by('pk')
+        with self.assertNumQueries(1):
+            infos = list(serializers.iter_infos(queryset, self.user,
+                                                self.root))
+        # select_subclasses resolves images as FileNode
+        expected = [(ImageNode.objects.get(pk=inode.pk)
+                     if inode.pk == self.image.pk else inode).info(self.user)
+                    for inode in queryset.select_subclasses()]
+        for inode in expected:
+            if inode['hash'] == self.root.pk:
+                inode['phash'] = ''
+        self.assertEqual(infos, expected)
+        dims = dict((info['name'], (info.get('dirs'), info.get('dim'),
+                                    info.get('tmb'))) for info in infos)
+        self.assertEqual(dims['a'], (1, None, None))
+        self.assertEqual(dims['empty'], (0, None, None))
+        self.assertEqual(dims['i.jpg'], (None, '64x48', 'thumbs/i.jpg'))
+
+    def test_rows(self):
+        rows = list(serializers.info_values(INode.objects.filter(
+            pk=self.a.pk)))
+        with self.assertNumQueries(0):
+            infos = list(serializers.iter_infos(rows, self.user))
+        self.assertEqual([(info['name'], info['phash']) for info in infos],
+                         [('a', self.root.pk)])
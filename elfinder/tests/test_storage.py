@@ -0,0 +1,75 @@
+import os
+import shutil
+import tempfile
+
+from django.core.files.base import ContentFile
+
+from elfinder.models import Blob, FileNode, atomic
+from elfinder.storage import ContentAddressedStorage
+from elfinder.tests.base import TreeTestCase
+
+
+class ContentAddressedStorageTestCase(TreeTestCase):
+
+    def setUp(self):
+        super(ContentAddressedStorageTestCase, self).setUp()
+        self.location = tempfile.mkdtemp()
+        self.cas = ContentAddressedStorage(self.location)
+
+    def tearDown(self):
+        shutil.rmtree(self.location)
+        super(ContentAddressedStorageTestCase, self).tearDown()
+
+    def test_same_content_is_stored_once(self):
+        a = self.cas.save('a.txt', ContentFile('content'))
+        b = self.cas.save('b.txt', ContentFile('content'))
+        c = self.cas.save('a.txt', ContentFile('other'))
+        self.assertEqual(a, b)
+        self.assertNotEqual(a, c)
+        digest = '040f06fd774092478d450774f5ba30c5da78acc8'
+        self.assertEqual(a, 'cas/04/0f/%s' % digest)
+        self.assertEqual(self.cas.open(a).read(), 'content')
+        # nothing is left in the staging directory
+        self.assertEqual(os.listdir(self.cas.path('cas/tmp')), [])
+
+    def test_release_shared_content(self):
+        name = self.cas.save('a.txt', ContentFile('content'))
+        Blob.objects.acquire([name, name])
+        Blob.objects.release([name], self.cas)
+        self.assertEqual(Blob.objects.get(name=name).refs, 1)
+        self.assertTrue(self.cas.exists(name))
+        Blob.objects.release([name], self.cas)
+        self.assertFalse(Blob.objects.filter(name=name).exists())
+        self.assertFalse(self.cas.exists(name))
+
+    def test_wrong_count_keeps_content(self):
+        node = self.upload('a.txt', self.root)
+        name = node.data.name
+        Blob.objects.filter(name=name).update(refs=0)
+        Blob.objects.release([name], self.storage)
+        # a file still points to the content
+        self.assertTrue(self.storage.exists(name))
+
+    def test_discard(self):
+        used = self.upload('a.txt', self.root).data.name
+        unused = self.storage.save('b.txt', ContentFile('content'))
+        self.names.append(unused)
+        Blob.objects.discard([used, unused], self.storage)
+        self.assertTrue(self.storage.exists(used))
+        self.assertFalse(self.storage.exists(unused))
+
+    def test_delete_after_commit(self):
+        name = self.upload('a.txt', self.root).data.name
+        try:
+            with atomic():
+                FileNode.objects.get(data=name).delete()
+                raise ValueError
+        except ValueError:
+            pass
+        # the rollback cannot bring back a deleted content
+        self.assertTrue(self.storage.exists(name))
+        name = self.upload('b.txt', self.root).data.name
+        with atomic():
+            FileNode.objects.get(data=name).delete()
+            self.assertTrue(self.storage.exists(name))
+        self.assertFalse(self.storage.exists(name))
@@ -0,0 +1,55 @@
+import simplejson as json
+from django.test import SimpleTestCase
+from django.test.client import RequestFactory
+
+from elfinder import sites, streaming
+from elfinder.drivers.base import FinderDriver
+from elfinder.tests.base import TreeTestCase
+
+
+class IterEncodeTestCase(SimpleTestCase):
+
+    def test_is_streamed(self):
+        self.assertTrue(streaming.is_streamed({'a': 1, 'b': iter([])}))
+        self.assertFalse(streaming.is_streamed({'a': [1]}))
+        self.assertFalse(streaming.is_streamed(iter([])))
+
+    def test_iterencode(self):
+        content = {'files': (dict(name='f%d' % i) for i in range(100)),
+                   'empty': iter([]), 'cwd': {'name': 'a'}, 'n': 1}
+        pieces = list(streaming.iterencode(content, buffer_size=64))
+        self.assertTrue(len(pieces) > 10)
+        self.assertEqual(json.loads(''.join(pieces)), {
+            'files': [dict(name='f%d' % i) for i in range(100)],
+            'empty': [], 'cwd': {'name': 'a'}, 'n': 1})
+
+
+class StreamingDriverTestCase(TreeTestCase):
+
+    def setUp(self):
+        super(StreamingDriverTestCase, self).setUp()
+        a = self.mkdir('a', self.root)
+        self.mkdir('b', a)
+        for i in range(5):
+            self.upload('f%d.txt' % i, a)
+        self.target = a
+
+    def get(self, driver, cmd):
+        site = sites.ElfinderSite(driver)
+        sites.response_cache.clear()
+        request = RequestFactory().get('/', {
+            'cmd': cmd, 'target': site.volumes[0].encode(self.target.pk)})
+        request.user = self.user
+        return site.connector(request, '')
+
+    def test_open(self):
+        driver = FinderDriver(streaming=True)
+        content = driver.open(self.root.pk, self.target.pk, user=self.user)
+        self.assertTrue(streaming.is_iterator(content['files']))
+        for cmd in ('open', 'list'):
+            expected = json.loads(self.get(FinderDriver(), cmd).content)
+            self.assertFalse('error' in expected)
+            streamed = self.get(driver, cmd)
+            self.assertEqual(streamed['Content-Type'], 'application/json')
+            self.assertEqual(json.loads(''.join(streamed)), expected)
+        self.assertEqual(len(expected['list']), 6)
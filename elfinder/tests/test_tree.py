@@ -0,0 +1,135 @@
+from django.db import connection
+
+from elfinder import bulk
+from elfinder.drivers.base import FinderDriver
+from elfinder.models import FileNode, FolderNode, INode
+from elfinder.tests.base import TreeTestCase
+
+
+class TreePathTestCase(TreeTestCase):
+
+    def test_move_subtree(self):
+        a = self.mkdir('a', self.root)
+        b = self.mkdir('b', a)
+        c = self.mkdir('c', b)
+        self.upload('f.txt', c, 'x' * 10)
+        self.upload('g.txt', b, 'x' * 5)
+        other = self.mkdir('other', self.root)
+        bulk.move_nodes(self.reload(b), other)
+        self.assertTreeConsistent()
+        self.assertEqual(FolderNode.objects.get(pk=a.pk).total_bytes, 0)
+        self.assertEqual(FolderNode.objects.get(pk=other.pk).aggregates,
+                         (15, 5))
+        self.assertEqual(INode.objects.get(pk=c.pk).level, 3)
+
+    def test_ancestors_and_descendants(self):
+        a = self.mkdir('a', self.root)
+        b = self.mkdir('b', a)
+        f = self.upload('f.txt', b)
+        self.assertEqual(INode.objects.get(pk=f.pk).ancestor_ids,
+                         [self.root.pk, a.pk, b.pk])
+        self.assertEqual(sorted(INode.objects.filter(
+            tree_path__startswith=a.tree_path).values_list('pk', flat=True)),
+            [a.pk, b.pk, f.pk])
+
+    def test_rebuild_tree(self):
+        a = self.mkdir('a', self.root)
+        b = self.mkdir('b', a)
+        for i in range(3):
+            self.mkdir('c%d' % i, self.mkdir('d%d' % i, b))
+        INode.objects.update(tree_path='', level=0)
+        # a query and an executemany for every level
+        with self.assertNumQueries(11):
+            self.assertEqual(INode.objects.rebuild_tree(), 9)
+        self.assertEqual(INode.objects.get(pk=b.pk).level, 2)
+        self.assertTreeConsistent()
+        INode.objects.update(tree_path='', level=0)
+        self.assertEqual(INode.objects.rebuild_tree(batch_size=2), 9)
+        self.assertTreeConsistent()
+
+
+class ShallowTreeTestCase(TreeTestCase):
+
+    def setUp(self):
+        super(ShallowTreeTestCase, self).setUp()
+        self.driver = FinderDriver()
+        self.a = self.mkdir('a', self.root)
+        self.b = self.mkdir('b', self.a)
+        self.c = self.mkdir('c', self.b)
+        self.upload('f.txt', self.a)
+        self.upload('g.txt', self.b)
+
+    def listed(self, infos):
+        return sorted(info['name'] for info in infos)
+
+    def test_open(self):
+        files = self.driver.open(self.root.pk, self.a.pk,
+                                 user=self.user)['files']
+        self.assertEqual(self.listed(files), ['b', 'f.txt'])
+        self.assertEqual([info['dirs'] for info in files
+                          if info['name'] == 'b'], [1])
+        self.driver.lazy = False
+        files = self.driver.open(self.root.pk, self.a.pk,
+                                 user=self.user)['files']
+        self.assertEqual(self.listed(files), ['b', 'c', 'f.txt', 'g.txt'])
+
+    def test_open_tree(self):
+        files = self.driver.open(self.root.pk, self.b.pk, tree=True,
+                                 user=self.user)['files']
+        # the children of b, then b with its ancestors and their subfolders
+        self.assertEqual(self.listed(files),
+                         sorted(['a', 'b', 'c', 'g.txt', self.root.name]))
+
+    def test_tree(self):
+        tree = self.driver.tree(self.root.pk, self.a.pk, user=self.user)
+        self.assertEqual(self.listed(tree['tree']), ['b'])
+        self.driver.tree_depth = 2
+        tree = self.driver.tree(self.root.pk, self.a.pk, user=self.user)
+        self.assertEqual(self.listed(tree['tree']), ['b', 'c'])
+
+    def test_parents(self):
+        other = self.mkdir('other', self.root)
+        parents = self.driver.parents(self.root.pk, self.c.pk,
+                                      user=self.user)['parents']
+        self.assertEqual(self.listed(parents),
+                         sorted(['a', 'b', 'c', 'other', self.root.name]))
+        self.assertEqual([info['phash'] for info in parents
+                          if info['hash'] == self.root.pk], [''])
+
+
+class GetHashesTestCase(TreeTestCase):
+
+    def test_get_hashes(self):
+        a = self.mkdir('a', self.root)
+        f = self.upload('f.txt', a)
+        with self.assertNumQueries(1):
+            inodes = INode.objects.get_hashes([str(f.pk), a.pk, f.pk])
+        self.assertEqual([(inode.pk, type(inode)) for inode in inodes],
+                         [(f.pk, FileNode), (a.pk, FolderNode),
+                          (f.pk, FileNode)])
+        self.assertRaises(INode.DoesNotExist, INode.objects.get_hashes,
+                          [a.pk, 1000])
+        for target in ('x', '1x', None):
+            self.assertRaises(INode.DoesNotExist, INode.objects.get_hashes,
+                              [a.pk, target])
+            self.assertRaises(INode.DoesNotExist, INode.objects.get_hash,
+                              target)
+        # the driver reports it as any missing target
+        self.assertRaises(INode.DoesNotExist, FinderDriver().size,
+                          ['x'])
+        bulk.delete_nodes(self.reload(a))
+        self.assertRaises(INode.DoesNotExist, INode.objects.get_hashes,
+                          [a.pk])
+
+    def test_remove(self):
+        # the queries do not depend on the number of targets
+        driver = FinderDriver()
+        queries = []
+        for count in (1, 10):
+            folders = [self.mkdir('%d-%d' % (count, i), self.root).pk
+                       for i in range(count)]
+            start = len(connection.queries)
+            with self.settings(DEBUG=True):
+                driver.remove(folders, user=self.user)
+            queries.append(len(connection.queries) - start)
+        self.assertEqual(queries[0], queries[1])
@@ -0,0 +1,81 @@
+import os
+import shutil
+import tempfile
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase
+
+from elfinder import uploads
+
+
+class ChunkedUploadTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.staging_root = uploads.STAGING_ROOT
+        uploads.STAGING_ROOT = tempfile.mkdtemp()
+        self.user = User(pk=1, username='admin')
+
+    def tearDown(self):
+        shutil.rmtree(uploads.STAGING_ROOT)
+        uploads.STAGING_ROOT = self.staging_root
+
+    def send(self, part, first, data, user=None):
+        upload, part, first, length = uploads.ChunkedUpload.start(
+            user or self.user, 'cid', 'a.txt.%d_2.part' % part,
+            '%d,%d,10' % (first, len(data)))
+        upload.write(part, first, length, SimpleUploadedFile('blob', data))
+        return upload
+
+    def test_out_of_order(self):
+        self.send(2, 8, 'ij')
+        upload = self.send(0, 0, 'abcd')
+        self.assertFalse(upload.is_complete())
+        self.assertRaises(Exception, upload.open, self.user)
+        self.assertEqual(self.send(1, 4, 'efgh').key, upload.key)
+        self.assertTrue(upload.is_complete())
+        content = upload.open(self.user)
+        try:
+            self.assertEqual(content.name, 'a.txt')
+            self.assertEqual(content.read(), 'abcdefghij')
+        finally:
+            content.close()
+        # only the uploader can complete it
+        self.assertRaises(Exception, upload.open, User(pk=2))
+        upload.delete()
+
+    def test_invalid_chunks(self):
+        for chunk, chunk_range in (('a.txt', '0,4,10'),
+                                   ('a.txt.3_2.part', '0,4,10'),
+                                   ('a.txt.0_2.part', '8,4,10'),
+                                   ('../a.txt.0_2.part', '0,4,10'),
+                                   ('a/b.txt.0_2.part', '0,4,10'),
+                                   ('a\\b.txt.0_2.part', '0,4,10'),
+                                   ('...0_2.part', '0,4,10'),
+                                   ('a.txt.0_2.part', '-4,4,10'),
+                                   ('a.txt.0_2.part', '4,-4,10')):
+            self.assertRaises(Exception, uploads.ChunkedUpload.start,
+                              self.user, 'cid', chunk, chunk_range)
+        self.assertRaises(Exception, uploads.ChunkedUpload, '../a')
+
+    def test_incomplete_chunk(self):
+        upload, part, first, length = uploads.ChunkedUpload.start(
+            self.user, 'cid', 'a.txt.0_2.part', '0,4,10')
+        self.assertRaises(Exception, upload.write, part, first, length,
+                          SimpleUploadedFile('blob', 'ab'))
+        self.assertFalse(upload.is_complete())
+
+    def test_max_size(self):
+        size = uploads.MAX_SIZE + 1
+        self.assertRaises(Exception, uploads.ChunkedUpload.start, self.user,
+                          'cid', 'a.txt.1_1.part', '%d,1,%d' % (size - 1,
+                                                                size))
+        # nothing is staged
+        self.assertEqual(os.listdir(uploads.STAGING_ROOT), [])
+
+    def test_meta(self):
+        upload = self.send(0, 0, 'abcd')
+        self.assertEqual(sorted(os.listdir(upload.path)),
+                         ['data', 'meta', 'part-0'])
+        self.assertEqual(upload.meta, {'user': 1, 'name': 'a.txt',
+                                       'size': 10, 'last': 2})
@@ -0,0 +1,93 @@
+import simplejson as json
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase
+from django.test.client import RequestFactory
+
+from elfinder.models import INode
+from elfinder.sites import ElfinderSite
+from elfinder.tests.base import TreeTestCase
+from elfinder.volumes import Volume, VolumeRouter, get_active
+
+
+class Driver(object):
+    commands = {}
+
+
+class VolumeTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.volume = Volume('2', driver=Driver(), root='7', using='other')
+
+    def test_decode(self):
+        self.assertEqual(self.volume.decode('l2_15'), '15')
+        # hashes without prefix are primary keys already
+        self.assertEqual(self.volume.decode('15'), '15')
+        self.assertRaises(ValueError, self.volume.decode, 'l1_15')
+        self.volume.strict = True
+        self.assertRaises(ValueError, self.volume.decode, '15')
+        self.volume.strict = False
+        self.assertEqual(self.volume.decode_params({
+            'target': 'l2_3', 'targets': ['l2_4', 'l2_5'], 'name': 'l2_6'}),
+            {'target': '3', 'targets': ['4', '5'], 'name': 'l2_6'})
+
+    def test_encode_content(self):
+        content = self.volume.encode_content({
+            'cwd': {'hash': 7, 'phash': None},
+            'files': [{'hash': 8, 'phash': 7}],
+            'removed': [9],
+            'list': ['a.txt']})
+        self.assertEqual(content, {
+            'cwd': {'hash': 'l2_7', 'phash': '', 'volumeid': 'l2_'},
+            'files': [{'hash': 'l2_8', 'phash': 'l2_7'}],
+            'removed': ['l2_9'],
+            'list': ['a.txt']})
+
+    def test_encode_streamed_content(self):
+        # streamed values are read after the command, with the volume
+        # active again
+        def infos():
+            yield {'hash': get_active().root, 'phash': None}
+        content = self.volume.encode_content({
+            'files': infos(),
+            'list': (get_active().id for i in range(2))})
+        self.assertEqual(get_active(), None)
+        self.assertEqual(list(content['files']),
+                         [{'hash': 'l2_7', 'phash': '', 'volumeid': 'l2_'}])
+        self.assertEqual(list(content['list']), ['2', '2'])
+
+    def test_router(self):
+        router = VolumeRouter()
+        self.assertEqual(router.db_for_read(INode), None)
+        with self.volume:
+            self.assertEqual(router.db_for_read(INode), 'other')
+            self.assertEqual(router.db_for_write(INode), 'other')
+            self.assertEqual(router.db_for_read(User), None)
+            self.assertEqual(router.db_for_read(
+                User, instance=INode(name='a')), 'default')
+        self.assertEqual(get_active(), None)
+
+
+class SharedDatabaseTestCase(TreeTestCase):
+
+    def setUp(self):
+        super(SharedDatabaseTestCase, self).setUp()
+        self.a = self.mkdir('a', self.root)
+        self.b = self.mkdir('b', self.root)
+        self.c = self.mkdir('c', self.b)
+        self.site = ElfinderSite(volumes=[Volume('1', root=self.a.pk),
+                                          Volume('2', root=self.b.pk)])
+
+    def open(self, target):
+        request = RequestFactory().get('/', {'cmd': 'open',
+                                             'target': target})
+        request.user = self.user
+        return json.loads(self.site.connector(request, '').content)
+
+    def test_other_volume(self):
+        self.assertEqual(self.open('l2_%s' % self.c.pk)['cwd']['hash'],
+                         'l2_%s' % self.c.pk)
+        for target in ('l1_%s' % self.c.pk, str(self.c.pk),
+                       'l9_%s' % self.c.pk):
+            content = self.open(target)
+            self.assertTrue('error' in content, target)
+            self.assertFalse('cwd' in content)
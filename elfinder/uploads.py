@@ -0,0 +1,154 @@
+"""
+Staging area of the chunked uploads (elFinder 2.1 protocol). Chunks are
+written straight at their offset in the staged file, so they can arrive
+out of order or in parallel and the file is never copied to be assembled.
+"""
+import errno
+import os
+import re
+import shutil
+import tempfile
+import time
+from hashlib import md5
+
+import simplejson as json
+from django.conf import settings
+from django.core.files import File
+
+from elfinder import metrics
+
+# the staging area must be on the same filesystem of MEDIA_ROOT, so that
+# completed files are moved in place with a rename, but outside of it, as
+# MEDIA_ROOT is served to anyone
+STAGING_ROOT = getattr(settings, 'ELFINDER_UPLOAD_STAGING_ROOT',
+                       settings.MEDIA_ROOT.rstrip('/') + '.staging')
+# seconds after which an incomplete upload is removed
+STAGING_TTL = getattr(settings, 'ELFINDER_UPLOAD_STAGING_TTL', 24 * 3600)
+# largest file, in bytes, sent in chunks. The client is told as uplMaxSize.
+MAX_SIZE = getattr(settings, 'ELFINDER_UPLOAD_MAX_SIZE', 1024 * 1024 * 1024)
+
+# the name becomes the name of an inode, it cannot contain separators
+CHUNK_RE = re.compile(
+    r'^(?P<name>[^/\\]+)\.(?P<part>\d+)_(?P<last>\d+)\.part$')
+
+_last_purge = 0
+
+
+class StagedFile(File):
+    """
+    A completed upload. Like TemporaryUploadedFile it exposes
+    temporary_file_path, so FileSystemStorage moves it instead of copying.
+    """
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+class ChunkedUpload(object):
+
+    def __init__(self, key):
+        if not re.match(r'^[0-9a-f]{32}$', key):
+            raise Exception('Invalid chunked upload %s' % key)
+        self.key = key
+        self.path = os.path.join(STAGING_ROOT, key)
+        self.data_path = os.path.join(self.path, 'data')
+        self.meta_path = os.path.join(self.path, 'meta')
+
+    @classmethod
+    def start(cls, user, cid, chunk, chunk_range):
+        """
+        Returns the upload a chunk belongs to and the position of the chunk,
+        from the chunk, cid and range parameters of the request
+        """
+        match = CHUNK_RE.match(chunk)
+        if not match or match.group('name') in ('.', '..'):
+            raise Exception('Invalid chunk name %s' % chunk)
+        first, length, size = [int(n) for n in chunk_range.split(',')]
+        part, last = int(match.group('part')), int(match.group('last'))
+        if part > last or first < 0 or length < 0 or first + length > size:
+            raise Exception('Invalid chunk %s' % chunk)
+        # checked before writing at first, a sparse file takes no space
+        # until the chunks fill it
+        if size > MAX_SIZE:
+            raise Exception('%s exceeds the maximum size of %d bytes' % (
+                match.group('name'), MAX_SIZE))
+        upload = cls(md5('%s:%s:%s:%s' % (user.pk, cid, match.group('name'),
+                                          size)).hexdigest())
+        try:
+            os.makedirs(upload.path)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        if not os.path.exists(upload.meta_path):
+            # renamed in place, the concurrent chunks never read a
+            # truncated file
+            meta = tempfile.NamedTemporaryFile(dir=upload.path,
+                                               prefix='meta-', delete=False)
+            try:
+                json.dump({'user': user.pk, 'name': match.group('name'),
+                           'size': size, 'last': last}, meta)
+            finally:
+                meta.close()
+            os.rename(meta.name, upload.meta_path)
+        return upload, part, first, length
+
+    @property
+    def meta(self):
+        with open(self.meta_path) as meta:
+            return json.load(meta)
+
+    def write(self, part, first, length, content):
+        """
+        Write content, an UploadedFile, at first in the staged file
+        """
+        fd = os.open(self.data_path, os.O_WRONLY | os.O_CREAT, 0644)
+        written = 0
+        try:
+            os.lseek(fd, first, os.SEEK_SET)
+            for data in content.chunks():
+                os.write(fd, data)
+                written += len(data)
+        finally:
+            os.close(fd)
+        metrics.add_bytes(written=written)
+        if written != length:
+            raise Exception('Chunk %s is incomplete' % part)
+        # the marker is created only when the chunk is on the disk
+        open(os.path.join(self.path, 'part-%d' % part), 'w').close()
+
+    def is_complete(self):
+        parts = [name for name in os.listdir(self.path)
+                 if name.startswith('part-')]
+        return len(parts) == self.meta['last'] + 1
+
+    def open(self, user):
+        """
+        Returns the completed file, if it has been uploaded by user
+        """
+        meta = self.meta
+        if meta['user'] != user.pk or not self.is_complete():
+            raise Exception('Upload %s is not complete' % meta['name'])
+        return StagedFile(open(self.data_path, 'rb'), name=meta['name'])
+
+    def delete(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+def purge_staging(ttl=STAGING_TTL):
+    """
+    Remove the uploads not modified in the last ttl seconds. It is called
+    by the upload command, at most once every ttl / 10 seconds.
+    """
+    global _last_purge
+    now = time.time()
+    if now - _last_purge < ttl / 10 or not os.path.exists(STAGING_ROOT):
+        return
+    _last_purge = now
+    for name in os.listdir(STAGING_ROOT):
+        path = os.path.join(STAGING_ROOT, name)
+        try:
+            if now - os.path.getmtime(path) > ttl:
+                shutil.rmtree(path, ignore_errors=True)
+        except OSError:
+            # removed by another process in the meantime
+            continue
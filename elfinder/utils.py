@@ -1,3 +1,4 @@
+import errno
 import os
 
 from django.conf import settings
@@ -6,16 +7,24 @@ from django.conf import settings
 def get_path_for_upload(instance, filename, rel_path=None):
     """
     This method build the filename base on a path with structure yyyy/mm/dd
-    and an available filename in that folder
+    and an available filename in that folder. Content addressed storages
+    name the files by themselves, so no folder is created or probed.
     """
+    storage = instance._meta.get_field('data').storage
+    if getattr(storage, 'content_addressed', False):
+        return filename
     if not rel_path:
         from datetime import datetime
         now = datetime.now()
         rel_path = '%4d/%02d/%02d' % (now.year, now.month, now.day)
     path = os.path.join(settings.MEDIA_ROOT, rel_path)
-    # create directory if doesn't exist'
-    if not os.path.exists(path):
+    # create directory if doesn't exist, another thread or process may be
+    # creating it at the same time
+    try:
         os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
     i = 0
     while True:
         fullfilename = os.path.join(path, '%02d%s' % (i, filename))
@@ -26,4 +35,24 @@ def get_path_for_upload(instance, filename, rel_path=None):
 
 
 def get_url(filename):
-    return '/' + filename.replace(settings.MEDIA_ROOT, settings.MEDIA_URL)
\ No newline at end of file
+    if not os.path.isabs(filename):
+        # name relative to the storage, as saved by ContentAddressedStorage
+        return settings.MEDIA_URL + filename
+    return '/' + filename.replace(settings.MEDIA_ROOT, settings.MEDIA_URL)
+
+
+def get_trigrams(name):
+    """
+    Returns the set of lowercase trigrams of name, used by the search index
+    """
+    name = name.lower()
+    return set(name[i:i + 3] for i in range(len(name) - 2))
+
+
+def chunked(items, size):
+    """
+    Yields lists of at most size items, used to keep bulk queries bounded
+    """
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
@@ -0,0 +1,254 @@
+"""
+Volumes of an ElfinderSite. Every volume has its own root folder, its own
+driver and optionally its own database, so that a big tree can be split
+across databases. Hashes sent to the client are prefixed with the id of the
+volume, as in elFinder 2 ('l1_23' is the inode 23 of the volume 1), and the
+connector runs every command with the volume of its target active. With
+more than one volume the hashes without prefix are rejected, and so are the
+inodes outside of the root of the volume named in the hash.
+
+To keep the inodes of the volumes in different databases add the router to
+the settings:
+
+    DATABASE_ROUTERS = ['elfinder.volumes.VolumeRouter']
+
+and pass the alias of the database to the volumes:
+
+    site = ElfinderSite(volumes=[Volume('1'), Volume('2', using='archive')])
+
+Every database has its own Blob table, so volumes in different databases
+must not share a content addressed storage.
+
+The owners of the inodes are read from the default database, but INode.owner
+is a foreign key: on backends enforcing it (PostgreSQL, MySQL with InnoDB)
+the users must be replicated to the auth_user table of every database of a
+volume, with the same primary keys, or the inserts fail.
+"""
+import re
+import threading
+
+from django.db import DEFAULT_DB_ALIAS
+
+from elfinder.dispatch import CommandBinder
+
+HASH_RE = re.compile(r'^l(?P<volume>[A-Za-z0-9]+)_(?P<pk>.*)$')
+# parameters of the commands holding hashes
+HASH_PARAMS = ('target', 'current', 'src', 'dst')
+# keys of the responses holding lists of inodes
+INFO_KEYS = ('files', 'tree', 'parents', 'added', 'changed')
+
+_active = threading.local()
+
+
+def get_active():
+    """
+    Returns the volume the current thread works on, None if there is none
+    """
+    return getattr(_active, 'volume', None)
+
+
+def activate(volume):
+    _active.volume = volume
+
+
+def deactivate():
+    _active.volume = None
+
+
+class Volume(object):
+    """
+    A tree of inodes served by driver, starting at the folder root and
+    stored in the database using (the default one if None). Activate the
+    volume with a with statement to run queries on its database.
+    """
+
+    def __init__(self, id, driver=None, root=None, using=None):
+        from elfinder.drivers.base import FinderDriver
+        from elfinder.models import INode
+        self.id = str(id)
+        self.driver = driver or FinderDriver()
+        # drivers not backed by the inode tables have their own root
+        self.root = str(root or getattr(self.driver, 'root_hash', None) or
+                        INode.ROOT['PK'])
+        self.using = using
+        self.prefix = 'l%s_' % self.id
+        # set by sites with more than one volume: the hashes must have the
+        # prefix of the volume
+        self.strict = False
+        # signatures of the driver commands are inspected only once
+        param_types = getattr(self.driver, 'param_types', {})
+        self.binders = dict((cmd, CommandBinder(self.driver, cmd, param_types))
+                            for cmd in self.driver.commands)
+
+    def __repr__(self):
+        return '<Volume %s>' % self.id
+
+    def __enter__(self):
+        # volumes are shared by the threads, the previous one is kept in
+        # the thread
+        _active.__dict__.setdefault('previous', []).append(get_active())
+        activate(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        activate(_active.previous.pop())
+
+    def owns(self, hash):
+        return str(hash).startswith(self.prefix)
+
+    def encode(self, pk):
+        """
+        Returns the hash of the inode pk, '' for no inode
+        """
+        if pk in (None, ''):
+            return ''
+        return '%s%s' % (self.prefix, pk)
+
+    def decode(self, hash):
+        """
+        Returns the primary key of the inode with hash. Hashes without
+        prefix are primary keys already, unless the volume is strict.
+        """
+        match = HASH_RE.match(str(hash))
+        if match is None:
+            if self.strict:
+                raise ValueError('%s does not belong to the volume %s' % (
+                    hash, self.id))
+            return hash
+        if match.group('volume') != self.id:
+            raise ValueError('%s does not belong to the volume %s' % (
+                hash, self.id))
+        return match.group('pk')
+
+    def decode_params(self, data):
+        """
+        Replaces the hashes of the parameters of a command with primary keys
+        """
+        for name in HASH_PARAMS:
+            if data.get(name):
+                data[name] = self.decode(data[name])
+        if data.get('targets'):
+            data['targets'] = [self.decode(hash) for hash in data['targets']]
+        self.check_params(data)
+        return data
+
+    def check_params(self, data):
+        """
+        Raises ValueError if an inode of the decoded parameters is outside
+        of the root of the volume, i.e. the pk of an inode of another volume
+        in the same database sent with the prefix of this one. Only for the
+        drivers backed by the inode tables whose root is not the root of
+        the whole tree, the other drivers check their paths when decoding.
+        """
+        from elfinder.models import INode
+        model = getattr(self.driver, 'inode_model', None)
+        if model is None or not (self.strict or
+                                  self.root != str(INode.ROOT['PK'])):
+            return
+        pks = set(data[name] for name in HASH_PARAMS if data.get(name))
+        pks.update(data.get('targets') or [])
+        if not pks:
+            return
+        try:
+            pks = set(int(pk) for pk in pks)
+        except ValueError:
+            # not found by the driver
+            return
+        paths = dict(model.objects.filter(pk__in=pks | set([
+            int(self.root)])).values_list('pk', 'tree_path'))
+        root_path = paths.get(int(self.root), '')
+        for pk in pks:
+            if not paths.get(pk, root_path).startswith(root_path):
+                raise ValueError('%s does not belong to the volume %s' % (
+                    self.encode(pk), self.id))
+
+    def encode_info(self, info):
+        info = dict(info, hash=self.encode(info['hash']),
+                    phash=self.encode(info.get('phash')))
+        if info['hash'] == self.encode(self.root):
+            info['volumeid'] = self.prefix
+        return info
+
+    def _iter_active(self, items):
+        # streamed responses are read after the command returns, the
+        # volume is activated again for every item
+        items = iter(items)
+        while True:
+            with self:
+                item = items.next()
+            yield item
+
+    def _iter_infos(self, infos):
+        for info in self._iter_active(infos):
+            yield self.encode_info(info)
+
+    def root_info(self, user=None):
+        """
+        Informations of the root of the volume, listed by open with the
+        roots of the other volumes
+        """
+        with self:
+            return self.encode_info(self.driver.info(self.root, user))
+
+    def versions(self):
+        """
+        Versions of the root of the volume, see FinderDriver.versions. None
+        if the driver has no versions.
+        """
+        if not hasattr(self.driver, 'versions'):
+            return None
+        with self:
+            return self.driver.versions(self.root)
+
+    def encode_content(self, content):
+        """
+        Replaces the primary keys of the response of a command with hashes
+        """
+        if not isinstance(content, dict):
+            return content
+        content = dict(content)
+        if 'cwd' in content:
+            content['cwd'] = self.encode_info(content['cwd'])
+        for key in INFO_KEYS:
+            if key not in content:
+                continue
+            if hasattr(content[key], 'next'):
+                content[key] = self._iter_infos(content[key])
+            else:
+                content[key] = [self.encode_info(info)
+                                for info in content[key]]
+        if 'removed' in content:
+            content['removed'] = [self.encode(pk) for pk in content['removed']]
+        # other streamed values, i.e. the names of list
+        for key, value in content.items():
+            if key not in INFO_KEYS and hasattr(value, 'next'):
+                content[key] = self._iter_active(value)
+        return content
+
+
+class VolumeRouter(object):
+    """
+    Sends the queries on the models of elfinder to the database of the
+    active volume. Related models, i.e. the owners of the inodes, are read
+    from the default database, but must be replicated to the databases of
+    the volumes (see above).
+    """
+
+    def _db(self, model, **hints):
+        if model._meta.app_label == 'elfinder':
+            volume = get_active()
+            if volume is not None:
+                return volume.using
+            return None
+        instance = hints.get('instance')
+        if instance is not None and instance._meta.app_label == 'elfinder':
+            return DEFAULT_DB_ALIAS
+        return None
+
+    db_for_read = _db
+    db_for_write = _db
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if 'elfinder' in (obj1._meta.app_label, obj2._meta.app_label):
+            return True
+        return None